@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+"""
+Small 6502 assembler for the demo generator - labels, fixups and branch relaxation
+
+Instructions are recorded symbolically and only turned into bytes by
+assemble(), so code and data can move freely:
+
+    a = Assembler(0x0810)
+    a.label('loop')
+    a.lda(idx('table'))       # LDA table,X
+    a.sta(0xD020)             # STA $D020
+    a.inx()
+    a.bne('loop')             # branch offset computed, relaxed if out of range
+    a.label('table')
+    a.byte(0, 11, 9, 8)
+    prg = a.assemble()
+
+Operands are ints, label names or expressions built from them (ref('x') + 1,
+lo('x'), hi('x')).  A label operand always uses absolute addressing; an int
+below $100 uses zero page when the instruction has a zero page form.
+"""
+
+from emu6502 import OPCODE_TABLE, MODE_SIZE, BRANCH_OPS
+
+
+class AsmError(ValueError):
+    pass
+
+
+# (mnemonic, mode) -> opcode for the documented instruction set
+OPCODES = {}
+for _op, (_mnemonic, _mode, _cyc, _penalty, _unstable) in enumerate(OPCODE_TABLE):
+    if not _unstable and (_mnemonic, _mode) not in OPCODES:
+        OPCODES[(_mnemonic, _mode)] = _op
+OPCODES[('NOP', 'imp')] = 0xEA      # the documented NOP, not $1A
+MNEMONICS = {m for m, _ in OPCODES}
+
+# Branch to take when relaxing "Bxx far" into "B!xx +3 / JMP far"
+INVERSE_BRANCH = {'BPL': 'BMI', 'BMI': 'BPL', 'BVC': 'BVS', 'BVS': 'BVC',
+                  'BCC': 'BCS', 'BCS': 'BCC', 'BNE': 'BEQ', 'BEQ': 'BNE'}
+
+
+# --- operand expressions ---
+
+class Expr:
+    """A value that may depend on labels; resolved against the symbol table"""
+
+    def __init__(self, fn, text, names):
+        self.fn = fn
+        self.text = text
+        self.names = names      # labels the value depends on
+
+    def resolve(self, symbols):
+        return self.fn(symbols)
+
+    def __add__(self, n):
+        return Expr(lambda s: self.fn(s) + value(n, s), f'{self.text}+{n}',
+                    self.names | names_of(n))
+
+    def __sub__(self, n):
+        return Expr(lambda s: self.fn(s) - value(n, s), f'{self.text}-{n}',
+                    self.names | names_of(n))
+
+    def __floordiv__(self, n):
+        return Expr(lambda s: self.fn(s) // value(n, s), f'{self.text}/{n}',
+                    self.names | names_of(n))
+
+    def __repr__(self):
+        return self.text
+
+
+def ref(name):
+    """The address of a label"""
+    def resolve(symbols):
+        if name not in symbols:
+            raise AsmError(f'undefined label: {name}')
+        return symbols[name]
+    return Expr(resolve, name, frozenset([name]))
+
+
+def value(v, symbols):
+    """Resolve an operand (int, label name or Expr) to an int"""
+    if isinstance(v, int):
+        return v
+    if isinstance(v, str):
+        v = ref(v)
+    return v.resolve(symbols)
+
+
+def names_of(v):
+    """Labels an operand refers to"""
+    if isinstance(v, int) or v is None:
+        return frozenset()
+    if isinstance(v, str):
+        return frozenset([v])
+    return v.names
+
+
+def lo(v):
+    if isinstance(v, int):
+        return v & 0xFF
+    return Expr(lambda s: value(v, s) & 0xFF, f'<{v}', names_of(v))
+
+
+def hi(v):
+    if isinstance(v, int):
+        return (v >> 8) & 0xFF
+    return Expr(lambda s: (value(v, s) >> 8) & 0xFF, f'>{v}', names_of(v))
+
+
+# --- addressing mode markers ---
+
+def imm(v):
+    """#v"""
+    return ('imm', v)
+
+def idx(v):
+    """v,X"""
+    return ('x', v)
+
+def idy(v):
+    """v,Y"""
+    return ('y', v)
+
+def ind(v):
+    """(v)"""
+    return ('ind', v)
+
+def ind_x(v):
+    """(v,X)"""
+    return ('izx', v)
+
+def ind_y(v):
+    """(v),Y"""
+    return ('izy', v)
+
+
+def _select_mode(mnemonic, operand):
+    """Pick the addressing mode for an operand, preferring zero page for small ints"""
+    if operand is None:
+        for mode in ('imp', 'acc'):
+            if (mnemonic, mode) in OPCODES:
+                return mode, None
+        raise AsmError(f'{mnemonic} needs an operand')
+    if mnemonic in BRANCH_OPS:
+        return 'rel', operand
+    kind, v = operand if isinstance(operand, tuple) else ('abs', operand)
+    if kind in ('imm', 'ind', 'izx', 'izy'):
+        candidates = [kind]
+    else:
+        zp, ab = {'abs': ('zp', 'abs'), 'x': ('zpx', 'abx'), 'y': ('zpy', 'aby')}[kind]
+        candidates = [zp, ab] if isinstance(v, int) and 0 <= v < 0x100 else [ab]
+    for mode in candidates:
+        if (mnemonic, mode) in OPCODES:
+            return mode, v
+    raise AsmError(f'{mnemonic} has no {kind} addressing mode')
+
+
+class Assembler:
+    """Collects instructions, data and labels; assemble() lays them out"""
+
+    def __init__(self, base, relax=True):
+        self.base = base
+        self.relax = relax
+        self.items = []     # ['ins', mnemonic, mode, operand, long] / ['data', values, width]
+                            # / ['label', name] / ['align', n, fill]
+        self.symbols = {}
+        self.addrs = []     # address of every item, after assemble()
+        self.long_branches = 0
+
+    def __getattr__(self, name):
+        # a.lda(...), a.and_(...) - trailing underscore for Python keywords
+        mnemonic = name.rstrip('_').upper()
+        if mnemonic not in MNEMONICS:
+            raise AttributeError(name)
+        return lambda operand=None: self.ins(mnemonic, operand)
+
+    def ins(self, mnemonic, operand=None):
+        mode, v = _select_mode(mnemonic, operand)
+        self.items.append(['ins', mnemonic, mode, v, False])
+
+    def label(self, name):
+        self.items.append(['label', name])
+
+    def byte(self, *values):
+        self.items.append(['data', list(values), 1])
+
+    def data(self, values):
+        self.items.append(['data', list(values), 1])
+
+    def word(self, *values):
+        self.items.append(['data', list(values), 2])
+
+    def align(self, n, fill=0):
+        self.items.append(['align', n, fill])
+
+    # --- layout ---
+
+    def _size(self, item, pc):
+        kind = item[0]
+        if kind == 'ins':
+            if item[4]:
+                return 5          # inverted branch + JMP
+            return MODE_SIZE[item[2]]
+        if kind == 'data':
+            return len(item[1]) * item[2]
+        if kind == 'align':
+            return -pc % item[1]
+        return 0
+
+    def _layout(self):
+        """Assign addresses, growing out-of-range branches until stable"""
+        while True:
+            symbols = {}
+            pc = self.base
+            addrs = []
+            for item in self.items:
+                addrs.append(pc)
+                if item[0] == 'label':
+                    if item[1] in symbols:
+                        raise AsmError(f'duplicate label: {item[1]}')
+                    symbols[item[1]] = pc
+                pc += self._size(item, pc)
+            grown = False
+            for item, addr in zip(self.items, addrs):
+                if item[0] == 'ins' and item[2] == 'rel' and not item[4]:
+                    offset = value(item[3], symbols) - (addr + 2)
+                    if not -128 <= offset <= 127:
+                        if not self.relax:
+                            raise AsmError(f'branch out of range ({offset}) at ${addr:04X}: '
+                                           f'{item[1]} {item[3]}')
+                        item[4] = True
+                        grown = True
+            if not grown:
+                return symbols, addrs
+
+    def assemble(self):
+        """Resolve every label and return the machine code as a bytearray"""
+        symbols, addrs = self._layout()
+        self.symbols = symbols
+        self.addrs = addrs
+        self.long_branches = sum(1 for item in self.items if item[0] == 'ins' and item[4])
+        out = bytearray()
+        for item, addr in zip(self.items, addrs):
+            kind = item[0]
+            if kind == 'ins':
+                out += self._encode(item, addr, symbols)
+            elif kind == 'data':
+                out += self._encode_data(item, addr, symbols)
+            elif kind == 'align':
+                out += bytes([item[2]]) * self._size(item, addr)
+        return out
+
+    def relocate(self, code, moved, end=None):
+        """Patch assembled code for labels that moved: {name: new address}
+
+        Only items[:end] are patched; the labels must not be branch targets
+        there.  Returns a patched copy of code[:offset of items[end]].
+        """
+        symbols = dict(self.symbols, **moved)
+        changed = {name for name, addr in moved.items() if self.symbols.get(name) != addr}
+        stop = len(code) if end is None or end >= len(self.items) else self.addrs[end] - self.base
+        out = bytearray(code[:stop])
+        for item, addr in zip(self.items[:end], self.addrs):
+            if item[0] == 'ins' and names_of(item[3]) & changed:
+                if item[2] == 'rel':
+                    raise AsmError(f'cannot relocate branch target {item[3]} at ${addr:04X}')
+                encoded = self._encode(item, addr, symbols)
+            elif item[0] == 'data' and any(names_of(v) & changed for v in item[1]):
+                encoded = self._encode_data(item, addr, symbols)
+            else:
+                continue
+            out[addr - self.base:addr - self.base + len(encoded)] = encoded
+        return out
+
+    def _encode_data(self, item, addr, symbols):
+        out = bytearray()
+        for v in item[1]:
+            n = value(v, symbols)
+            if item[2] == 1:
+                if not -128 <= n <= 0xFF:
+                    raise AsmError(f'byte out of range at ${addr:04X}: {v} = {n}')
+                out.append(n & 0xFF)
+            else:
+                out += bytes([n & 0xFF, (n >> 8) & 0xFF])
+        return out
+
+    def _encode(self, item, addr, symbols):
+        _, mnemonic, mode, operand, long = item
+        if mode == 'rel':
+            target = value(operand, symbols)
+            if long:
+                return bytes([OPCODES[(INVERSE_BRANCH[mnemonic], 'rel')], 3,
+                              OPCODES[('JMP', 'abs')], target & 0xFF, target >> 8])
+            return bytes([OPCODES[(mnemonic, 'rel')], (target - (addr + 2)) & 0xFF])
+        opcode = OPCODES[(mnemonic, mode)]
+        size = MODE_SIZE[mode]
+        if size == 1:
+            return bytes([opcode])
+        n = value(operand, symbols)
+        if size == 2:
+            if not -128 <= n <= 0xFF:
+                raise AsmError(f'operand out of range at ${addr:04X}: {mnemonic} {operand} = {n}')
+            return bytes([opcode, n & 0xFF])
+        if not 0 <= n <= 0xFFFF:
+            raise AsmError(f'address out of range at ${addr:04X}: {mnemonic} {operand} = {n}')
+        return bytes([opcode, n & 0xFF, n >> 8])
+
+    def referenced_labels(self):
+        """Labels used by any operand - the only places control can arrive from afar"""
+        names = set()
+        for item in self.items:
+            if item[0] == 'ins':
+                names |= names_of(item[3])
+            elif item[0] == 'data':
+                for v in item[1]:
+                    names |= names_of(v)
+        return names
+
+    def cost(self, start=0, end=None, penalties=False):
+        """(bytes, cycles) of the instructions in items[start:end], every one executed once
+
+        Branches count as not taken, so straight-line code that skips with a
+        branch is costed for its longest path.  Page-crossing penalties are
+        added only when asked for; relaxed branches are ignored.
+        """
+        size = cycles = 0
+        for item in self.items[start:end]:
+            if item[0] == 'ins':
+                _, _, cyc, penalty, _ = OPCODE_TABLE[OPCODES[(item[1], item[2])]]
+                size += MODE_SIZE[item[2]]
+                cycles += cyc + (penalty and penalties)
+        return size, cycles
+
+    def addr(self, name):
+        """Address of a label after assemble()"""
+        return self.symbols[name]
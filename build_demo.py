@@ -1,8 +1,29 @@
 #!/usr/bin/env python3
 """
 C64 Cracktro Demo with bouncing sprite
+
+As a script: writes demo.prg and demo_packed.prg.  Run with --profile [frames]
+to time each main loop section headlessly, --no-opt to skip the peephole
+optimizer, --sprite FILE to use other sprite frames (see png2sprite.py).
+
+As a module, nothing is built or written on import:
+
+    import build_demo
+    prg = build_demo.build()                                    # the default demo
+    prg = build_demo.build(build_demo.Config(scroll_text="HELLO   "))
 """
 
+import sys
+from collections import namedtuple
+
+from asm6502 import Assembler, imm, idx, idy, ind_y, lo, hi, ref
+from raster_irq import RasterChain
+from music import Instrument, Song, compile_song, emit_player, emit_song_data
+from sid_shadow import emit_flush, emit_shadow
+from starfield import StarLayer, place_stars, emit_starfield, emit_star_tables
+from sprites import (SPRITE_BASE, emit_sprite_frames, emit_sprite_copy, emit_animation,
+                     emit_animation_state, dedup_frames, check_program_end)
+
 def text_to_petscii(text):
     result = []
     for c in text:
@@ -19,60 +40,39 @@ def text_to_petscii(text):
         else: result.append(32)
     return result
 
-# Extended note table for Last Ninja style music
-SID_NOTES = {
-    # Octave 2 (bass)
-    'C2': (0x08, 0x93), 'D2': (0x09, 0x91), 'E2': (0x0A, 0xAD), 'F2': (0x0B, 0x48),
-    'G2': (0x0C, 0x9B), 'A2': (0x0E, 0x15), 'B2': (0x0F, 0xB4),
-    # Octave 3
-    'C3': (0x11, 0x25), 'D3': (0x13, 0x21), 'E3': (0x15, 0x5A), 'F3': (0x16, 0x8F),
-    'G3': (0x19, 0x35), 'A3': (0x1C, 0x2B), 'B3': (0x1F, 0x67),
-    # Octave 4
-    'C4': (0x22, 0x49), 'D4': (0x26, 0x42), 'E4': (0x2A, 0xB4), 'F4': (0x2D, 0x1E),
-    'G4': (0x32, 0x6A), 'A4': (0x38, 0x56), 'B4': (0x3E, 0xCE),
-    # Octave 5
-    'C5': (0x44, 0x92), 'D5': (0x4C, 0x84), 'E5': (0x55, 0x68), 'F5': (0x5A, 0x3C),
-    'G5': (0x64, 0xD4), 'A5': (0x70, 0xAC),
-    'REST': (0x00, 0x00)
-}
-
-# Classic cracktro style - energetic arpeggio-based music
-# Using C minor scale for dramatic sound (C, D, Eb, F, G, Ab, Bb)
-MELODY = [
-    # Part A - Arpeggio lead, classic cracktro feel
-    'C4','E4','G4','C5','G4','E4','C4','E4',
-    'G4','C5','E5','C5','G4','E4','C4','REST',
-    'A3','C4','E4','A4','E4','C4','A3','C4',
-    'E4','A4','C5','A4','E4','C4','A3','REST',
-    # Part B - Rising arpeggios
-    'F3','A3','C4','F4','C4','A3','F3','A3',
-    'C4','F4','A4','F4','C4','A3','F3','REST',
-    'G3','B3','D4','G4','D4','B3','G3','B3',
-    'D4','G4','B4','G4','D4','B3','G3','REST',
-]
-
-# Bass - punchy, driving bass line
-BASS = [
-    # Classic C64 bass pattern
-    'C2','C2','C3','C2','C2','C3','C2','C3',
-    'C2','C2','C3','C2','C2','C3','C2','REST',
-    'A2','A2','A3','A2','A2','A3','A2','A3',
-    'A2','A2','A3','A2','A2','A3','A2','REST',
-    # Second half
-    'F2','F2','F3','F2','F2','F3','F2','F3',
-    'F2','F2','F3','F2','F2','F3','F2','REST',
-    'G2','G2','G3','G2','G2','G3','G2','G3',
-    'G2','G2','G3','G2','G2','G3','G2','REST',
-]
-
-# Drums - energetic cracktro beat
-# 1=kick, 2=snare, 3=hihat, 0=rest
-DRUMS = [
-    1,0,3,0,2,0,3,0,1,0,3,0,2,0,3,3,  # Basic beat
-    1,0,3,0,2,0,3,0,1,1,3,0,2,0,3,0,  # Variation
-    1,0,3,0,2,0,3,0,1,0,3,0,2,2,3,0,  # Double snare
-    1,0,3,3,2,0,3,0,1,1,3,0,2,0,2,0,  # Fill
-]
+# Classic cracktro style - energetic arpeggio-based music, as tracker patterns.
+# Every pattern is one 16-step bar; chords are the same arpeggio transposed.
+KICK, SNARE, HAT = 'D2', 'F#5', 'D7'  # noise pitches
+SONG = Song(
+    speed=4,  # frames per step - fast tempo for arpeggios
+    instruments={
+        'lead': Instrument(0x40, 0x09, 0x00, 0x800),   # pulse 50%, A=0 D=9 (snappy)
+        'bass': Instrument(0x20, 0x09, 0x00, 0x400),   # sawtooth, A=0 D=9 (punchy)
+        'drums': Instrument(0x80, 0x00, 0x90, 0x000),  # noise, S=9 R=0 (quick decay)
+    },
+    patterns={
+        'arp_major': ('lead', ['C5', 'E5', 'G5', 'C6', 'G5', 'E5', 'C5', 'E5',
+                               'G5', 'C6', 'E6', 'C6', 'G5', 'E5', 'C5', 'REST']),
+        'arp_minor': ('lead', ['C5', 'Eb5', 'G5', 'C6', 'G5', 'Eb5', 'C5', 'Eb5',
+                               'G5', 'C6', 'Eb6', 'C6', 'G5', 'Eb5', 'C5', 'REST']),
+        'bass': ('bass', ['C3', 'C3', 'C4', 'C3', 'C3', 'C4', 'C3', 'C4',
+                          'C3', 'C3', 'C4', 'C3', 'C3', 'C4', 'C3', 'REST']),
+        'beat': ('drums', [KICK, 'REST', HAT, 'REST', SNARE, 'REST', HAT, 'REST',
+                           KICK, 'REST', HAT, 'REST', SNARE, 'REST', HAT, HAT]),
+        'beat_var': ('drums', [KICK, 'REST', HAT, 'REST', SNARE, 'REST', HAT, 'REST',
+                               KICK, KICK, HAT, 'REST', SNARE, 'REST', HAT, 'REST']),
+        'double_snare': ('drums', [KICK, 'REST', HAT, 'REST', SNARE, 'REST', HAT, 'REST',
+                                   KICK, 'REST', HAT, 'REST', SNARE, SNARE, HAT, 'REST']),
+        'fill': ('drums', [KICK, 'REST', HAT, HAT, SNARE, 'REST', HAT, 'REST',
+                           KICK, KICK, HAT, 'REST', SNARE, 'REST', SNARE, 'REST']),
+    },
+    orders=[
+        # C - Am - F - G
+        [('arp_major', 0), ('arp_minor', -3), ('arp_major', -7), ('arp_major', -5)],
+        [('bass', 0), ('bass', 9), ('bass', 5), ('bass', 7)],
+        [('beat', 0), ('beat_var', 0), ('double_snare', 0), ('fill', 0)],
+    ],
+)
 
 # Sprite data - Pulumi logo: 9 ovals in isometric cube arrangement
 # The Pulumi logo is 3 rows of 3 ovals forming a cube face pattern:
@@ -107,609 +107,532 @@ SPRITE_DATA = [
     0b00000001, 0b11100111, 0b00000000,  # Row 20
     0b00000000, 0b00000000, 0b00000000,  # Row 21
 ]
+# Animation frames for sprite 0, one step every SPRITE_ANIM_EVERY frames
+SPRITE_ANIM_EVERY = 4
 
 SCREEN = 0x0400
 COLORRAM = 0xD800
+SCROLL_BAND = SCREEN + 19 * 40  # sine scroller rows 19-23
 
-title = "*** IAC MASTERMIND CREW ***"
-cracked = "PRESENTS"
-crew = "ENGIN DIRI"
-scroll = "    ENGIN DIRI X:_EDIRI GITHUB:DIRIEN ... INFRASTRUCTURE AS CODE CREW RULES THE WORLD!   GREETS TO ALL CLOUD ENGINEERS - PULUMI CREW - DEVOPS LEGENDS       "
-
-prg = bytearray()
-def lo(a): return a & 0xFF
-def hi(a): return (a >> 8) & 0xFF
-
-# Load address
-prg.extend([0x01, 0x08])
-# BASIC: 10 SYS 2064
-prg.extend([0x0C, 0x08, 0x0A, 0x00, 0x9E, 0x32, 0x30, 0x36, 0x34, 0x00, 0x00, 0x00])
-while len(prg) < 17: prg.append(0)
-
-code = []
-BASE = 0x0810
+# Static screen text: (row, column, colour, string) - column None centres the string
+TEXT_LAYOUT = [
+    (3, None, 0x01, "*** IAC MASTERMIND CREW ***"),
+    (7, None, 0x07, "PRESENTS"),
+    (10, None, 0x02, "ENGIN DIRI"),
+]
 
-# Zero page usage:
-# $FB-$FC: scroll text pointer
-# $FD: scroll counter
-# $FE: music index
-# $FF: frame counter
-# $02: sprite X lo
-# $03: sprite Y
-# $04: sprite X direction (0=right, 1=left)
-# $05: sprite Y direction (0=down, 1=up)
-
-# SEI
-code.append(0x78)
-
-# Clear screen
-code.extend([0xA2, 0x00])
-clear_start = len(code)
-code.extend([0xA9, 0x20, 0x9D, 0x00, 0x04, 0x9D, 0x00, 0x05, 0x9D, 0x00, 0x06, 0x9D, 0xE8, 0x06])
-code.extend([0xA9, 0x00, 0x9D, 0x00, 0xD8, 0x9D, 0x00, 0xD9, 0x9D, 0x00, 0xDA, 0x9D, 0xE8, 0xDA])
-code.append(0xE8)
-branch_from = len(code) + 2
-offset = (clear_start - branch_from) & 0xFF
-code.extend([0xD0, offset])
-
-# Black border/bg
-code.extend([0xA9, 0x00, 0x8D, 0x20, 0xD0, 0x8D, 0x21, 0xD0])
-
-# Print text
-tpet = text_to_petscii(title)
-toff = 120 + (40 - len(tpet)) // 2
-for i, ch in enumerate(tpet):
-    code.extend([0xA9, ch, 0x8D, lo(SCREEN+toff+i), hi(SCREEN+toff+i)])
-    code.extend([0xA9, 0x01, 0x8D, lo(COLORRAM+toff+i), hi(COLORRAM+toff+i)])
-
-cpet = text_to_petscii(cracked)
-coff = 280 + (40 - len(cpet)) // 2
-for i, ch in enumerate(cpet):
-    code.extend([0xA9, ch, 0x8D, lo(SCREEN+coff+i), hi(SCREEN+coff+i)])
-    code.extend([0xA9, 0x07, 0x8D, lo(COLORRAM+coff+i), hi(COLORRAM+coff+i)])
-
-wpet = text_to_petscii(crew)
-woff = 400 + (40 - len(wpet)) // 2
-for i, ch in enumerate(wpet):
-    code.extend([0xA9, ch, 0x8D, lo(SCREEN+woff+i), hi(SCREEN+woff+i)])
-    code.extend([0xA9, 0x02, 0x8D, lo(COLORRAM+woff+i), hi(COLORRAM+woff+i)])
-
-# Init SID
-for i in range(25):
-    code.extend([0xA9, 0x00, 0x8D, lo(0xD400+i), hi(0xD400+i)])
-# SID master volume with low-pass filter
-code.extend([0xA9, 0x1F, 0x8D, 0x18, 0xD4])  # Volume 15 + lowpass filter on
-# Filter cutoff - medium high for bright sound
-code.extend([0xA9, 0x00, 0x8D, 0x15, 0xD4])  # Filter cutoff lo
-code.extend([0xA9, 0x40, 0x8D, 0x16, 0xD4])  # Filter cutoff hi (medium)
-# Filter resonance and routing - filter voice 1 and 2
-code.extend([0xA9, 0x73, 0x8D, 0x17, 0xD4])  # Resonance=7, filter voices 1+2
-# Voice 1 (lead): ADSR - fast arpeggio attack for classic cracktro
-code.extend([0xA9, 0x09, 0x8D, 0x05, 0xD4])  # Attack/Decay: A=0, D=9 (snappy)
-code.extend([0xA9, 0x00, 0x8D, 0x06, 0xD4])  # Sustain/Release: S=0, R=0 (percussive)
-# Voice 1 pulse width (for rich PWM sound)
-code.extend([0xA9, 0x00, 0x8D, 0x02, 0xD4])  # PW lo
-code.extend([0xA9, 0x08, 0x8D, 0x03, 0xD4])  # PW hi (50% duty)
-# Voice 2 (bass): ADSR - punchy bass
-code.extend([0xA9, 0x09, 0x8D, 0x0C, 0xD4])  # Attack/Decay: A=0, D=9
-code.extend([0xA9, 0x00, 0x8D, 0x0D, 0xD4])  # Sustain/Release: S=0, R=0 (punchy)
-# Voice 2 pulse width - saw wave for bass
-code.extend([0xA9, 0x00, 0x8D, 0x09, 0xD4])  # PW lo
-code.extend([0xA9, 0x04, 0x8D, 0x0A, 0xD4])  # PW hi (25% duty)
-# Voice 3 (drums): ADSR - percussive
-code.extend([0xA9, 0x00, 0x8D, 0x13, 0xD4])  # Attack/Decay: A=0, D=0
-code.extend([0xA9, 0x90, 0x8D, 0x14, 0xD4])  # Sustain/Release: S=9, R=0 (quick decay)
-
-# === INIT SPRITE ===
-# Set sprite pointer (sprite 0 data at $0340 = block 13)
-sprite_block_idx = len(code) + 1
-code.extend([0xA9, 0x00, 0x8D, 0xF8, 0x07])  # Sprite 0 pointer at $07F8
-
-# Enable sprite 0
-code.extend([0xA9, 0x01, 0x8D, 0x15, 0xD0])  # $D015 = sprite enable
-
-# Sprite color = white
-code.extend([0xA9, 0x01, 0x8D, 0x27, 0xD0])  # $D027 = sprite 0 color
-
-# Expand sprite (double size)
-code.extend([0xA9, 0x01, 0x8D, 0x1D, 0xD0])  # $D01D = X expand
-code.extend([0xA9, 0x01, 0x8D, 0x17, 0xD0])  # $D017 = Y expand
-
-# Init sprite position
-code.extend([0xA9, 0x64, 0x85, 0x02])  # X lo = 100
-code.extend([0xA9, 0xA0, 0x85, 0x03])  # Y = 160
-code.extend([0xA9, 0x00, 0x85, 0x04])  # X dir = right
-code.extend([0xA9, 0x00, 0x85, 0x05])  # Y dir = down
-code.extend([0xA9, 0x01, 0x85, 0x06])  # Sprite color = 1 (white)
-code.extend([0xA9, 0x00, 0x8D, 0x10, 0xD0])  # X MSB = 0
-
-# Init zero page vars
-scroll_lo_idx = len(code) + 1
-code.extend([0xA9, 0x00, 0x85, 0xFB])
-scroll_hi_idx = len(code) + 1
-code.extend([0xA9, 0x00, 0x85, 0xFC])
-code.extend([0xA9, 0x00, 0x85, 0xFD, 0xA9, 0x00, 0x85, 0xFE, 0xA9, 0x00, 0x85, 0xFF])
-# Init raster offset ($F9) for animated raster bars
-code.extend([0xA9, 0x00, 0x85, 0xF9])
-# Init sine phase ($F8) for sine wave scroller
-code.extend([0xA9, 0x00, 0x85, 0xF8])
-
-# CLI
-code.append(0x58)
-
-# === MAIN LOOP ===
-main_loop_pos = len(code)
-
-# Wait for raster 50 (top of screen)
-wait_pos = len(code)
-code.extend([0xAD, 0x12, 0xD0, 0xC9, 0x32])  # CMP #50
-offset = (wait_pos - (len(code) + 2)) & 0xFF
-code.extend([0xD0, offset])
-
-# Rainbow raster bars - use raster_offset ($F9) to animate
-code.extend([0xE6, 0xF9])  # INC raster_offset (for animation)
-code.extend([0xA2, 0x00])  # LDX #0 (raster bar counter)
-
-raster_loop_pos = len(code)
-# Wait for next raster line
-raster_wait_pos = len(code)
-code.extend([0xEC, 0x12, 0xD0])  # CPX $D012
-offset = (raster_wait_pos - (len(code) + 2)) & 0xFF
-code.extend([0xD0, offset])  # BNE wait
-
-# Calculate color: (X + raster_offset) AND 15, lookup in color table
-code.extend([0x8A])  # TXA
-code.extend([0x18, 0x65, 0xF9])  # CLC, ADC $F9 (add raster_offset)
-code.extend([0x29, 0x0F])  # AND #15
-code.extend([0xA8])  # TAY
-raster_color_idx = len(code) + 1
-code.extend([0xB9, 0x00, 0x00])  # LDA color_table,Y
-code.extend([0x8D, 0x20, 0xD0])  # STA $D020 (border)
-
-code.extend([0xE8])  # INX
-code.extend([0xE0, 0xC8])  # CPX #200 (200 lines of raster bars)
-offset = (raster_loop_pos - (len(code) + 2)) & 0xFF
-code.extend([0xD0, offset])  # BNE raster_loop
-
-code.extend([0xA9, 0x00, 0x8D, 0x20, 0xD0])  # Reset border to black
-
-# === STARFIELD ===
-# Update 16 stars at fixed Y positions, moving left at different speeds
-# Stars are stored in star_x array, updated each frame
-# Layer 1 (fast, 8 stars): decrement X by 2
-# Layer 2 (slow, 8 stars): decrement X by 1
-# Star character: $2E (period) or $51 (filled circle)
-
-# Update fast stars (layer 1)
-code.extend([0xA2, 0x00])  # LDX #0
-star_loop1_pos = len(code)
-# Erase old star: read position, write space
-star_x_fast_idx = len(code) + 1
-code.extend([0xBD, 0x00, 0x00])  # LDA star_x_fast,X
-code.extend([0xA8])  # TAY
-star_y_fast_idx = len(code) + 1
-code.extend([0xBD, 0x00, 0x00])  # LDA star_y_fast,X (row offset lo)
-code.extend([0x85, 0xF3])  # STA $F3
-star_yhi_fast_idx = len(code) + 1
-code.extend([0xBD, 0x00, 0x00])  # LDA star_yhi_fast,X (row offset hi)
-code.extend([0x85, 0xF4])  # STA $F4 (hi byte must be at $F3+1 for indirect!)
-code.extend([0xA9, 0x20])  # LDA #32 (space)
-code.extend([0x91, 0xF3])  # STA ($F3),Y
-
-# Move star left by 2
-code.extend([0x98])  # TYA
-code.extend([0x38])  # SEC
-code.extend([0xE9, 0x02])  # SBC #2
-code.extend([0x10, 0x02])  # BPL no_wrap
-code.extend([0xA9, 0x27])  # LDA #39 (wrap to right)
-# no_wrap:
-star_x_store_fast = len(code) + 1
-code.extend([0x9D, 0x00, 0x00])  # STA star_x_fast,X
-
-# Draw new star
-code.extend([0xA8])  # TAY (new X position)
-code.extend([0xA9, 0x51])  # LDA #$51 (filled circle char)
-code.extend([0x91, 0xF3])  # STA ($F3),Y
-# Color: white
-code.extend([0xA5, 0xF4])  # LDA hi (from $F4 now)
-code.extend([0x18])  # CLC
-code.extend([0x69, 0xD4])  # ADC #$D4
-code.extend([0x85, 0xF4])  # STA hi (now points to color RAM)
-code.extend([0xA9, 0x01])  # LDA #1 (white)
-code.extend([0x91, 0xF3])  # STA ($F3),Y
-
-code.extend([0xE8])  # INX
-code.extend([0xE0, 0x08])  # CPX #8
-offset = (star_loop1_pos - (len(code) + 2)) & 0xFF
-code.extend([0xD0, offset])
-
-# Update slow stars (layer 2)
-code.extend([0xA2, 0x00])  # LDX #0
-star_loop2_pos = len(code)
-# Erase old star
-star_x_slow_idx = len(code) + 1
-code.extend([0xBD, 0x00, 0x00])  # LDA star_x_slow,X
-code.extend([0xA8])  # TAY
-star_y_slow_idx = len(code) + 1
-code.extend([0xBD, 0x00, 0x00])  # LDA star_y_slow,X
-code.extend([0x85, 0xF3])  # STA $F3
-star_yhi_slow_idx = len(code) + 1
-code.extend([0xBD, 0x00, 0x00])  # LDA star_yhi_slow,X
-code.extend([0x85, 0xF4])  # STA $F4 (hi byte must be at $F3+1 for indirect!)
-code.extend([0xA9, 0x20])  # LDA #32 (space)
-code.extend([0x91, 0xF3])  # STA ($F3),Y
-
-# Move star left by 1
-code.extend([0x98])  # TYA
-code.extend([0x38])  # SEC
-code.extend([0xE9, 0x01])  # SBC #1
-code.extend([0x10, 0x02])  # BPL no_wrap2
-code.extend([0xA9, 0x27])  # LDA #39 (wrap)
-# no_wrap2:
-star_x_store_slow = len(code) + 1
-code.extend([0x9D, 0x00, 0x00])  # STA star_x_slow,X
-
-# Draw new star (dimmer, gray)
-code.extend([0xA8])  # TAY
-code.extend([0xA9, 0x2E])  # LDA #$2E (period for distant star)
-code.extend([0x91, 0xF3])  # STA ($F3),Y
-code.extend([0xA5, 0xF4])  # LDA hi (from $F4 now)
-code.extend([0x18])  # CLC
-code.extend([0x69, 0xD4])  # ADC #$D4
-code.extend([0x85, 0xF4])  # STA hi (now points to color RAM)
-code.extend([0xA9, 0x0C])  # LDA #12 (gray - dimmer)
-code.extend([0x91, 0xF3])  # STA ($F3),Y
-
-code.extend([0xE8])  # INX
-code.extend([0xE0, 0x08])  # CPX #8
-offset = (star_loop2_pos - (len(code) + 2)) & 0xFF
-code.extend([0xD0, offset])
-
-# === SPRITE MOVEMENT ===
-# Simpler approach: always update position, check bounds, change color on bounce
-
-# Move X
-code.extend([0xA5, 0x04])  # LDA X dir
-code.extend([0xD0, 0x04])  # BNE go_left
-code.extend([0xE6, 0x02])  # INC X (go right)
-code.extend([0xD0, 0x02])  # BNE done_x (always)
-code.extend([0xC6, 0x02])  # DEC X (go left)
-# done_x: check bounds
-
-# Check X bounds
-code.extend([0xA5, 0x02])  # LDA X
-code.extend([0xC9, 0x18])  # CMP #24 (left edge)
-code.extend([0xB0, 0x06])  # BCS not_left
-code.extend([0xA9, 0x00, 0x85, 0x04])  # dir = right
-code.extend([0xE6, 0x06])  # INC color
-# not_left:
-code.extend([0xC9, 0xE0])  # CMP #224 (right edge)
-code.extend([0x90, 0x06])  # BCC not_right
-code.extend([0xA9, 0x01, 0x85, 0x04])  # dir = left
-code.extend([0xE6, 0x06])  # INC color
-# not_right:
-
-# Move Y
-code.extend([0xA5, 0x05])  # LDA Y dir
-code.extend([0xD0, 0x04])  # BNE go_up
-code.extend([0xE6, 0x03])  # INC Y (go down)
-code.extend([0xD0, 0x02])  # BNE done_y
-code.extend([0xC6, 0x03])  # DEC Y (go up)
-# done_y: check bounds
-
-# Check Y bounds
-code.extend([0xA5, 0x03])  # LDA Y
-code.extend([0xC9, 0x32])  # CMP #50 (top edge)
-code.extend([0xB0, 0x06])  # BCS not_top
-code.extend([0xA9, 0x00, 0x85, 0x05])  # dir = down
-code.extend([0xE6, 0x06])  # INC color
-# not_top:
-code.extend([0xC9, 0xE0])  # CMP #224 (bottom edge)
-code.extend([0x90, 0x06])  # BCC not_bottom
-code.extend([0xA9, 0x01, 0x85, 0x05])  # dir = up
-code.extend([0xE6, 0x06])  # INC color
-# not_bottom:
-
-# Wrap color to 1-15 (skip 0/black)
-code.extend([0xA5, 0x06])  # LDA color
-code.extend([0x29, 0x0F])  # AND #15
-code.extend([0xD0, 0x02])  # BNE not_zero
-code.extend([0xA9, 0x01])  # LDA #1
-code.extend([0x85, 0x06])  # STA color
-
-# Store sprite position and color to VIC
-code.extend([0xA5, 0x02, 0x8D, 0x00, 0xD0])  # Sprite 0 X
-code.extend([0xA5, 0x03, 0x8D, 0x01, 0xD0])  # Sprite 0 Y
-code.extend([0xA5, 0x06, 0x8D, 0x27, 0xD0])  # Sprite 0 color
-
-# === MUSIC ===
-code.extend([0xE6, 0xFF, 0xA5, 0xFF, 0x29, 0x03])  # Fast tempo (every 4 frames) for arpeggios
-music_bne_idx = len(code) + 1
-code.extend([0xD0, 0x00])
-
-music_start = len(code)
-code.extend([0xA6, 0xFE])
-
-# V1 - Pulse wave (0x40/0x41) for classic cracktro arpeggio sound
-code.extend([0xA9, 0x40, 0x8D, 0x04, 0xD4])  # Gate off, pulse
-mel_lo_idx = len(code) + 1
-code.extend([0xBD, 0x00, 0x00, 0x8D, 0x00, 0xD4])
-mel_hi_idx = len(code) + 1
-code.extend([0xBD, 0x00, 0x00, 0x8D, 0x01, 0xD4])
-code.extend([0xA9, 0x41, 0x8D, 0x04, 0xD4])  # Gate on, pulse
-
-# V2
-code.extend([0xA9, 0x20, 0x8D, 0x0B, 0xD4])
-bass_lo_idx = len(code) + 1
-code.extend([0xBD, 0x00, 0x00, 0x8D, 0x07, 0xD4])
-bass_hi_idx = len(code) + 1
-code.extend([0xBD, 0x00, 0x00, 0x8D, 0x08, 0xD4])
-code.extend([0xA9, 0x21, 0x8D, 0x0B, 0xD4])
-
-# V3 drums
-code.extend([0xA9, 0x80, 0x8D, 0x12, 0xD4])
-drum_lo_idx = len(code) + 1
-code.extend([0xBD, 0x00, 0x00, 0x8D, 0x0E, 0xD4])
-drum_hi_idx = len(code) + 1
-code.extend([0xBD, 0x00, 0x00, 0x8D, 0x0F, 0xD4])
-code.extend([0xA9, 0x81, 0x8D, 0x12, 0xD4])
-
-# Inc music index
-code.extend([0xE6, 0xFE, 0xA5, 0xFE, 0xC9, len(MELODY), 0xD0, 0x04, 0xA9, 0x00, 0x85, 0xFE])
-
-music_end = len(code)
-code[music_bne_idx] = (music_end - music_bne_idx - 1) & 0xFF
-
-# === SINE WAVE SCROLL ===
-# Use $F8 for sine phase, increment each frame for animation
-code.extend([0xE6, 0xF8])  # INC sine_phase
-
-# Speed control - scroll every 4 frames
-code.extend([0xE6, 0xFD, 0xA5, 0xFD, 0x29, 0x03])
-scroll_bne_idx = len(code) + 1
-code.extend([0xD0, 0x00])
-
-# Clear scroll area (rows 19-23, 5 rows)
-code.extend([0xA2, 0x00])  # LDX #0
-clear_scroll_pos = len(code)
-code.extend([0xA9, 0x20])  # LDA #32 (space)
-# Clear row 19 ($0400 + 19*40 = $0400 + 760 = $06F8)
-code.extend([0x9D, 0xF8, 0x06])  # STA $06F8,X
-# Clear row 20
-code.extend([0x9D, 0x20, 0x07])  # STA $0720,X
-# Clear row 21
-code.extend([0x9D, 0x48, 0x07])  # STA $0748,X
-# Clear row 22
-code.extend([0x9D, 0x70, 0x07])  # STA $0770,X
-# Clear row 23
-code.extend([0x9D, 0x98, 0x07])  # STA $0798,X
-code.extend([0xE8])  # INX
-code.extend([0xE0, 0x28])  # CPX #40
-offset = (clear_scroll_pos - (len(code) + 2)) & 0xFF
-code.extend([0xD0, offset])  # BNE clear_loop
-
-# Check for end of scroll text and reset if needed
-code.extend([0xA0, 0x00])  # LDY #0
-code.extend([0xB1, 0xFB])  # LDA ($FB),Y - get first char
-code.extend([0xD0, 0x08])  # BNE not_end
-# Reset scroll if at end
-reset_lo_idx = len(code) + 1
-code.extend([0xA9, 0x00, 0x85, 0xFB])
-reset_hi_idx = len(code) + 1
-code.extend([0xA9, 0x00, 0x85, 0xFC])
-# not_end:
-
-# Draw 40 characters with sine wave Y positions
-code.extend([0xA2, 0x00])  # LDX #0 (character position 0-39)
-sine_draw_pos = len(code)
-
-# Save X to $F5
-code.extend([0x86, 0xF5])  # STX $F5
-
-# Get character at ($FB),X
-code.extend([0xA5, 0xF5])  # LDA $F5 (X position)
-code.extend([0xA8])  # TAY
-code.extend([0xB1, 0xFB])  # LDA ($FB),Y - get char at offset X
-code.extend([0x85, 0xF7])  # STA $F7 (save character)
-
-# Calculate Y position from sine table: sine_table[(X + sine_phase) & 31]
-code.extend([0xA5, 0xF5])  # LDA X position
-code.extend([0x18, 0x65, 0xF8])  # CLC, ADC sine_phase
-code.extend([0x29, 0x1F])  # AND #31
-code.extend([0xA8])  # TAY
-sine_table_idx = len(code) + 1
-code.extend([0xB9, 0x00, 0x00])  # LDA sine_table,Y (get row 0-4)
-code.extend([0xA8])  # TAY (Y = row number)
-
-# Get screen row base address from lookup table
-# Use $F0-$F1 for screen pointer (not $FA-$FB which conflicts with scroll text ptr)
-row_table_idx = len(code) + 1
-code.extend([0xB9, 0x00, 0x00])  # LDA row_lo_table,Y
-code.extend([0x85, 0xF0])  # STA screen_lo ($F0)
-row_table_hi_idx = len(code) + 1
-code.extend([0xB9, 0x00, 0x00])  # LDA row_hi_table,Y
-code.extend([0x85, 0xF1])  # STA screen_hi ($F1 - must be $F0+1 for indirect!)
-
-# Store character at screen + X
-code.extend([0xA4, 0xF5])  # LDY $F5 (X position)
-code.extend([0xA5, 0xF7])  # LDA character
-code.extend([0x91, 0xF0])  # STA ($F0),Y - write to screen
-
-# Set color: convert screen addr to color RAM addr ($04xx->$D8xx, $07xx->$DBxx)
-code.extend([0xA5, 0xF1])  # LDA screen_hi (from $F1)
-code.extend([0x18])  # CLC
-code.extend([0x69, 0xD4])  # ADC #$D4
-code.extend([0x85, 0xF1])  # STA color_hi (to $F1)
-code.extend([0xA9, 0x0E])  # LDA #14 (light blue)
-code.extend([0x91, 0xF0])  # STA ($F0),Y - write color
-
-# Next character
-code.extend([0xA6, 0xF5])  # LDX $F5
-code.extend([0xE8])  # INX
-code.extend([0xE0, 0x28])  # CPX #40
-offset = (sine_draw_pos - (len(code) + 2)) & 0xFF
-code.extend([0xD0, offset])  # BNE sine_draw_loop
-
-# Increment scroll position
-code.extend([0xE6, 0xFB, 0xD0, 0x02, 0xE6, 0xFC])
-
-# JMP main
-jmp_pos = len(code)
-main_addr = BASE + main_loop_pos
-code.extend([0x4C, lo(main_addr), hi(main_addr)])
-
-code[scroll_bne_idx] = (jmp_pos - scroll_bne_idx - 1) & 0xFF
-
-# === DATA ===
-
-# Sprite data must be at 64-byte aligned address
-# We'll put it at $0340 (block 13, which is 13*64 = 832 = $0340)
-# First, pad to align code so sprite is at $0340
-# $0340 is within $0000-$07FF which is the default VIC bank
-
-# For simplicity, store sprite data in our code segment and copy it to $0340 at init
-# Actually, let's put data at end and copy during init
-
-scroll_addr = BASE + len(code)
-code.extend(text_to_petscii(scroll))
-code.append(0)
-
-mel_lo_addr = BASE + len(code)
-for n in MELODY: code.append(SID_NOTES[n][1])
-mel_hi_addr = BASE + len(code)
-for n in MELODY: code.append(SID_NOTES[n][0])
-
-bass_lo_addr = BASE + len(code)
-for n in BASS: code.append(SID_NOTES[n][1])
-bass_hi_addr = BASE + len(code)
-for n in BASS: code.append(SID_NOTES[n][0])
-
-drum_freqs = {0:(0,0), 1:(0x05,0), 2:(0x30,0), 3:(0xA0,0)}
-drum_lo_addr = BASE + len(code)
-for d in DRUMS: code.append(drum_freqs[d][1])
-drum_hi_addr = BASE + len(code)
-for d in DRUMS: code.append(drum_freqs[d][0])
+# Starfield: far layers are dim and slow, near layers bright and fast.
+STAR_LAYERS = [
+    StarLayer('far', 24, 1, 4, 0x2E, 0x0B),    # period, dark grey, 1 column / 4 frames
+    StarLayer('mid', 20, 1, 2, 0x2E, 0x0C),    # period, grey, 1 column / 2 frames
+    StarLayer('near', 12, 1, 1, 0x51, 0x0F),   # filled circle, light grey
+    StarLayer('front', 8, 2, 1, 0x51, 0x01),   # filled circle, white, 2 columns / frame
+]
+STARFIELD_BUDGET = 3000  # cycles, worst case (every layer moving)
+SCROLL_TEXT = "    ENGIN DIRI X:_EDIRI GITHUB:DIRIEN ... INFRASTRUCTURE AS CODE CREW RULES THE WORLD!   GREETS TO ALL CLOUD ENGINEERS - PULUMI CREW - DEVOPS LEGENDS       "
 
 # Rainbow color table for raster bars (smooth color cycle)
-raster_color_addr = BASE + len(code)
 # Classic C64 rainbow: black, dark gray, brown, orange, yellow, light green,
 # cyan, light blue, blue, purple, red, light red, gray, light gray, white, light gray
 RASTER_COLORS = [0, 11, 9, 8, 7, 13, 3, 14, 6, 4, 2, 10, 12, 15, 1, 15]
-code.extend(RASTER_COLORS)
-
-# Sine table for Y positions (32 entries, values 0-4 for 5 rows)
-sine_table_addr = BASE + len(code)
-import math
-SINE_TABLE = []
-for i in range(32):
-    val = int(2 + 2 * math.sin(i * math.pi * 2 / 32))  # 0-4 range
-    SINE_TABLE.append(val)
-code.extend(SINE_TABLE)
-
-# Row address lookup tables (5 rows: 19-23)
-# Row 19: $06F8, Row 20: $0720, Row 21: $0748, Row 22: $0770, Row 23: $0798
-row_lo_table_addr = BASE + len(code)
-ROW_LO = [0xF8, 0x20, 0x48, 0x70, 0x98]
-code.extend(ROW_LO)
-
-row_hi_table_addr = BASE + len(code)
-ROW_HI = [0x06, 0x07, 0x07, 0x07, 0x07]
-code.extend(ROW_HI)
-
-# Star position tables for parallax starfield
-# Fast stars (layer 1) - X positions (8 stars)
-star_x_fast_addr = BASE + len(code)
-STAR_X_FAST = [5, 15, 25, 35, 10, 20, 30, 38]  # Initial X positions
-code.extend(STAR_X_FAST)
-
-# Fast stars - Y row addresses (lo byte), rows 6-13
-star_y_fast_addr = BASE + len(code)
-# Rows: 6=$04F0, 7=$0518, 8=$0540, 9=$0568, 10=$0590, 11=$05B8, 12=$05E0, 13=$0608
-STAR_Y_FAST_LO = [0xF0, 0x18, 0x40, 0x68, 0x90, 0xB8, 0xE0, 0x08]
-code.extend(STAR_Y_FAST_LO)
-
-star_yhi_fast_addr = BASE + len(code)
-STAR_Y_FAST_HI = [0x04, 0x05, 0x05, 0x05, 0x05, 0x05, 0x05, 0x06]
-code.extend(STAR_Y_FAST_HI)
-
-# Slow stars (layer 2) - X positions (8 stars)
-star_x_slow_addr = BASE + len(code)
-STAR_X_SLOW = [3, 12, 22, 33, 8, 18, 28, 36]
-code.extend(STAR_X_SLOW)
-
-# Slow stars - Y row addresses, rows 7-14
-star_y_slow_addr = BASE + len(code)
-# Rows: 7=$0518, 8=$0540, 9=$0568, 10=$0590, 11=$05B8, 12=$05E0, 13=$0608, 14=$0630
-STAR_Y_SLOW_LO = [0x18, 0x40, 0x68, 0x90, 0xB8, 0xE0, 0x08, 0x30]
-code.extend(STAR_Y_SLOW_LO)
-
-star_yhi_slow_addr = BASE + len(code)
-STAR_Y_SLOW_HI = [0x05, 0x05, 0x05, 0x05, 0x05, 0x05, 0x06, 0x06]
-code.extend(STAR_Y_SLOW_HI)
-
-# Sprite data
-sprite_data_addr = BASE + len(code)
-code.extend(SPRITE_DATA)
-while len(code) % 64 != 0:  # Pad to 64 bytes
-    code.append(0)
-
-# Patch all refs
-code[scroll_lo_idx] = lo(scroll_addr)
-code[scroll_hi_idx] = hi(scroll_addr)
-code[reset_lo_idx] = lo(scroll_addr)
-code[reset_hi_idx] = hi(scroll_addr)
-code[mel_lo_idx] = lo(mel_lo_addr)
-code[mel_lo_idx+1] = hi(mel_lo_addr)
-code[mel_hi_idx] = lo(mel_hi_addr)
-code[mel_hi_idx+1] = hi(mel_hi_addr)
-code[bass_lo_idx] = lo(bass_lo_addr)
-code[bass_lo_idx+1] = hi(bass_lo_addr)
-code[bass_hi_idx] = lo(bass_hi_addr)
-code[bass_hi_idx+1] = hi(bass_hi_addr)
-code[drum_lo_idx] = lo(drum_lo_addr)
-code[drum_lo_idx+1] = hi(drum_lo_addr)
-code[drum_hi_idx] = lo(drum_hi_addr)
-code[drum_hi_idx+1] = hi(drum_hi_addr)
-
-# Patch raster color table reference
-code[raster_color_idx] = lo(raster_color_addr)
-code[raster_color_idx+1] = hi(raster_color_addr)
-
-# Patch sine table and row table references
-code[sine_table_idx] = lo(sine_table_addr)
-code[sine_table_idx+1] = hi(sine_table_addr)
-code[row_table_idx] = lo(row_lo_table_addr)
-code[row_table_idx+1] = hi(row_lo_table_addr)
-code[row_table_hi_idx] = lo(row_hi_table_addr)
-code[row_table_hi_idx+1] = hi(row_hi_table_addr)
-
-# Patch starfield table references
-code[star_x_fast_idx] = lo(star_x_fast_addr)
-code[star_x_fast_idx+1] = hi(star_x_fast_addr)
-code[star_y_fast_idx] = lo(star_y_fast_addr)
-code[star_y_fast_idx+1] = hi(star_y_fast_addr)
-code[star_yhi_fast_idx] = lo(star_yhi_fast_addr)
-code[star_yhi_fast_idx+1] = hi(star_yhi_fast_addr)
-code[star_x_store_fast] = lo(star_x_fast_addr)
-code[star_x_store_fast+1] = hi(star_x_fast_addr)
-code[star_x_slow_idx] = lo(star_x_slow_addr)
-code[star_x_slow_idx+1] = hi(star_x_slow_addr)
-code[star_y_slow_idx] = lo(star_y_slow_addr)
-code[star_y_slow_idx+1] = hi(star_y_slow_addr)
-code[star_yhi_slow_idx] = lo(star_yhi_slow_addr)
-code[star_yhi_slow_idx+1] = hi(star_yhi_slow_addr)
-code[star_x_store_slow] = lo(star_x_slow_addr)
-code[star_x_store_slow+1] = hi(star_x_slow_addr)
-
-# Calculate sprite block number (sprite_data_addr / 64)
-sprite_block = sprite_data_addr // 64
-code[sprite_block_idx] = sprite_block
-
-prg.extend(code)
-
-with open('demo.prg', 'wb') as f:
-    f.write(bytes(prg))
-
-print(f"Created demo.prg ({len(prg)} bytes)")
-print(f"Sprite at ${sprite_data_addr:04X} (block {sprite_block})")
-print("x64 demo.prg, then RUN")
+
+BASE = 0x0810
+# Load address, then BASIC: 10 SYS 2064, padded up to BASE
+PRG_HEADER = bytes([0x01, 0x08, 0x0C, 0x08, 0x0A, 0x00, 0x9E, 0x32, 0x30, 0x36, 0x34,
+                    0x00, 0x00, 0x00, 0x00, 0x00, 0x00])
+BARS_TOP = 50
+BARS = 25           # raster bars, one border colour each
+BAR_LINES = 8       # lines per bar
+
+# Everything that varies between builds; the defaults make the demo above
+Config = namedtuple('Config', 'scroll_text text_layout sprite_frames sprite_anim_every '
+                              'raster_colors star_layers song optimize',
+                    defaults=(SCROLL_TEXT, TEXT_LAYOUT, (SPRITE_DATA,), SPRITE_ANIM_EVERY,
+                              RASTER_COLORS, STAR_LAYERS, SONG, True))
+
+
+def star_rows(text_layout):
+    """Stars use rows 4-17 except the ones holding static text"""
+    return [row for row in range(4, 18) if row not in {r for r, _, _, _ in text_layout}]
+
+
+def sine_table():
+    """Scroller row offsets: 32 entries, rows 0-4 of the band times 40"""
+    import math
+    return [int(2 + 2 * math.sin(i * math.pi * 2 / 32)) * 40 for i in range(32)]
+
+
+def build(config=Config()):
+    """The demo as PRG bytes (load address first)"""
+    return build_program(config)[0]
+
+
+def build_program(config=Config()):
+    """(PRG bytes, report) - the report holds the generators' statistics
+
+    report keys: sid_flush_cycles, starfield [(layer, stars, cycles)],
+    music_cycles, music_bytes, peephole (instructions, bytes, cycles saved;
+    only when optimizing), sprite (frames, unique, mirrored pairs) and
+    sections [(name, first address, end address)] for the profiler.
+    """
+    _, code, report = assemble_demo(config)
+    return PRG_HEADER + bytes(code), report
+
+
+def assemble_demo(config=Config()):
+    """(Assembler, code from BASE, report) - the program before the PRG header"""
+    song_data = compile_song(config.song)
+    stars = place_stars(config.star_layers, star_rows(config.text_layout))
+    report = {}
+
+    a = Assembler(BASE)
+
+    # Named code sections for the raster-time profiler
+    sections = []
+    def section(name):
+        sections.append(name)
+        a.label(name)
+
+    # Zero page usage:
+    # $FB-$FC: scroll text pointer
+    # $FD: scroll counter
+    # $FE: music index
+    # $FF: frame counter
+    # $02: sprite X lo
+    # $03: sprite Y
+    # $04: sprite X direction (0=right, 1=left)
+    # $05: sprite Y direction (0=down, 1=up)
+
+    # $F9: raster bar colour phase
+    # $FA: frame ready, set by the SID flush for the main loop
+
+    # Raster IRQ chain - only the work that has to happen on a given line:
+    # lines 49, 57 ... 241: one short handler per 8-line bar sets the border
+    #                       colour for the next band and returns at once
+    # line 249: border back to black, SID register flush, frame ready
+    # Everything else (starfield, sprite, music, scroller) runs in the main
+    # loop after the flush and may take the whole frame between the bars.
+    chain = RasterChain(a)
+    for bar in range(BARS):
+        chain.add(BARS_TOP - 1 + bar * BAR_LINES, f'raster_bar_{bar}')
+    chain.add(BARS_TOP + BARS * BAR_LINES - 1, "SID FLUSH")
+
+    section("INIT")
+
+    a.sei()
+
+    # Clear screen
+    a.ldx(imm(0))
+    a.label('clear_screen')
+    a.lda(imm(0x20))
+    a.sta(idx(0x0400)); a.sta(idx(0x0500)); a.sta(idx(0x0600)); a.sta(idx(0x06E8))
+    a.lda(imm(0x00))
+    a.sta(idx(0xD800)); a.sta(idx(0xD900)); a.sta(idx(0xDA00)); a.sta(idx(0xDAE8))
+    a.inx()
+    a.bne('clear_screen')
+
+    # Black border/bg
+    a.lda(imm(0x00)); a.sta(0xD020); a.sta(0xD021)
+
+    # Print static text: copy each TEXT_LAYOUT record to screen and colour RAM
+    # $F6-$F7 = record pointer, $F0-$F1 = screen pointer, $F3-$F4 = colour pointer,
+    # $F5 = colour (all free until the main loop starts)
+    a.lda(imm(lo('text_layout'))); a.sta(0xF6)
+    a.lda(imm(hi('text_layout'))); a.sta(0xF7)
+    a.label('text_record')
+    a.ldy(imm(0))
+    a.lda(ind_y(0xF6))  # length, 0 = end of list
+    a.beq('text_done')
+    a.tax()
+    a.iny(); a.lda(ind_y(0xF6)); a.sta(0xF0); a.sta(0xF3)
+    a.iny(); a.lda(ind_y(0xF6)); a.sta(0xF1)
+    a.clc(); a.adc(imm(hi(COLORRAM - SCREEN))); a.sta(0xF4)
+    a.iny(); a.lda(ind_y(0xF6)); a.sta(0xF5)
+    # Skip the 4-byte header
+    a.lda(0xF6); a.clc(); a.adc(imm(4)); a.sta(0xF6)
+    a.bcc('text_copy_start'); a.inc(0xF7)
+    a.label('text_copy_start')
+    a.ldy(imm(0))
+    a.label('text_copy')
+    a.lda(ind_y(0xF6)); a.sta(ind_y(0xF0))
+    a.lda(0xF5); a.sta(ind_y(0xF3))
+    a.iny(); a.dex()
+    a.bne('text_copy')
+    # Advance past the characters to the next record
+    a.tya(); a.clc(); a.adc(0xF6); a.sta(0xF6)
+    a.bcc('text_record'); a.inc(0xF7)
+    a.jmp('text_record')
+    a.label('text_done')
+
+    # Scroller colour: rows 19-23 light blue, drawn into by the sine scroller
+    a.ldx(imm(39))
+    a.lda(imm(0x0E))  # light blue
+    a.label('scroll_color')
+    for row in range(19, 24):
+        a.sta(idx(COLORRAM + row * 40))
+    a.dex()
+    a.bpl('scroll_color')
+
+    # SID registers start from the shadow copy, written by the first flush
+
+    # === INIT SPRITE ===
+    # Copy the sprite frames to their VIC-II blocks; sprite 0 pointer at $07F8
+    # starts on the first animation frame
+    sprite_unique = len(dedup_frames(config.sprite_frames)[0])
+    emit_sprite_copy(a, sprite_unique)
+    a.lda('sprite_pointers'); a.sta(0x07F8)
+
+    # Enable sprite 0
+    a.lda(imm(0x01)); a.sta(0xD015)  # $D015 = sprite enable
+
+    # Sprite color = white
+    a.lda(imm(0x01)); a.sta(0xD027)  # $D027 = sprite 0 color
+
+    # Expand sprite (double size)
+    a.lda(imm(0x01)); a.sta(0xD01D)  # $D01D = X expand
+    a.lda(imm(0x01)); a.sta(0xD017)  # $D017 = Y expand
+
+    # Init sprite position
+    a.lda(imm(0x64)); a.sta(0x02)  # X lo = 100
+    a.lda(imm(0xA0)); a.sta(0x03)  # Y = 160
+    a.lda(imm(0x00)); a.sta(0x04)  # X dir = right
+    a.lda(imm(0x00)); a.sta(0x05)  # Y dir = down
+    a.lda(imm(0x01)); a.sta(0x06)  # Sprite color = 1 (white)
+    a.lda(imm(0x00)); a.sta(0xD010)  # X MSB = 0
+
+    # Init zero page vars
+    a.lda(imm(lo('scroll_text'))); a.sta(0xFB)
+    a.lda(imm(hi('scroll_text'))); a.sta(0xFC)
+    a.lda(imm(0x00)); a.sta(0xFD)
+    a.lda(imm(0x00)); a.sta(0xFE)
+    a.lda(imm(0x00)); a.sta(0xFF)
+    # Init raster bar phase ($F9) and frame ready ($FA)
+    a.lda(imm(0x00)); a.sta(0xF9)
+    a.lda(imm(0x00)); a.sta(0xFA)
+    # Init sine phase ($F8) for sine wave scroller
+    a.lda(imm(0x00)); a.sta(0xF8)
+
+    chain.install()
+    a.cli()
+
+    # === MAIN LOOP ===
+    # Wait for the flush at the bottom of the bars, then do this frame's work;
+    # the bar IRQs interrupt it wherever it is
+    section("MAIN LOOP")
+    a.label('main_loop')
+    a.lda(0xFA)
+    a.beq('main_loop')
+    a.lda(imm(0x00)); a.sta(0xFA)
+
+    # Raster bar colours move up one bar every 4 frames
+    a.lda(0xFF); a.lsr(); a.lsr(); a.sta(0xF9)
+
+    # === STARFIELD ===
+    # Parallax layers of stars moving left, unrolled per star by starfield.py
+    section("STARFIELD")
+    report['starfield'] = emit_starfield(a, config.star_layers, stars, 0xFF, STARFIELD_BUDGET)
+
+    # === SPRITE MOVEMENT ===
+    # Simpler approach: always update position, check bounds, change color on bounce
+    section("SPRITE MOVEMENT")
+
+    def bounce_axis(axis, pos, direction, low, high):
+        # Move one pixel in the current direction
+        a.lda(direction)
+        a.bne(f'{axis}_go_back')
+        a.inc(pos)
+        a.bne(f'{axis}_moved')  # always
+        a.label(f'{axis}_go_back')
+        a.dec(pos)
+        a.label(f'{axis}_moved')
+
+        # Check bounds, reverse and change color on a bounce
+        a.lda(pos)
+        a.cmp(imm(low))
+        a.bcs(f'{axis}_not_low')
+        a.lda(imm(0x00)); a.sta(direction)
+        a.inc(0x06)  # INC color
+        a.label(f'{axis}_not_low')
+        a.cmp(imm(high))
+        a.bcc(f'{axis}_not_high')
+        a.lda(imm(0x01)); a.sta(direction)
+        a.inc(0x06)  # INC color
+        a.label(f'{axis}_not_high')
+
+    bounce_axis('sprite_x', 0x02, 0x04, 24, 224)
+    bounce_axis('sprite_y', 0x03, 0x05, 50, 224)
+
+    # Wrap color to 1-15 (skip 0/black)
+    a.lda(0x06)
+    a.and_(imm(0x0F))
+    a.bne('color_not_zero')
+    a.lda(imm(0x01))
+    a.label('color_not_zero')
+    a.sta(0x06)
+
+    # Store sprite position and color to VIC
+    a.lda(0x02); a.sta(0xD000)  # Sprite 0 X
+    a.lda(0x03); a.sta(0xD001)  # Sprite 0 Y
+    a.lda(0x06); a.sta(0xD027)  # Sprite 0 color
+
+    # Next animation frame: one sprite pointer write
+    emit_animation(a, len(config.sprite_frames), config.sprite_anim_every, 0xFF)
+
+    # === MUSIC ===
+    section("MUSIC")
+    a.inc(0xFF)  # frame counter
+    a.jsr('music_play')
+
+    # Filter sweep and lead pulse-width modulation on a 256-frame triangle
+    section("SID EFFECTS")
+    a.lda(0xFF)
+    a.asl(); a.bcc('sid_tri_up'); a.eor(imm(0xFF))
+    a.label('sid_tri_up')  # A = 0..254..0
+    a.lsr(); a.lsr(); a.pha()
+    a.clc(); a.adc(imm(0x20)); a.sta(ref('sid_shadow') + 0x16)  # cutoff hi $20-$5F
+    a.pla(); a.lsr(); a.lsr(); a.lsr()
+    a.clc(); a.adc(imm(0x04)); a.sta(ref('sid_shadow') + 0x03)  # voice 1 pulse $04xx-$0Bxx
+
+    # === SINE WAVE SCROLL ===
+    # Use $F8 for sine phase, increment each frame for animation
+    section("SINE WAVE SCROLL")
+    a.inc(0xF8)  # INC sine_phase
+
+    # Speed control - scroll every 4 frames
+    a.inc(0xFD); a.lda(0xFD); a.and_(imm(0x03))
+    a.bne('scroll_done')
+
+    # Check for end of scroll text and reset if needed
+    a.ldy(imm(0))
+    a.lda(ind_y(0xFB))  # get first char
+    a.bne('scroll_not_end')
+    # Reset scroll if at end
+    a.lda(imm(lo('scroll_text'))); a.sta(0xFB)
+    a.lda(imm(hi('scroll_text'))); a.sta(0xFC)
+    a.label('scroll_not_end')
+
+    # Draw 40 characters with sine wave Y positions. Rows 19-23 are one
+    # 200-byte band, so a cell is band + row*40 + column, indexed by Y.
+    # scroll_cells remembers where each column was drawn last time: only that
+    # cell is erased when the row changes. Colour RAM is filled once at init.
+    a.ldx(imm(0))  # character position 0-39
+    a.label('sine_draw')
+
+    # New cell: sine_table[(X + sine_phase) & 31] + X -> $F6
+    a.stx(0xF5)
+    a.txa()
+    a.clc(); a.adc(0xF8)  # add sine_phase
+    a.and_(imm(0x1F))
+    a.tay()
+    a.lda(idy('sine_table'))  # row * 40
+    a.clc(); a.adc(0xF5)
+    a.sta(0xF6)
+
+    a.ldy(idx('scroll_cells'))  # cell drawn last time
+    a.cpy(0xF6)
+    a.beq('sine_same_cell')
+    a.lda(imm(32))  # space
+    a.sta(idy(SCROLL_BAND))  # erase the old cell
+    a.lda(0xF6); a.sta(idx('scroll_cells'))
+    a.label('sine_same_cell')
+
+    # Store character ($FB),X in the new cell
+    a.ldy(0xF5)
+    a.lda(ind_y(0xFB))
+    a.ldy(0xF6)
+    a.sta(idy(SCROLL_BAND))
+
+    # Next character
+    a.inx()
+    a.cpx(imm(40))
+    a.bne('sine_draw')
+
+    # Increment scroll position
+    a.inc(0xFB); a.bne('scroll_done'); a.inc(0xFC)
+
+    a.label('scroll_done')
+    a.jmp('main_loop')
+
+    # === RASTER BARS ===
+    # Bar k is raster_colors[(k + phase) & 15], set at the end of the line
+    # above it
+    section("RASTER BARS")
+    for bar in range(BARS):
+        chain.enter(f'raster_bar_{bar}')
+        a.lda(0xF9)
+        a.clc(); a.adc(imm(bar))
+        a.and_(imm(0x0F))
+        a.tay()
+        a.lda(idy('raster_colors'))
+        a.sta(0xD020)  # border
+        chain.leave(f'raster_bar_{bar}')
+
+    # === SID FLUSH ===
+    # Last frame's sound changes reach the chip together, at a fixed raster
+    # line; then the main loop may start the next frame
+    chain.enter("SID FLUSH", section)
+    a.lda(imm(0x00)); a.sta(0xD020)  # border back to black below the bars
+    report['sid_flush_cycles'] = emit_flush(a)
+    a.inc(0xFA)  # frame ready
+    chain.leave("SID FLUSH")
+
+    # Music player routine, $F0-$F2 scratch; writes the SID shadow registers
+    section("MUSIC PLAYER")
+    report['music_cycles'] = emit_player(a, config.song, song_data, 0xF0, sid=ref('sid_shadow'),
+                                          retrigger='sid_retrigger')
+    a.label('code_end')
+
+    # === DATA ===
+
+    # Song: player state, order lists, patterns, instruments, note frequencies
+    report['music_bytes'] = emit_song_data(a, config.song, song_data)
+
+    # SID shadow registers; the first flush initialises the chip
+    emit_shadow(a, {
+        0x15: 0x00,  # Filter cutoff lo
+        0x16: 0x40,  # Filter cutoff hi (medium), swept by SID EFFECTS
+        0x17: 0x73,  # Resonance=7, filter voices 1+2
+        0x18: 0x1F,  # Volume 15 + lowpass filter on
+    })
+
+    a.label('sine_table')
+    a.data(sine_table())
+
+    # Cell (band offset) each scroller column was last drawn on
+    a.label('scroll_cells')
+    a.data(range(40))
+
+    # Star position tables for parallax starfield
+    # Star X positions, one table per layer
+    emit_star_tables(a, config.star_layers, stars)
+    emit_animation_state(a)
+
+    # Last: the data that differs between variants of the demo (see variants.py)
+    a.label('variant_data')
+    sprite_mirrored = emit_variant_data(a, config)
+
+    if config.optimize:
+        import peephole
+        report['peephole'] = peephole.optimize(a)
+
+    code = a.assemble()
+    check_program_end(BASE + len(code))
+    report['sprite'] = (len(config.sprite_frames), sprite_unique, sprite_mirrored)
+
+    # Address ranges of the code sections: (name, first address, end address)
+    section_ends = sections[1:] + ['code_end']
+    report['sections'] = [(name, a.addr(name), a.addr(end))
+                          for name, end in zip(sections, section_ends)]
+    return a, code, report
+
+
+def emit_variant_data(a, config):
+    """Assemble the static text, scroll text, raster colours and sprite frames
+
+    Returns the number of mirrored sprite frame pairs.
+    """
+    # Text records: length, screen address lo/hi, colour, characters; length 0 ends the list
+    a.label('text_layout')
+    for row, col, color, text in config.text_layout:
+        pet = text_to_petscii(text)
+        if col is None:
+            col = (40 - len(pet)) // 2
+        if not pet or col < 0 or col + len(pet) > 40 or not 0 <= row < 25:
+            raise ValueError(f"text does not fit at row {row}, column {col}: {text!r}")
+        a.byte(len(pet), lo(SCREEN + row * 40 + col), hi(SCREEN + row * 40 + col), color)
+        a.data(pet)
+    a.byte(0)
+
+    a.label('scroll_text')
+    a.data(text_to_petscii(config.scroll_text))
+    a.byte(0)
+
+    # Colour table for the raster bars, 16 entries
+    if len(config.raster_colors) != 16:
+        raise ValueError(f"raster_colors needs 16 entries, not {len(config.raster_colors)}")
+    a.label('raster_colors')
+    a.data(config.raster_colors)
+
+    # Sprite frames (copied to SPRITE_BASE at init) and the animation's pointers
+    _, mirrored = emit_sprite_frames(a, config.sprite_frames)
+    return len(mirrored)
+
+
+USAGE = 'Usage: python3 build_demo.py [--no-opt] [--sprite FILE] [--profile [FRAMES]]'
+
+
+def _usage_error(message):
+    print(f"ERROR: {message}")
+    print(USAGE)
+    sys.exit(2)
+
+
+def main(argv):
+    # Check the arguments before anything is built or written
+    sprite_file = None
+    if '--sprite' in argv:
+        i = argv.index('--sprite')
+        if i + 1 >= len(argv) or argv[i + 1].startswith('--'):
+            _usage_error('--sprite needs a file')
+        sprite_file = argv[i + 1]
+    profile_frames = None
+    if '--profile' in argv:
+        args = argv[argv.index('--profile') + 1:]
+        profile_frames = 500
+        if args and not args[0].startswith('--'):
+            try:
+                profile_frames = int(args[0])
+            except ValueError:
+                profile_frames = 0
+            if profile_frames <= 0:
+                _usage_error(f'--profile takes a number of frames, not {args[0]!r}')
+
+    config = Config(optimize='--no-opt' not in argv)
+    if sprite_file:
+        import png2sprite
+        if sprite_file.lower().endswith('.spr'):
+            frames = png2sprite.read_frames(sprite_file)
+        else:
+            frames = png2sprite.convert_sheet(sprite_file)
+        config = config._replace(sprite_frames=frames)
+    prg, report = build_program(config)
+
+    if 'peephole' in report:
+        removed, saved_bytes, saved_cycles = report['peephole']
+        print(f"Peephole: removed {removed} instructions, saved {saved_bytes} bytes / {saved_cycles} cycles")
+    with open('demo.prg', 'wb') as f:
+        f.write(prg)
+
+    print(f"Created demo.prg ({len(prg)} bytes)")
+    frames, unique, mirrored = report['sprite']
+    print(f"Sprite: {frames} frames, {unique} unique, "
+          f"blocks {SPRITE_BASE // 64}-{SPRITE_BASE // 64 + unique - 1} at ${SPRITE_BASE:04X}"
+          + (f", {mirrored} mirrored pairs" if mirrored else ""))
+    starfield_report = report['starfield']
+    for name, count, cycles in starfield_report:
+        print(f"Starfield layer {name}: {count} stars, {cycles} cycles worst case")
+    print(f"Starfield total: {sum(c for _, c, _ in starfield_report)} stars, "
+          f"{sum(cy for _, _, cy in starfield_report)} of {STARFIELD_BUDGET} cycles")
+    print(f"Music: {report['music_bytes']} bytes of song data, "
+          f"player at most {report['music_cycles']} cycles per call")
+    print(f"SID flush: {report['sid_flush_cycles']} cycles per frame")
+
+    # Crunched copy for the disk image; demo.prg stays plain for the emulator
+    import crunch
+    packed = crunch.crunch_prg(prg, BASE)
+    unpack_cycles = crunch.verify(prg)
+    with open('demo_packed.prg', 'wb') as f:
+        f.write(packed)
+    print(f"Created demo_packed.prg ({len(packed)} bytes)")
+    for line in crunch.report(prg, packed, unpack_cycles):
+        print(line)
+    print("x64 demo.prg, then RUN")
+
+    if profile_frames:
+        import emu6502
+        print()
+        emu6502.print_profile(prg, report['sections'], profile_frames)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+"""
+LZ cruncher for PRG files with a self-relocating 6502 decruncher
+
+The packed PRG is a BASIC SYS line, a small relocator and a blob (decruncher
+plus packed stream).  The relocator banks out the BASIC ROM, copies the blob
+to the top of RAM below $D000 and jumps to it; the decruncher unpacks the
+original image to its load address, going forward, banks BASIC back in and
+jumps to the program's entry point.
+
+Stream format:
+
+    $00          end of stream
+    $01-$7F      n literal bytes follow
+    $80-$BF      match, length (t & $3F) + 2, one byte: distance - 1 (1-256)
+    $C0-$FF      match, length (t & $3F) + 3, two bytes: distance - 1 (lo, hi)
+
+Matches copy from already unpacked output, byte by byte, so they may overlap
+their own output (distance 1 repeats one byte).
+
+Usage: python3 crunch.py input.prg output.prg [entry]
+"""
+
+import sys
+
+from asm6502 import Assembler, imm, ind_y, lo, hi
+from make_d64 import D64Image, estimate_load_seconds
+
+MAX_LITERALS = 0x7F
+SHORT_MIN, SHORT_MAX = 2, 0x3F + 2
+LONG_MIN, LONG_MAX = 3, 0x3F + 3
+BLOB_TOP = 0xD000               # the blob is moved to just below I/O
+CANDIDATES = 256                # earlier positions tried per match search
+
+CLOCK_HZ = 985248
+
+# Zero page used while unpacking (interrupts are off)
+SRC, DST, MATCH, DIST = 0xFB, 0xFD, 0xF7, 0xF9
+# Processor port: RAM at $A000-$BFFF while the blob runs there, then BASIC again
+CPU_PORT = 0x01
+BASIC_OFF, BASIC_ON = 0x36, 0x37
+# verify() points the decruncher here, at a JAM outside everything it writes
+VERIFY_TRAP = 0x0002
+
+
+def _match_cost(length, distance):
+    if distance <= 256 and length <= SHORT_MAX:
+        return 2
+    return 3
+
+
+def pack(data):
+    """Compress bytes into the stream format"""
+    data = bytes(data)
+    out = bytearray()
+    literals = bytearray()
+    chains = {}
+
+    def flush_literals():
+        for i in range(0, len(literals), MAX_LITERALS):
+            chunk = literals[i:i + MAX_LITERALS]
+            out.append(len(chunk))
+            out.extend(chunk)
+        literals.clear()
+
+    def remember(pos):
+        if pos + 3 <= len(data):
+            chains.setdefault(data[pos:pos + 3], []).append(pos)
+
+    i = 0
+    while i < len(data):
+        best_len, best_dist = 0, 0
+        for j in reversed(chains.get(data[i:i + 3], [])[-CANDIDATES:]):
+            length = 0
+            while (length < LONG_MAX and i + length < len(data) and
+                   data[j + length] == data[i + length]):
+                length += 1
+            # Nearest first, so ties keep the shortest distance
+            if length > best_len:
+                best_len, best_dist = length, i - j
+                if length == LONG_MAX:
+                    break
+        if best_len > _match_cost(best_len, best_dist):
+            flush_literals()
+            if _match_cost(best_len, best_dist) == 2:
+                out += bytes([0x80 | (best_len - SHORT_MIN), best_dist - 1])
+            else:
+                out += bytes([0xC0 | (best_len - LONG_MIN),
+                              (best_dist - 1) & 0xFF, (best_dist - 1) >> 8])
+            for k in range(best_len):
+                remember(i + k)
+            i += best_len
+        else:
+            literals.append(data[i])
+            remember(i)
+            i += 1
+    flush_literals()
+    out.append(0)
+    return bytes(out)
+
+
+def unpack(stream):
+    """Python model of the decruncher: stream -> original bytes"""
+    out = bytearray()
+    i = 0
+    while True:
+        t = stream[i]
+        i += 1
+        if t == 0:
+            return bytes(out)
+        if t < 0x80:
+            out += stream[i:i + t]
+            i += t
+            continue
+        if t < 0xC0:
+            length = (t & 0x3F) + SHORT_MIN
+            distance = stream[i] + 1
+            i += 1
+        else:
+            length = (t & 0x3F) + LONG_MIN
+            distance = (stream[i] | stream[i + 1] << 8) + 1
+            i += 2
+        for _ in range(length):
+            out.append(out[-distance])
+
+
+def _emit_decruncher(a, stream_label, load_addr, entry):
+    """The unpack loop, assembled for its relocated address"""
+    a.lda(imm(lo(stream_label))); a.sta(SRC)
+    a.lda(imm(hi(stream_label))); a.sta(SRC + 1)
+    a.lda(imm(lo(load_addr))); a.sta(DST)
+    a.lda(imm(hi(load_addr))); a.sta(DST + 1)
+
+    a.label('token')
+    a.ldy(imm(0))
+    a.lda(ind_y(SRC))
+    a.beq('unpacked')
+    a.jsr('src_inc')
+    a.cmp(imm(0x80))
+    a.bcs('match')
+    # Literal run
+    a.tax()
+    a.label('literal')
+    a.lda(ind_y(SRC)); a.sta(ind_y(DST))
+    a.iny(); a.dex()
+    a.bne('literal')
+    a.tya(); a.jsr('src_add')
+    a.tya(); a.jsr('dst_add')
+    a.jmp('token')
+
+    a.label('match')
+    a.cmp(imm(0xC0))
+    a.bcs('match_long')
+    a.and_(imm(0x3F)); a.adc(imm(SHORT_MIN))  # carry clear
+    a.tax()
+    a.lda(ind_y(SRC)); a.sta(DIST)
+    a.sty(DIST + 1)
+    a.lda(imm(1)); a.jsr('src_add')
+    a.jmp('copy')
+    a.label('match_long')
+    a.and_(imm(0x3F)); a.adc(imm(LONG_MIN - 1))  # carry set
+    a.tax()
+    a.lda(ind_y(SRC)); a.sta(DIST)
+    a.iny(); a.lda(ind_y(SRC)); a.sta(DIST + 1)
+    a.lda(imm(2)); a.jsr('src_add')
+
+    # Copy from DST - (distance - 1) - 1
+    a.label('copy')
+    a.lda(DST); a.clc(); a.sbc(DIST); a.sta(MATCH)
+    a.lda(DST + 1); a.sbc(DIST + 1); a.sta(MATCH + 1)
+    a.ldy(imm(0))
+    a.label('copy_byte')
+    a.lda(ind_y(MATCH)); a.sta(ind_y(DST))
+    a.iny(); a.dex()
+    a.bne('copy_byte')
+    a.tya(); a.jsr('dst_add')
+    a.jmp('token')
+
+    a.label('unpacked')
+    a.lda(imm(BASIC_ON)); a.sta(CPU_PORT)
+    a.cli()
+    a.jmp(entry)
+
+    a.label('src_inc')
+    a.inc(SRC); a.bne('src_inc_done'); a.inc(SRC + 1)
+    a.label('src_inc_done')
+    a.rts()
+    a.label('src_add')
+    a.clc(); a.adc(SRC); a.sta(SRC)
+    a.bcc('src_add_done'); a.inc(SRC + 1)
+    a.label('src_add_done')
+    a.rts()
+    a.label('dst_add')
+    a.clc(); a.adc(DST); a.sta(DST)
+    a.bcc('dst_add_done'); a.inc(DST + 1)
+    a.label('dst_add_done')
+    a.rts()
+
+
+def _basic_sys(addr):
+    """One BASIC line at $0801: 10 SYS addr"""
+    digits = str(addr).encode()
+    next_line = 0x0801 + 4 + 1 + len(digits) + 1
+    return bytes([next_line & 0xFF, next_line >> 8, 10, 0, 0x9E]) + digits + bytes([0, 0, 0])
+
+
+def crunch_prg(prg, entry):
+    """Packed, self-extracting PRG for prg (load address + image) started at entry"""
+    load_addr = prg[0] | prg[1] << 8
+    image = prg[2:]
+    stream = pack(image)
+
+    def blob_at(base):
+        a = Assembler(base)
+        _emit_decruncher(a, 'stream', load_addr, entry)
+        a.label('stream')
+        a.data(stream)
+        return a.assemble()
+
+    size = len(blob_at(0x1000))
+    pages = (size + 255) // 256
+    blob_base = BLOB_TOP - pages * 256
+    if load_addr + len(image) > blob_base:
+        raise ValueError(f'unpacked program (to ${load_addr + len(image):04X}) '
+                         f'would overwrite the decruncher at ${blob_base:04X}')
+    blob = blob_at(blob_base)
+
+    # Relocator: copy the blob's pages up to blob_base and jump there
+    sys_addr = 0x0801 + len(_basic_sys(9999))
+    a = Assembler(sys_addr)
+    a.sei()
+    a.lda(imm(BASIC_OFF)); a.sta(CPU_PORT)
+    a.lda(imm(lo('blob'))); a.sta(SRC)
+    a.lda(imm(hi('blob'))); a.sta(SRC + 1)
+    a.lda(imm(0)); a.sta(DST)
+    a.lda(imm(blob_base >> 8)); a.sta(DST + 1)
+    a.ldx(imm(pages))
+    a.ldy(imm(0))
+    a.label('move')
+    a.lda(ind_y(SRC)); a.sta(ind_y(DST))
+    a.iny()
+    a.bne('move')
+    a.inc(SRC + 1); a.inc(DST + 1)
+    a.dex()
+    a.bne('move')
+    a.jmp(blob_base)
+    a.label('blob')
+    a.data(blob)
+    code = a.assemble()
+    if sys_addr + len(code) > blob_base:
+        raise ValueError(f'packed program (to ${sys_addr + len(code):04X}) overlaps '
+                         f'the decruncher\'s destination at ${blob_base:04X}')
+    return bytes([0x01, 0x08]) + _basic_sys(sys_addr) + bytes(code)
+
+
+def verify(prg):
+    """Check a packed PRG both ways: the Python model and the decruncher on the emulated 6502
+
+    Returns the decruncher's run time in cycles.  Raises ValueError on a mismatch.
+    """
+    import emu6502
+
+    load_addr = prg[0] | prg[1] << 8
+    image = bytes(prg[2:])
+    if unpack(pack(image)) != image:
+        raise ValueError('unpack(pack(image)) differs from the image')
+    # Same decruncher, but ending on a JAM at VERIFY_TRAP instead of the program
+    packed = crunch_prg(prg, VERIFY_TRAP)
+    m = emu6502.C64()
+    m.load_prg(packed)
+    m.mem[VERIFY_TRAP] = 0x02
+    m.start(m.sys_address())
+    try:
+        m.run(m.cycles + CLOCK_HZ * 10)
+    except RuntimeError as e:
+        if m.jammed != VERIFY_TRAP:
+            raise ValueError(f'decruncher failed: {e}') from e
+    if m.jammed != VERIFY_TRAP:
+        raise ValueError('decruncher did not finish')
+    if bytes(m.mem[load_addr:load_addr + len(image)]) != image:
+        raise ValueError('6502 decruncher output differs from the image')
+    return m.cycles
+
+
+def report(prg, packed, cycles):
+    """Lines describing the size, ratio and estimated load and unpack time
+
+    Load times are make_d64's estimate for the file alone on a fresh disk.
+    """
+    def blocks(n):
+        return (n + 253) // 254
+
+    def load_time(n):
+        return estimate_load_seconds(D64Image().allocate(blocks(n)))
+
+    return [
+        f"Crunched: {len(prg)} -> {len(packed)} bytes ({len(packed) / len(prg):.0%}), "
+        f"{blocks(len(prg))} -> {blocks(len(packed))} blocks",
+        f"Estimated 1541 load: {load_time(len(prg)):.1f}s -> {load_time(len(packed)):.1f}s "
+        f"+ {cycles / CLOCK_HZ:.2f}s unpacking",
+    ]
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 3:
+        print(__doc__.strip().splitlines()[-1])
+        sys.exit(1)
+    with open(sys.argv[1], 'rb') as f:
+        prg = f.read()
+    if len(sys.argv) > 3:
+        entry = int(sys.argv[3], 0)
+    else:
+        import emu6502
+        m = emu6502.C64()
+        m.load_prg(prg)
+        entry = m.sys_address()
+        if entry is None:
+            print(f"No SYS line in {sys.argv[1]}; give the entry address")
+            sys.exit(1)
+    packed = crunch_prg(prg, entry)
+    cycles = verify(prg)
+    with open(sys.argv[2], 'wb') as f:
+        f.write(packed)
+    print('\n'.join(report(prg, packed, cycles)))
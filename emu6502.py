@@ -0,0 +1,1591 @@
+#!/usr/bin/env python3
+"""
+Headless 6502 / C64 runner - executes a PRG and measures raster time per PAL frame
+
+Models just enough of the machine to time a demo without VICE: a cycle-counted
+6502 (page-cross and branch penalties included), the VIC-II raster counter,
+raster IRQs and badline DMA, CIA1 timer A, and a tiny KERNAL IRQ stub.
+Busy-wait loops on $D012/$D011, short loops polling a flag in RAM and
+JMP-to-self idle loops are detected and fast-forwarded, badline stalls
+included, so only the instructions that do work cost time; those run as
+compiled basic blocks rather than one opcode at a time.  A program idling
+between interrupts runs over 5000 frames/s; the demo, with 26 raster IRQs a
+frame, runs about 2000 frames/s (40x real time) on a typical machine, and
+500 frames from a cold start take about half a second.
+
+Waiting counts as idle time only in the main program: a handler that polls
+the raster inside an IRQ holds the CPU all the same.  A frame is over budget
+if the main program never runs in it, or if a raster IRQ handler is entered
+late or not at all because the one before it ran on.
+"""
+
+import sys
+import time
+
+PAL_CYCLES_PER_LINE = 63
+PAL_LINES = 312
+PAL_FRAME_CYCLES = PAL_CYCLES_PER_LINE * PAL_LINES  # 19656
+
+# Cycle (within a line) at which the VIC-II halts the CPU on a badline
+BADLINE_STALL_AT = 12
+BADLINE_STALL = 40
+
+NEVER = float('inf')
+
+# A raster IRQ serviced this many cycles after its line started is late
+IRQ_LATE = PAL_CYCLES_PER_LINE
+
+# Address BASIC's SYS returns to; a JAM opcode there stops the run cleanly
+SYS_RETURN = 0xA7EA
+
+MODE_SIZE = {
+    'imp': 1, 'acc': 1, 'imm': 2, 'zp': 2, 'zpx': 2, 'zpy': 2, 'rel': 2,
+    'izx': 2, 'izy': 2, 'abs': 3, 'abx': 3, 'aby': 3, 'ind': 3,
+}
+
+# opcode mnemonic mode cycles [+ = page-cross penalty, * = unstable]
+_OPCODE_SPEC = """
+00 BRK imp 7    01 ORA izx 6    02 JAM imp 0    03 SLO izx 8
+04 NOP zp 3     05 ORA zp 3     06 ASL zp 5     07 SLO zp 5
+08 PHP imp 3    09 ORA imm 2    0A ASL acc 2    0B ANC imm 2
+0C NOP abs 4    0D ORA abs 4    0E ASL abs 6    0F SLO abs 6
+10 BPL rel 2    11 ORA izy 5+   12 JAM imp 0    13 SLO izy 8
+14 NOP zpx 4    15 ORA zpx 4    16 ASL zpx 6    17 SLO zpx 6
+18 CLC imp 2    19 ORA aby 4+   1A NOP imp 2    1B SLO aby 7
+1C NOP abx 4+   1D ORA abx 4+   1E ASL abx 7    1F SLO abx 7
+20 JSR abs 6    21 AND izx 6    22 JAM imp 0    23 RLA izx 8
+24 BIT zp 3     25 AND zp 3     26 ROL zp 5     27 RLA zp 5
+28 PLP imp 4    29 AND imm 2    2A ROL acc 2    2B ANC imm 2
+2C BIT abs 4    2D AND abs 4    2E ROL abs 6    2F RLA abs 6
+30 BMI rel 2    31 AND izy 5+   32 JAM imp 0    33 RLA izy 8
+34 NOP zpx 4    35 AND zpx 4    36 ROL zpx 6    37 RLA zpx 6
+38 SEC imp 2    39 AND aby 4+   3A NOP imp 2    3B RLA aby 7
+3C NOP abx 4+   3D AND abx 4+   3E ROL abx 7    3F RLA abx 7
+40 RTI imp 6    41 EOR izx 6    42 JAM imp 0    43 SRE izx 8
+44 NOP zp 3     45 EOR zp 3     46 LSR zp 5     47 SRE zp 5
+48 PHA imp 3    49 EOR imm 2    4A LSR acc 2    4B ALR imm 2
+4C JMP abs 3    4D EOR abs 4    4E LSR abs 6    4F SRE abs 6
+50 BVC rel 2    51 EOR izy 5+   52 JAM imp 0    53 SRE izy 8
+54 NOP zpx 4    55 EOR zpx 4    56 LSR zpx 6    57 SRE zpx 6
+58 CLI imp 2    59 EOR aby 4+   5A NOP imp 2    5B SRE aby 7
+5C NOP abx 4+   5D EOR abx 4+   5E LSR abx 7    5F SRE abx 7
+60 RTS imp 6    61 ADC izx 6    62 JAM imp 0    63 RRA izx 8
+64 NOP zp 3     65 ADC zp 3     66 ROR zp 5     67 RRA zp 5
+68 PLA imp 4    69 ADC imm 2    6A ROR acc 2    6B ARR imm 2
+6C JMP ind 5    6D ADC abs 4    6E ROR abs 6    6F RRA abs 6
+70 BVS rel 2    71 ADC izy 5+   72 JAM imp 0    73 RRA izy 8
+74 NOP zpx 4    75 ADC zpx 4    76 ROR zpx 6    77 RRA zpx 6
+78 SEI imp 2    79 ADC aby 4+   7A NOP imp 2    7B RRA aby 7
+7C NOP abx 4+   7D ADC abx 4+   7E ROR abx 7    7F RRA abx 7
+80 NOP imm 2    81 STA izx 6    82 NOP imm 2    83 SAX izx 6
+84 STY zp 3     85 STA zp 3     86 STX zp 3     87 SAX zp 3
+88 DEY imp 2    89 NOP imm 2    8A TXA imp 2    8B ANE imm 2*
+8C STY abs 4    8D STA abs 4    8E STX abs 4    8F SAX abs 4
+90 BCC rel 2    91 STA izy 6    92 JAM imp 0    93 SHA izy 6*
+94 STY zpx 4    95 STA zpx 4    96 STX zpy 4    97 SAX zpy 4
+98 TYA imp 2    99 STA aby 5    9A TXS imp 2    9B TAS aby 5*
+9C SHY abx 5*   9D STA abx 5    9E SHX aby 5*   9F SHA aby 5*
+A0 LDY imm 2    A1 LDA izx 6    A2 LDX imm 2    A3 LAX izx 6
+A4 LDY zp 3     A5 LDA zp 3     A6 LDX zp 3     A7 LAX zp 3
+A8 TAY imp 2    A9 LDA imm 2    AA TAX imp 2    AB LXA imm 2*
+AC LDY abs 4    AD LDA abs 4    AE LDX abs 4    AF LAX abs 4
+B0 BCS rel 2    B1 LDA izy 5+   B2 JAM imp 0    B3 LAX izy 5+
+B4 LDY zpx 4    B5 LDA zpx 4    B6 LDX zpy 4    B7 LAX zpy 4
+B8 CLV imp 2    B9 LDA aby 4+   BA TSX imp 2    BB LAS aby 4*
+BC LDY abx 4+   BD LDA abx 4+   BE LDX aby 4+   BF LAX aby 4+
+C0 CPY imm 2    C1 CMP izx 6    C2 NOP imm 2    C3 DCP izx 8
+C4 CPY zp 3     C5 CMP zp 3     C6 DEC zp 5     C7 DCP zp 5
+C8 INY imp 2    C9 CMP imm 2    CA DEX imp 2    CB SBX imm 2
+CC CPY abs 4    CD CMP abs 4    CE DEC abs 6    CF DCP abs 6
+D0 BNE rel 2    D1 CMP izy 5+   D2 JAM imp 0    D3 DCP izy 8
+D4 NOP zpx 4    D5 CMP zpx 4    D6 DEC zpx 6    D7 DCP zpx 6
+D8 CLD imp 2    D9 CMP aby 4+   DA NOP imp 2    DB DCP aby 7
+DC NOP abx 4+   DD CMP abx 4+   DE DEC abx 7    DF DCP abx 7
+E0 CPX imm 2    E1 SBC izx 6    E2 NOP imm 2    E3 ISC izx 8
+E4 CPX zp 3     E5 SBC zp 3     E6 INC zp 5     E7 ISC zp 5
+E8 INX imp 2    E9 SBC imm 2    EA NOP imp 2    EB SBC imm 2
+EC CPX abs 4    ED SBC abs 4    EE INC abs 6    EF ISC abs 6
+F0 BEQ rel 2    F1 SBC izy 5+   F2 JAM imp 0    F3 ISC izy 8
+F4 NOP zpx 4    F5 SBC zpx 4    F6 INC zpx 6    F7 ISC zpx 6
+F8 SED imp 2    F9 SBC aby 4+   FA NOP imp 2    FB ISC aby 7
+FC NOP abx 4+   FD SBC abx 4+   FE INC abx 7    FF ISC abx 7
+"""
+
+def _parse_opcode_spec(spec):
+    table = [None] * 256
+    fields = spec.split()
+    for i in range(0, len(fields), 4):
+        op, mnemonic, mode, cyc = fields[i:i + 4]
+        penalty = cyc.endswith('+')
+        unstable = cyc.endswith('*')
+        table[int(op, 16)] = (mnemonic, mode, int(cyc.rstrip('+*')), penalty, unstable)
+    return table
+
+# Full 256-entry decode table indexed by opcode:
+# (mnemonic, mode, base cycles, page-cross penalty, unstable)
+OPCODE_TABLE = _parse_opcode_spec(_OPCODE_SPEC)
+
+# Instruction groups by what they do with their operand
+READ_OPS = {'LDA', 'LDX', 'LDY', 'LAX', 'AND', 'ORA', 'EOR', 'ADC', 'SBC',
+            'CMP', 'CPX', 'CPY', 'BIT', 'NOP', 'ANC', 'ALR', 'ARR', 'SBX'}
+WRITE_OPS = {'STA', 'STX', 'STY', 'SAX'}
+RMW_OPS = {'ASL', 'LSR', 'ROL', 'ROR', 'INC', 'DEC',
+           'SLO', 'RLA', 'SRE', 'RRA', 'DCP', 'ISC'}
+BRANCH_OPS = {'BPL': 'not m.nz & 0x180', 'BMI': 'm.nz & 0x180',
+              'BVC': 'not m.v', 'BVS': 'm.v',
+              'BCC': 'not m.c', 'BCS': 'm.c',
+              'BNE': 'm.nz & 0xFF', 'BEQ': 'not m.nz & 0xFF'}
+
+
+# --- code generation for the opcode handlers ---------------------------------
+#
+# Every opcode gets its own small Python function with the addressing mode and
+# operation inlined.  N and Z are kept lazily in m.nz: Z is set when the low
+# byte is zero, N when bit 7 or bit 8 is set (bit 8 lets BIT set N and Z
+# independently).
+
+_EA = {
+    'zp': 'a = mem[pc]',
+    'zpx': 'a = (mem[pc] + m.x) & 0xFF',
+    'zpy': 'a = (mem[pc] + m.y) & 0xFF',
+    'abs': 'a = mem[pc] | (mem[pc + 1] << 8)',
+    'abx': 'b = mem[pc] | (mem[pc + 1] << 8)\na = (b + m.x) & 0xFFFF',
+    'aby': 'b = mem[pc] | (mem[pc + 1] << 8)\na = (b + m.y) & 0xFFFF',
+    'izx': 'z = (mem[pc] + m.x) & 0xFF\na = mem[z] | (mem[(z + 1) & 0xFF] << 8)',
+    'izy': 'z = mem[pc]\nb = mem[z] | (mem[(z + 1) & 0xFF] << 8)\na = (b + m.y) & 0xFFFF',
+    'ind': 'p = mem[pc] | (mem[pc + 1] << 8)\n'
+           'a = mem[p] | (mem[(p & 0xFF00) | ((p + 1) & 0xFF)] << 8)',
+}
+
+_READ_BODY = {
+    'LDA': 'm.a = m.nz = v',
+    'LDX': 'm.x = m.nz = v',
+    'LDY': 'm.y = m.nz = v',
+    'LAX': 'm.a = m.x = m.nz = v',
+    'AND': 'm.a = m.nz = m.a & v',
+    'ORA': 'm.a = m.nz = m.a | v',
+    'EOR': 'm.a = m.nz = m.a ^ v',
+    # Binary mode inline, decimal mode in the helpers
+    'ADC': 'if m.d:\n    _adc(m, v)\nelse:\n    t = m.a + v + m.c\n'
+           '    m.v = ((m.a ^ t) & (v ^ t) & 0x80) >> 7\n    m.c = t >> 8\n    m.a = m.nz = t & 0xFF',
+    'SBC': 'if m.d:\n    _sbc(m, v)\nelse:\n    t = m.a - v - (0 if m.c else 1)\n'
+           '    m.v = ((m.a ^ v) & (m.a ^ t) & 0x80) >> 7\n    m.c = t >= 0\n    m.a = m.nz = t & 0xFF',
+    'CMP': 't = m.a - v\nm.c = t >= 0\nm.nz = t & 0xFF',
+    'CPX': 't = m.x - v\nm.c = t >= 0\nm.nz = t & 0xFF',
+    'CPY': 't = m.y - v\nm.c = t >= 0\nm.nz = t & 0xFF',
+    'BIT': 'm.nz = (m.a & v) | ((v & 0x80) << 1)\nm.v = (v >> 6) & 1',
+    'NOP': 'pass',
+    'ANC': 'm.a = m.nz = m.a & v\nm.c = m.a >> 7',
+    'ALR': 't = m.a & v\nm.c = t & 1\nm.a = m.nz = t >> 1',
+    'ARR': 't = m.a & v\nr = (t >> 1) | (m.c << 7)\nm.a = m.nz = r\n'
+           'm.c = (r >> 6) & 1\nm.v = ((r >> 6) ^ (r >> 5)) & 1',
+    'SBX': 't = (m.a & m.x) - v\nm.c = t >= 0\nm.x = m.nz = t & 0xFF',
+}
+
+_WRITE_VALUE = {'STA': 'm.a', 'STX': 'm.x', 'STY': 'm.y', 'SAX': 'm.a & m.x'}
+
+# v is the value read, r the value written back
+_RMW_BODY = {
+    'ASL': 'm.c = v >> 7\nr = m.nz = (v << 1) & 0xFF',
+    'LSR': 'm.c = v & 1\nr = m.nz = v >> 1',
+    'ROL': 'r = m.nz = ((v << 1) | m.c) & 0xFF\nm.c = v >> 7',
+    'ROR': 'r = m.nz = (v >> 1) | (m.c << 7)\nm.c = v & 1',
+    'INC': 'r = m.nz = (v + 1) & 0xFF',
+    'DEC': 'r = m.nz = (v - 1) & 0xFF',
+    'SLO': 'm.c = v >> 7\nr = (v << 1) & 0xFF\nm.a = m.nz = m.a | r',
+    'RLA': 'r = ((v << 1) | m.c) & 0xFF\nm.c = v >> 7\nm.a = m.nz = m.a & r',
+    'SRE': 'm.c = v & 1\nr = v >> 1\nm.a = m.nz = m.a ^ r',
+    'RRA': 'r = (v >> 1) | (m.c << 7)\nm.c = v & 1\n_adc(m, r)',
+    'DCP': 'r = (v - 1) & 0xFF\nt = m.a - r\nm.c = t >= 0\nm.nz = t & 0xFF',
+    'ISC': 'r = (v + 1) & 0xFF\n_sbc(m, r)',
+}
+
+_ACC_BODY = {
+    'ASL': 'v = m.a\nm.c = v >> 7\nm.a = m.nz = (v << 1) & 0xFF',
+    'LSR': 'v = m.a\nm.c = v & 1\nm.a = m.nz = v >> 1',
+    'ROL': 'v = m.a\nm.a = m.nz = ((v << 1) | m.c) & 0xFF\nm.c = v >> 7',
+    'ROR': 'v = m.a\nm.a = m.nz = (v >> 1) | (m.c << 7)\nm.c = v & 1',
+}
+
+_IMPLIED_BODY = {
+    'CLC': 'm.c = 0', 'SEC': 'm.c = 1', 'CLD': 'm.d = 0', 'SED': 'm.d = 1',
+    'CLV': 'm.v = 0', 'SEI': 'm.i = 1',
+    'CLI': 'm.i = 0\nm.next_event = 0',
+    'TAX': 'm.x = m.nz = m.a', 'TAY': 'm.y = m.nz = m.a',
+    'TXA': 'm.a = m.nz = m.x', 'TYA': 'm.a = m.nz = m.y',
+    'TSX': 'm.x = m.nz = m.sp', 'TXS': 'm.sp = m.x',
+    'INX': 'm.x = m.nz = (m.x + 1) & 0xFF', 'INY': 'm.y = m.nz = (m.y + 1) & 0xFF',
+    'DEX': 'm.x = m.nz = (m.x - 1) & 0xFF', 'DEY': 'm.y = m.nz = (m.y - 1) & 0xFF',
+    'NOP': 'pass',
+    'PHA': 'mem[0x100 | m.sp] = m.a\nm.sp = (m.sp - 1) & 0xFF',
+    'PHP': 'mem[0x100 | m.sp] = _get_p(m) | 0x10\nm.sp = (m.sp - 1) & 0xFF',
+    'PLA': 'm.sp = (m.sp + 1) & 0xFF\nm.a = m.nz = mem[0x100 | m.sp]',
+    'PLP': 'm.sp = (m.sp + 1) & 0xFF\n_set_p(m, mem[0x100 | m.sp])\nm.next_event = 0',
+    'RTS': 's = m.sp\nlo = mem[0x100 | ((s + 1) & 0xFF)]\nhi = mem[0x100 | ((s + 2) & 0xFF)]\n'
+           'm.sp = (s + 2) & 0xFF\npc = ((hi << 8) | lo) + 1',
+    'RTI': 's = m.sp\n_set_p(m, mem[0x100 | ((s + 1) & 0xFF)])\n'
+           'lo = mem[0x100 | ((s + 2) & 0xFF)]\nhi = mem[0x100 | ((s + 3) & 0xFF)]\n'
+           'm.sp = (s + 3) & 0xFF\npc = (hi << 8) | lo\n'
+           'if not m.i and m._irq_line():\n    m.next_event = 0\n'
+           'if m.irq_depth:\n    m.leave_irq()',
+    'BRK': 't = pc + 1\ns = m.sp\nmem[0x100 | s] = t >> 8\n'
+           'mem[0x100 | ((s - 1) & 0xFF)] = t & 0xFF\n'
+           'mem[0x100 | ((s - 2) & 0xFF)] = _get_p(m) | 0x10\n'
+           'm.sp = (s - 3) & 0xFF\nm.i = 1\npc = mem[0xFFFE] | (mem[0xFFFF] << 8)',
+    'JAM': 'pc -= 1\nm.jammed = pc\nm.halted = True\nm.next_event = 0',
+}
+
+
+def _io_read_expr(base):
+    return f'(m.io_read(a, m.cycles + {base - 1}, pc - 1) if a >> 12 == 13 else mem[a])'
+
+
+def _io_write_stmt(value, off):
+    return (f'if a >> 12 == 13:\n    m.io_write(a, {value}, m.cycles + {off})\n'
+            f'else:\n    mem[a] = {value}')
+
+
+def _handler_source(op, entry, trace=False):
+    mnemonic, mode, cyc, penalty, unstable = entry
+    name = f'_op_{op:02X}'
+    body = []
+    ret = str(cyc)
+    size = MODE_SIZE[mode]
+    direct = mode in ('zp', 'zpx', 'zpy')
+
+    if unstable:
+        body.append(f"raise RuntimeError('unstable opcode ${op:02X} ({mnemonic}) at $%04X' % (pc - 1))")
+    elif mnemonic in BRANCH_OPS:
+        body.append(f'if {BRANCH_OPS[mnemonic]}:')
+        body.append('    o = mem[pc]')
+        body.append('    n = (pc + 1 + (o - 256 if o & 0x80 else o)) & 0xFFFF')
+        body.append('    m.pc = n')
+        body.append('    if o > 0xEF:\n        m.wait(n, pc - 1)')
+        body.append('    return 4 if (n ^ (pc + 1)) & 0xFF00 else 3')
+        body.append('m.pc = pc + 1')
+    elif mnemonic == 'JMP':
+        body.append(_EA[mode])
+        body.append('m.pc = a')
+        if mode == 'abs':
+            body.append('if a == pc - 1:\n    m.spin(a, 3)')
+    elif mnemonic == 'JSR':
+        body.append(_EA[mode])
+        body.append('t = pc + 1\ns = m.sp\nmem[0x100 | s] = t >> 8\n'
+                    'mem[0x100 | ((s - 1) & 0xFF)] = t & 0xFF\nm.sp = (s - 2) & 0xFF')
+        body.append('m.pc = a')
+    elif mode == 'imp':
+        body.append(_IMPLIED_BODY[mnemonic])
+        body.append('m.pc = pc')
+    elif mode == 'acc':
+        body.append(_ACC_BODY[mnemonic])
+    elif mode == 'imm':
+        body.append('v = mem[pc]')
+        body.append(f'm.pc = pc + 1')
+        body.append(_READ_BODY[mnemonic])
+    else:
+        body.append(_EA[mode])
+        body.append(f'm.pc = pc + {size - 1}')
+        if trace and not direct:
+            # Bus accesses by region; a read-modify-write writes twice
+            body.append('r = m.region_of[a]')
+            if mnemonic in READ_OPS or mnemonic in RMW_OPS:
+                body.append('m.trace_reads[r] += 1')
+            if mnemonic in WRITE_OPS or mnemonic in RMW_OPS:
+                body.append('m.trace_writes[r] += ' + ('2' if mnemonic in RMW_OPS else '1'))
+        if mnemonic in READ_OPS:
+            body.append('v = mem[a]' if direct else f'v = {_io_read_expr(cyc)}')
+            body.append(_READ_BODY[mnemonic])
+            if penalty:
+                ret = f'{cyc + 1} if (b ^ a) & 0xFF00 else {cyc}'
+        elif mnemonic in WRITE_OPS:
+            value = _WRITE_VALUE[mnemonic]
+            body.append(f'mem[a] = {value}' if direct else _io_write_stmt(value, cyc - 1))
+        elif mnemonic in RMW_OPS:
+            body.append('v = mem[a]' if direct else f'v = {_io_read_expr(cyc - 2)}')
+            body.append(_RMW_BODY[mnemonic])
+            if direct:
+                body.append('mem[a] = r')
+            else:
+                # The NMOS 6502 writes the unmodified value back before the
+                # result - this is what makes "ASL $D019" acknowledge an IRQ.
+                body.append('if a >> 12 == 13:\n    m.io_write(a, v, m.cycles + '
+                            f'{cyc - 2})\n    m.io_write(a, r, m.cycles + {cyc - 1})\n'
+                            'else:\n    mem[a] = r')
+        else:
+            raise ValueError(f'no handler template for {mnemonic} {mode}')
+
+    lines = [f'def {name}(m):', '    mem = m.mem', '    pc = m.pc']
+    for chunk in body:
+        lines.extend('    ' + line for line in chunk.split('\n'))
+    lines.append(f'    return {ret}')
+    return name, '\n'.join(lines)
+
+
+def _adc(m, v):
+    a = m.a
+    c = 1 if m.c else 0
+    t = a + v + c
+    if m.d:
+        lo = (a & 0x0F) + (v & 0x0F) + c
+        hi = (a & 0xF0) + (v & 0xF0)
+        if lo > 0x09:
+            lo += 0x06
+        if lo > 0x0F:
+            hi += 0x10
+        m.v = ((a ^ hi) & (v ^ hi) & 0x80) >> 7
+        if hi > 0x90:
+            hi += 0x60
+        m.c = hi > 0xFF
+        m.nz = t & 0xFF
+        m.a = (hi & 0xF0) | (lo & 0x0F)
+        return
+    m.v = ((a ^ t) & (v ^ t) & 0x80) >> 7
+    m.c = t >> 8
+    m.a = m.nz = t & 0xFF
+
+
+def _sbc(m, v):
+    a = m.a
+    b = 0 if m.c else 1
+    t = a - v - b
+    m.v = ((a ^ v) & (a ^ t) & 0x80) >> 7
+    m.c = t >= 0
+    m.nz = t & 0xFF
+    if m.d:
+        lo = (a & 0x0F) - (v & 0x0F) - b
+        hi = (a >> 4) - (v >> 4)
+        if lo < 0:
+            lo -= 6
+            hi -= 1
+        if hi < 0:
+            hi -= 6
+        m.a = ((hi << 4) | (lo & 0x0F)) & 0xFF
+    else:
+        m.a = t & 0xFF
+
+
+def _get_p(m):
+    nz = m.nz
+    return ((0x80 if nz & 0x180 else 0) | (0x40 if m.v else 0) | 0x20 |
+            (0x08 if m.d else 0) | (0x04 if m.i else 0) |
+            (0x02 if not nz & 0xFF else 0) | (0x01 if m.c else 0))
+
+
+def _set_p(m, p):
+    # Rebuild the lazy N/Z value so that both flags read back as stored
+    m.nz = ((p & 0x80) << 1) | (0 if p & 0x02 else 1)
+    m.v = (p >> 6) & 1
+    m.d = (p >> 3) & 1
+    m.i = (p >> 2) & 1
+    m.c = p & 1
+
+
+def build_handlers(trace=False):
+    """Compile one handler function per opcode, returned as a 256-entry list
+
+    trace=True counts every non-zero-page data access in m.trace_reads and
+    m.trace_writes, indexed by m.region_of[address].
+    """
+    namespace = {'_adc': _adc, '_sbc': _sbc, '_get_p': _get_p, '_set_p': _set_p}
+    names = []
+    sources = []
+    for op, entry in enumerate(OPCODE_TABLE):
+        name, src = _handler_source(op, entry, trace)
+        names.append(name)
+        sources.append(src)
+    exec(compile('\n\n'.join(sources), '<emu6502 handlers>', 'exec'), namespace)
+    return [namespace[name] for name in names]
+
+# Compiled on first use, so importing the tables (asm6502 does) stays cheap
+HANDLERS = None
+TRACE_HANDLERS = None
+
+
+def _trace_regions():
+    """Region names for access tracing and the address -> region index map"""
+    names = ['other RAM/ROM', 'screen $0400-$07E7', 'sprite pointers $07F8-$07FF',
+             'colour RAM $D800-$DBFF']
+    region_of = bytearray(0x10000)
+    region_of[0x0400:0x07E8] = b'\1' * 0x3E8
+    region_of[0x07F8:0x0800] = b'\2' * 8
+    region_of[0xD800:0xDC00] = b'\3' * 0x400
+    # I/O registers by register, folding the chips' mirrors
+    for chip, base, end, count in (('VIC', 0xD000, 0xD400, 0x40), ('SID', 0xD400, 0xD800, 0x20),
+                                   ('CIA1', 0xDC00, 0xDD00, 0x10), ('CIA2', 0xDD00, 0xDE00, 0x10)):
+        first = len(names)
+        names += [f'{chip} ${base + i:04X}' for i in range(count)]
+        for a in range(base, end):
+            region_of[a] = first + (a - base) % count
+    return names, region_of
+
+
+TRACE_REGIONS, _TRACE_REGION_OF = _trace_regions()
+
+# Opcodes that may appear inside a raster poll loop that is safe to skip:
+# they neither write memory nor touch the stack.
+_PURE_OPS = {'LDA', 'LDX', 'LDY', 'LAX', 'AND', 'ORA', 'EOR', 'CMP', 'CPX', 'CPY',
+             'BIT', 'NOP', 'CLC', 'SEC', 'CLV', 'TAX', 'TAY', 'TXA', 'TYA', 'TSX'}
+
+
+# --- basic blocks -------------------------------------------------------------
+#
+# run() executes straight-line code a block at a time: the instructions from
+# an address up to the next branch, jump or return become one Python function
+# with their operands and addresses folded in.  A block is only entered when it
+# cannot reach the next event, so timing is the same as instruction by
+# instruction; after an instruction that may touch I/O (and so move the clock
+# or bring the next event forward) it checks again and leaves early if needed.
+# I/O registers without side effects (SID, colour RAM, most of the VIC-II) are
+# accessed inline, and a block carries on through a JMP to code not yet in it.
+# Blocks are cached by address and bytes: code that is rewritten gets a new
+# block, and code rewritten too often is stepped one instruction at a time.
+
+BLOCK_CYCLES = 100          # worst-case length of one block
+BLOCK_HOT = 8               # visits to an address before its block is compiled
+BLOCK_RECOMPILES = 8        # rewrites of the code at an address before it is stepped
+# Left to their handlers: they change the interrupt state
+_BLOCK_STOP = {'BRK', 'JAM', 'CLI', 'PLP'}
+_BLOCKS = {}                # (address, code bytes) -> compiled block
+
+
+def _step(m):
+    """Execute one instruction through its handler"""
+    pc = m.pc
+    m.pc = pc + 1
+    # Two statements: a raster poll may move m.cycles forward
+    cyc = m.handlers[m.mem[pc]](m)
+    m.cycles += cyc
+
+
+def _step_block(m, start, end):
+    """Execute the block from start to end one instruction at a time
+
+    For a block that would run into the next event: it stops there, or where
+    the code leaves the block.
+    """
+    mem = m.mem
+    ops = m.handlers
+    while True:
+        pc = m.pc
+        m.pc = pc + 1
+        cyc = ops[mem[pc]](m)
+        m.cycles += cyc
+        if m.cycles >= m.next_event or not start <= m.pc < end:
+            return
+
+
+def _block_operand(mode, p, mem):
+    """(setup, address expression, I/O: 0 never / 1 maybe / 2 always, page-cross test)"""
+    z = mem[(p + 1) & 0xFFFF]
+    w = z | (mem[(p + 2) & 0xFFFF] << 8)
+    if mode == 'zp':
+        return '', str(z), 0, None
+    if mode in ('zpx', 'zpy'):
+        return f'a = ({z} + m.{mode[2]}) & 0xFF', 'a', 0, None
+    if mode == 'abs':
+        return '', str(w), 2 if w >> 12 == 13 else 0, None
+    if mode in ('abx', 'aby'):
+        io = 1 if w <= 0xDFFF and w + 0xFF >= 0xD000 else 0
+        wrap = ' & 0xFFFF' if w + 0xFF > 0xFFFF else ''
+        return f'a = ({w} + m.{mode[2]}){wrap}', 'a', io, f'(a ^ {w}) & 0xFF00'
+    if mode == 'izx':
+        return (f'z = ({z} + m.x) & 0xFF\na = mem[z] | (mem[(z + 1) & 0xFF] << 8)',
+                'a', 1, None)
+    # izy
+    return (f'b = mem[{z}] | (mem[{(z + 1) & 0xFF}] << 8)\na = (b + m.y) & 0xFFFF',
+            'a', 1, '(b ^ a) & 0xFF00')
+
+
+def _block_read(addr, io, p, off):
+    """(source, I/O: 0 none / 1 needs m.cycles / 2 may move the clock or events)
+
+    A fixed I/O address is resolved here the way io_read would, so only the
+    registers with side effects still go through it.
+    """
+    if io == 2:
+        a = int(addr)
+        if a < 0xD400:
+            a = 0xD000 | (a & 0x3F)
+            if a == 0xD019:
+                return '(m.vic_irq | 0x70 | (0x80 if m.vic_irq & m.vic_irq_mask else 0))', 0
+            if a == 0xD01A:
+                return '(m.vic_irq_mask | 0xF0)', 0
+            if a != 0xD011 and a != 0xD012:
+                return f'mem[{a}]', 0
+        elif 0xDC00 <= a < 0xDD00:
+            a = 0xDC00 | (a & 0x0F)
+            if a != 0xDC0D:
+                return f'mem[{a}]', 0
+        else:
+            return f'mem[{a}]', 0
+        return f'm.io_read({addr}, m.cycles + {off}, {p})', 2
+    if io == 1:
+        return f'(m.io_read(a, m.cycles + {off}, {p}) if a >> 12 == 13 else mem[a])', 2
+    return f'mem[{addr}]', 0
+
+
+def _block_write(addr, io, value, off):
+    """(source, I/O as for _block_read); fixed addresses are resolved as io_write would"""
+    if io == 2:
+        a = int(addr)
+        if a < 0xD400:
+            a = 0xD000 | (a & 0x3F)
+            if a != 0xD011 and a != 0xD012 and a != 0xD01A:
+                ack = f'm.vic_irq &= ~{value} & 0x0F\n' if a == 0xD019 else ''
+                return (f'{ack}if m.vic_log is not None:\n'
+                        f'    m.vic_log.append((m.cycles + {off}, {a}, {value}))\n'
+                        f'mem[{a}] = {value}'), 1
+        elif a < 0xD800:
+            a = 0xD400 | (a & 0x1F)
+            return (f'if m.sid_log is not None:\n'
+                    f'    m.sid_log.append((m.cycles + {off}, {a & 0x1F}, {value}))\n'
+                    f'mem[{a}] = {value}'), 1
+        elif a < 0xDC00:
+            return f'mem[{a}] = {value} & 0x0F', 0
+        elif a >= 0xDD00:
+            return f'mem[{a}] = {value}', 0
+        return f'm.io_write({addr}, {value}, m.cycles + {off})', 2
+    if io == 1:
+        return (f'if a >> 12 == 13:\n    m.io_write(a, {value}, m.cycles + {off})\n'
+                f'else:\n    mem[a] = {value}'), 2
+    return f'mem[{addr}] = {value}', 0
+
+
+def _block_insn(mem, p):
+    """Inline source for the instruction at p: (source, worst-case cycles, I/O)
+
+    The source expects m.cycles to be the instruction's first cycle and adds
+    only a page-crossing penalty to it.  Returns None for instructions that
+    end a block.
+    """
+    mnemonic, mode, cyc, penalty, unstable = OPCODE_TABLE[mem[p]]
+    if unstable or mnemonic in _BLOCK_STOP or mnemonic in BRANCH_OPS or mnemonic in (
+            'JMP', 'JSR', 'RTS', 'RTI'):
+        return None
+    if mode == 'imp':
+        return _IMPLIED_BODY[mnemonic], cyc, 0
+    if mode == 'acc':
+        return _ACC_BODY[mnemonic], cyc, 0
+    if mode == 'imm':
+        return f'v = {mem[(p + 1) & 0xFFFF]}\n' + _READ_BODY[mnemonic], cyc, 0
+    setup, addr, io, cross = _block_operand(mode, p, mem)
+    lines = [setup] if setup else []
+    if mnemonic in READ_OPS:
+        read, kind = _block_read(addr, io, p, cyc - 1)
+        lines.append(f'v = {read}')
+        lines.append(_READ_BODY[mnemonic])
+        if penalty and cross:
+            lines.append(f'if {cross}:\n    m.cycles += 1')
+            cyc += 1
+    elif mnemonic in WRITE_OPS:
+        write, kind = _block_write(addr, io, _WRITE_VALUE[mnemonic], cyc - 1)
+        lines.append(write)
+    else:
+        read, kind = _block_read(addr, io, p, cyc - 3)
+        lines.append(f'v = {read}')
+        lines.append(_RMW_BODY[mnemonic])
+        if io:
+            # The dummy write of the unmodified value, as in the handler
+            write, _ = _block_write(addr, io, 'v', cyc - 2)
+            lines.append(write if io == 2 else write.split('\nelse:')[0])
+        write, last = _block_write(addr, io, 'r', cyc - 1)
+        lines.append(write)
+        kind = max(kind, last)
+    return '\n'.join(lines), cyc, kind
+
+
+def _block_exit(mem, p, pending, waits=False):
+    """Inline source for the branch, jump or return ending a block, or None
+
+    pending is the cycle count of the block not yet added to m.cycles.  With
+    waits, the block is a loop that only reads RAM: an iteration that leaves
+    the registers as it found them will repeat until an interrupt, which the
+    block function's r and c0 (registers and cycle at entry) make visible.
+    """
+    mnemonic, mode = OPCODE_TABLE[mem[p]][:2]
+    nxt = p + MODE_SIZE[mode]
+    sync = f'm.cycles += {pending}\n' if pending else ''
+    if mnemonic in BRANCH_OPS:
+        o = mem[(p + 1) & 0xFFFF]
+        target = (nxt + (o - 256 if o & 0x80 else o)) & 0xFFFF
+        taken = 4 if (target ^ nxt) & 0xFF00 else 3
+        if waits:
+            return (f'if {BRANCH_OPS[mnemonic]}:\n    m.pc = {target}\n'
+                    f'    m.cycles += {pending + taken}\n'
+                    f'    if (m.a, m.x, m.y, m.nz, m.c, m.v) == r:\n'
+                    f'        m.idle_loop({target}, m.cycles - c0, STEPS)\n'
+                    f'else:\n    m.pc = {nxt}\n    m.cycles += {pending + 2}')
+        if o > 0xEF:
+            # As in the handler: a short loop back may be a wait for an IRQ
+            return (f'{sync}if {BRANCH_OPS[mnemonic]}:\n    m.pc = {target}\n'
+                    f'    m.wait({target}, {p})\n    m.cycles += {taken}\n'
+                    f'else:\n    m.pc = {nxt}\n    m.cycles += 2')
+        if _block_jump(mem, p) is not None:
+            # Straight on through a jump the branch lands on, if no event is due first
+            jump = _block_exit(mem, target, 0).replace('\n', '\n        ')
+            return (f'if {BRANCH_OPS[mnemonic]}:\n    m.cycles += {pending + taken}\n'
+                    f'    if m.cycles < m.next_event:\n        {jump}\n'
+                    f'    else:\n        m.pc = {target}\n'
+                    f'else:\n    m.pc = {nxt}\n    m.cycles += {pending + 2}')
+        return (f'if {BRANCH_OPS[mnemonic]}:\n    m.pc = {target}\n'
+                f'    m.cycles += {pending + taken}\n'
+                f'else:\n    m.pc = {nxt}\n    m.cycles += {pending + 2}')
+    if mnemonic == 'JMP' and mode == 'abs':
+        target = mem[(p + 1) & 0xFFFF] | (mem[(p + 2) & 0xFFFF] << 8)
+        if target == p:
+            return f'm.pc = {p}\nm.cycles += {pending + 3}\nm.idle_loop({p}, 3, ())'
+        return f'm.pc = {target}\nm.cycles += {pending + 3}'
+    if mnemonic == 'JMP':
+        v = mem[(p + 1) & 0xFFFF] | (mem[(p + 2) & 0xFFFF] << 8)
+        return (f'm.pc = mem[{v}] | (mem[{(v & 0xFF00) | ((v + 1) & 0xFF)}] << 8)\n'
+                f'm.cycles += {pending + 5}')
+    if mnemonic == 'RTI':
+        return f'{sync}{_IMPLIED_BODY["RTI"]}\nm.pc = pc\nm.cycles += 6'
+    if mnemonic == 'JSR':
+        target = mem[(p + 1) & 0xFFFF] | (mem[(p + 2) & 0xFFFF] << 8)
+        ret = p + 2
+        return (f's = m.sp\nmem[0x100 | s] = {ret >> 8}\n'
+                f'mem[0x100 | ((s - 1) & 0xFF)] = {ret & 0xFF}\nm.sp = (s - 2) & 0xFF\n'
+                f'm.pc = {target}\nm.cycles += {pending + 6}')
+    if mnemonic == 'RTS':
+        return ('s = m.sp\nm.sp = (s + 2) & 0xFF\n'
+                'm.pc = ((mem[0x100 | m.sp] << 8) | mem[0x100 | ((s + 1) & 0xFF)]) + 1\n'
+                f'm.cycles += {pending + 6}')
+    return None
+
+
+def _block_target(mem, p):
+    """Where the branch at p goes when taken (None for other instructions)"""
+    if OPCODE_TABLE[mem[p]][0] not in BRANCH_OPS:
+        return None
+    o = mem[(p + 1) & 0xFFFF]
+    return (p + 2 + (o - 256 if o & 0x80 else o)) & 0xFFFF
+
+
+def _block_jump(mem, p):
+    """Where the branch at p lands if a jump elsewhere is there (else None)
+
+    Short loops back are left alone: they may be waits, see _block_exit.
+    """
+    target = _block_target(mem, p)
+    if target is None or mem[(p + 1) & 0xFFFF] > 0xEF or target > 0xFFFD:
+        return None
+    op = mem[target]
+    if op == 0x6C or (op == 0x4C and mem[target + 1] | (mem[target + 2] << 8) != target):
+        return target
+    return None
+
+
+def _stores_into(mem, p, start):
+    """True if the instruction at p stores to the 256 bytes from start (code it may run)"""
+    mnemonic, mode = OPCODE_TABLE[mem[p]][:2]
+    if mode != 'abs' or (mnemonic not in WRITE_OPS and mnemonic not in RMW_OPS):
+        return False
+    return start <= (mem[p + 1] | (mem[p + 2] << 8)) < start + 0x100
+
+
+def compile_block(mem, start):
+    """The block at start as a function of the machine, or None for a lone stop"""
+    insns = []              # (address, source, worst-case cycles, I/O)
+    spans = []              # (start, end) of the code the block runs, in order
+    p = here = start
+    total = 0
+    exit_at = None
+    while p + 3 <= 0x10000:
+        insn = _block_insn(mem, p)
+        if insn is None:
+            # A jump to code not yet in the block carries on there
+            target = mem[(p + 1) & 0xFFFF] | (mem[(p + 2) & 0xFFFF] << 8)
+            if (mem[p] == 0x4C and total + 3 < BLOCK_CYCLES and
+                    not any(a <= target < b for a, b in spans + [(here, p + 3)])):
+                insns.append((p, 'pass', 3, 0))
+                total += 3
+                spans.append((here, p + 3))
+                p = here = target
+                continue
+            if _block_exit(mem, p, 0) is not None:
+                exit_at = p
+            break
+        insns.append((p,) + insn)
+        total += insn[1]
+        p += MODE_SIZE[OPCODE_TABLE[mem[p]][1]]
+        if total >= BLOCK_CYCLES or any(_stores_into(mem, insns[-1][0], a)
+                                        for a, _ in spans + [(here, p)]):
+            break
+    if not insns and exit_at is None:
+        return None
+    spans.append((here, p if exit_at is None else p + MODE_SIZE[OPCODE_TABLE[mem[p]][1]]))
+    end = spans[0][1]
+    jump = None if exit_at is None else _block_jump(mem, exit_at)
+    if jump is not None:
+        spans.append((jump, jump + 3))
+    code = b''.join(bytes(mem[a:b]) for a, b in spans)
+    block = _BLOCKS.get((start, code))
+    if block is not None:
+        return block
+
+    # Worst-case cycles from the end of each instruction until the last one starts
+    cycles = [c for _, _, c, _ in insns] + [0]
+    if exit_at is None:
+        cycles[-2] = 0
+    rest = [sum(cycles[i + 1:]) for i in range(len(insns))]
+    check = ' or '.join(f'mem[{a}:{b}] != CODE{i}' for i, (a, b) in enumerate(spans))
+    lines = [f'def _block_{start:04X}(m):', '    mem = m.mem',
+             f'    if {check}:', f'        return m.recompile({start})',
+             f'    if m.cycles + {sum(cycles)} >= m.next_event:',
+             f'        return _step_block(m, {start}, {end})']
+    # A loop back to start that only reads RAM may be waiting for an interrupt
+    waits = exit_at is not None and _block_target(mem, exit_at) == start and all(
+        not io and OPCODE_TABLE[mem[q]][0] in _PURE_OPS and OPCODE_TABLE[mem[q]][1] not in (
+            'izx', 'izy') for q, _, _, io in insns)
+    steps = None
+    if waits:
+        lines += ['    r = (m.a, m.x, m.y, m.nz, m.c, m.v)', '    c0 = m.cycles']
+        # Where each instruction starts, unless a page crossing may move it
+        if not any(OPCODE_TABLE[mem[q]][3] for q, _, _, _ in insns):
+            steps = []
+            offset = 0
+            for q, _, cyc, _ in insns:
+                offset += cyc
+                steps.append((offset, q + MODE_SIZE[OPCODE_TABLE[mem[q]][1]]))
+            steps = tuple(steps)
+    pending = 0             # cycles not yet added to m.cycles
+    for i, (q, src, _, io) in enumerate(insns):
+        if io and pending:
+            lines.append(f'    m.cycles += {pending}')
+            pending = 0
+        lines.extend('    ' + line for line in src.split('\n'))
+        pending += OPCODE_TABLE[mem[q]][2]
+        if io == 2 and (i < len(insns) - 1 or exit_at is not None):
+            lines.append(f'    m.cycles += {pending}')
+            pending = 0
+            lines.append(f'    if m.cycles + {rest[i]} >= m.next_event:')
+            lines.append(f'        m.pc = {q + MODE_SIZE[OPCODE_TABLE[mem[q]][1]]}')
+            lines.append('        return')
+    if exit_at is None:
+        src = f'm.pc = {spans[-1][1]}' + (f'\nm.cycles += {pending}' if pending else '')
+    else:
+        src = _block_exit(mem, exit_at, pending, waits)
+    lines.extend('    ' + line for line in src.split('\n'))
+    namespace = {f'CODE{i}': bytes(mem[a:b]) for i, (a, b) in enumerate(spans)}
+    namespace.update({'STEPS': steps, '_step_block': _step_block, '_adc': _adc,
+                      '_sbc': _sbc, '_get_p': _get_p, '_set_p': _set_p})
+    exec(compile('\n'.join(lines), f'<emu6502 block ${start:04X}>', 'exec'), namespace)
+    block = _BLOCKS[(start, code)] = namespace[f'_block_{start:04X}']
+    return block
+
+
+# --- KERNAL stub -------------------------------------------------------------
+
+# $FF48: the KERNAL IRQ entry (save registers, check BRK, JMP ($0314))
+_KERNAL_IRQ = [0x48, 0x8A, 0x48, 0x98, 0x48, 0xBA, 0xBD, 0x04, 0x01, 0x29, 0x10,
+               0xF0, 0x03, 0x6C, 0x16, 0x03, 0x6C, 0x14, 0x03]
+# $EA31: default IRQ handler - acknowledge CIA1 and return via $EA81
+_KERNAL_EA31 = [0x4C, 0x7E, 0xEA]
+_KERNAL_EA7E = [0xAD, 0x0D, 0xDC, 0x68, 0xA8, 0x68, 0xAA, 0x68, 0x40]
+
+
+class C64:
+    """A C64 reduced to CPU, raster timing and the interrupt sources demos use"""
+
+    def __init__(self, badlines=True):
+        self.mem = bytearray(0x10000)
+        global HANDLERS
+        if HANDLERS is None:
+            HANDLERS = build_handlers()
+        self.handlers = HANDLERS
+        self.badlines = badlines
+        self.a = self.x = self.y = 0
+        self.sp = 0xFF
+        self.nz = 1
+        self.c = self.v = self.d = 0
+        self.i = 1
+        self.pc = 0
+        self.halted = False
+        self.jammed = None
+
+        # Raster / frame state; the raster line is derived from the cycle count
+        self.cycles = 0
+        self.next_event = 0
+        self.until = 0
+        self.events = 0
+        self.stall_next = NEVER
+        self.stall_stale = True       # $D011 changed: plan the next badline again
+        self.last_stall = -1
+        self.frame = 0
+        self.frame_start = 0
+        self.frame_idle = 0
+        self.frame_dma = 0
+        self.frame_late = 0
+        self.frames = []          # (busy, idle, dma, late IRQs) per completed frame
+        self.idle = 0
+        self.dma = 0
+
+        # VIC-II interrupt state
+        self.raster_cmp = 0
+        self.raster_next = NEVER
+        self.vic_irq = 0
+        self.vic_irq_mask = 0
+        self.raster_raised = None     # cycle of the raster IRQ not yet serviced
+        self.irq_raster = None        # cycle of the raster IRQ being handled
+        self.irq_depth = 0            # interrupt handlers entered and not left
+
+        # CIA1 timer A as left by the KERNAL (PAL latch $4025, IRQ enabled)
+        self.cia_latch = 0x4025
+        self.cia_running = True
+        self.cia_next = self.cia_latch + 1
+        self.cia_icr = 0
+        self.cia_mask = 0x01
+
+        # Raster poll loop detection: pc -> bool (safe to skip), last visit
+        self.poll_safe = {}
+        self.poll_key = None
+        self.poll_time = 0
+        self.poll_events = -1
+        self.poll_line = -1
+
+        # RAM wait loop detection (a short loop polling a flag an IRQ sets)
+        self.wait_safe = {}
+        self.wait_key = None
+        self.wait_time = 0
+        self.wait_events = -1
+
+        # Compiled blocks by address; visits before compiling; rewrites of the code
+        self.blocks = {}
+        self.visits = {}
+        self.rewrites = {}
+
+        # Optional per-section profiling: section index per address (0 = other)
+        self.section_of = None
+        self.section_cycles = None
+        self.section_frames = []
+
+        # Optional access tracing: reads / writes per TRACE_REGIONS entry
+        self.region_of = None
+        self.trace_reads = None
+        self.trace_writes = None
+        self.trace_frames = []
+
+        # Optional VIC-II write log for rendering: register state at the start
+        # of the frame and (cycle in frame, register, value) writes during it
+        self.vic_log = None
+        self.vic_regs = None
+        self.vic_last_frame = None
+
+        # Optional SID write log: (cycle, register 0-31, value)
+        self.sid_log = None
+
+        self._power_on()
+
+    def _power_on(self):
+        mem = self.mem
+        mem[0x00] = 0x2F
+        mem[0x01] = 0x37
+        for i, v in enumerate([0x1B, 0x00, 0x00, 0x00, 0x00, 0xC8, 0x00, 0x15]):
+            mem[0xD011 + i] = v
+        mem[0xD020] = 0x0E
+        mem[0xD021] = 0x06
+        mem[0xDD00] = 0x97                       # CIA2 port A: VIC-II bank 0
+        mem[0xDD02] = 0x3F
+        mem[0x0400:0x0800] = b'\x20' * 0x400
+        mem[0xD800:0xDC00] = b'\x0E' * 0x400
+        mem[0xFF48:0xFF48 + len(_KERNAL_IRQ)] = bytes(_KERNAL_IRQ)
+        mem[0xEA31:0xEA34] = bytes(_KERNAL_EA31)
+        mem[0xEA7E:0xEA7E + len(_KERNAL_EA7E)] = bytes(_KERNAL_EA7E)
+        mem[0xFE66] = 0x02                       # BRK lands on a JAM
+        mem[SYS_RETURN] = 0x02
+        mem[0x0314], mem[0x0315] = 0x31, 0xEA
+        mem[0x0316], mem[0x0317] = 0x66, 0xFE
+        mem[0xFFFE], mem[0xFFFF] = 0x48, 0xFF
+        mem[0xFFFA], mem[0xFFFB] = 0x66, 0xFE
+
+    # --- loading ---
+
+    def load_prg(self, data):
+        """Copy a PRG (with its 2-byte load address) into memory"""
+        load_addr = data[0] | (data[1] << 8)
+        end = load_addr + len(data) - 2
+        if end > 0x10000:
+            raise ValueError(f'PRG does not fit in memory (ends at ${end:04X})')
+        self.mem[load_addr:end] = data[2:]
+        return load_addr, end
+
+    def sys_address(self, start=0x0801):
+        """Walk the BASIC program at start and return the first SYS target"""
+        mem = self.mem
+        line = start
+        while line and line < 0xA000:
+            nxt = mem[line] | (mem[line + 1] << 8)
+            if nxt == 0:
+                break
+            p = line + 4
+            while p < nxt and mem[p] != 0:
+                if mem[p] == 0x9E:
+                    p += 1
+                    while mem[p] == 0x20:
+                        p += 1
+                    digits = ''
+                    while 0x30 <= mem[p] <= 0x39:
+                        digits += chr(mem[p])
+                        p += 1
+                    if digits:
+                        return int(digits)
+                p += 1
+            line = nxt
+        return None
+
+    def start(self, entry):
+        """Enter entry as if called by BASIC's SYS (returns to SYS_RETURN)"""
+        ret = SYS_RETURN - 1
+        self.mem[0x01FF] = ret >> 8
+        self.mem[0x01FE] = ret & 0xFF
+        self.sp = 0xFD
+        self.i = 0
+        self.pc = entry
+        self.halted = False
+        self._plan_raster_irq()
+
+    # --- I/O ---
+
+    def raster_at(self, t):
+        """Raster line being drawn at cycle t (t may be just past the frame end)"""
+        d = t - self.frame_start
+        if d >= PAL_FRAME_CYCLES:
+            d -= PAL_FRAME_CYCLES
+        return d // PAL_CYCLES_PER_LINE
+
+    def io_read(self, a, t, pc):
+        if a < 0xD400:
+            a = 0xD000 | (a & 0x3F)
+            if a == 0xD012 or a == 0xD011:
+                line = self.raster_at(t)
+                off = t - self.cycles
+                if self._poll(pc, line, t):
+                    line = self.raster_at(self.cycles + off)
+                if a == 0xD012:
+                    return line & 0xFF
+                return (self.mem[0xD011] & 0x7F) | ((line >> 1) & 0x80)
+            if a == 0xD019:
+                v = self.vic_irq
+                return v | 0x70 | (0x80 if v & self.vic_irq_mask else 0)
+            if a == 0xD01A:
+                return self.vic_irq_mask | 0xF0
+            return self.mem[a]
+        if a >= 0xDC00 and a < 0xDD00:
+            a = 0xDC00 | (a & 0x0F)
+            if a == 0xDC0D:
+                v = self.cia_icr
+                if v & self.cia_mask:
+                    v |= 0x80
+                self.cia_icr = 0
+                return v
+        return self.mem[a]
+
+    def io_write(self, a, v, t):
+        mem = self.mem
+        if a < 0xD400:
+            a = 0xD000 | (a & 0x3F)
+            if a == 0xD012:
+                self.raster_cmp = (self.raster_cmp & 0x100) | v
+                self._plan_raster_irq()
+                if self.raster_next < self.next_event:
+                    self.next_event = self.raster_next
+            elif a == 0xD011:
+                self.raster_cmp = (self.raster_cmp & 0xFF) | ((v & 0x80) << 1)
+                self._plan_raster_irq()
+                self.stall_stale = True
+                self.next_event = 0
+            elif a == 0xD019:
+                # Acknowledging can only lower the IRQ line: nothing to schedule
+                self.vic_irq &= ~v & 0x0F
+            elif a == 0xD01A:
+                self.vic_irq_mask = v & 0x0F
+                self.next_event = 0
+            if self.vic_log is not None:
+                self.vic_log.append((t, a, v))
+            mem[a] = v
+        elif a < 0xD800:
+            a = 0xD400 | (a & 0x1F)
+            if self.sid_log is not None:
+                self.sid_log.append((t, a & 0x1F, v))
+            mem[a] = v
+        elif a < 0xDC00:
+            mem[a] = v & 0x0F
+        elif a < 0xDD00:
+            a = 0xDC00 | (a & 0x0F)
+            if a == 0xDC0D:
+                if v & 0x80:
+                    self.cia_mask |= v & 0x1F
+                else:
+                    self.cia_mask &= ~v & 0x1F
+                self.next_event = 0
+            elif a == 0xDC04:
+                self.cia_latch = (self.cia_latch & 0xFF00) | v
+            elif a == 0xDC05:
+                self.cia_latch = (self.cia_latch & 0x00FF) | (v << 8)
+            elif a == 0xDC0E:
+                running = bool(v & 0x01)
+                if running and (v & 0x10 or not self.cia_running):
+                    self.cia_next = t + self.cia_latch + 1
+                self.cia_running = running
+                self.next_event = 0
+            mem[a] = v
+        else:
+            mem[a] = v
+
+    # --- raster poll fast-forward ---
+
+    def _poll(self, m_pc, line, t):
+        """Called on every raster read; skips whole iterations of a pure wait loop.
+
+        The read at pc comes back with the same registers as last time, so the
+        previous iteration changed nothing but the clock.  If the raster line
+        it saw is still the current one, every iteration until the line (or
+        any other event) changes will do the same, and can be skipped.
+        Returns True if the clock was moved forward.
+        """
+        key = (m_pc, self.a, self.x, self.y, self.sp, self.c, self.v, self.nz, self.i)
+        now = self.cycles
+        prev_line = self.poll_line
+        self.poll_line = line
+        if key != self.poll_key or self.events != self.poll_events:
+            self.poll_key = key
+            self.poll_time = now
+            self.poll_events = self.events
+            return False
+        period = now - self.poll_time
+        self.poll_time = now
+        safe = self.poll_safe.get(m_pc)
+        if safe is None:
+            safe = self.poll_safe[m_pc] = self._is_pure_loop(m_pc)
+        if not safe or period <= 0:
+            return False
+        # The previous iteration only waited for the raster to move on
+        self.credit_idle(m_pc, period)
+        if line != prev_line:
+            return False
+        line_end = t + PAL_CYCLES_PER_LINE - (t - self.frame_start) % PAL_CYCLES_PER_LINE
+        skip = min((line_end - 1 - t) // period + 1, (self.next_event - now) // period)
+        if skip <= 0:
+            return False
+        self.cycles = now + skip * period
+        self.poll_time = self.cycles
+        self.credit_idle(m_pc, skip * period, executed=False)
+        return True
+
+    def spin(self, pc, period):
+        """A jump to itself: idle until the next event (usually an IRQ)"""
+        self.credit_idle(pc, period)
+        skip = (self.next_event - 1 - self.cycles) // period
+        if skip > 0:
+            self.cycles += skip * period
+            self.credit_idle(pc, skip * period, executed=False)
+
+    def idle_loop(self, pc, period, steps=None):
+        """The loop at pc ran once and changed nothing: idle until an interrupt
+
+        Called from a compiled block at the start of the loop.  steps are the
+        (cycle offset, address) of the loop's other instructions; with them the
+        clock stops on the instruction boundary where the next event is due,
+        as between single steps, and badline stalls are passed without leaving
+        the loop.  Only the boundaries from the last step on, where nothing is
+        left but the branch back, have the registers the loop keeps; the others
+        are left to the block to step through.
+        """
+        now = self.cycles
+        idle = period
+        # The next event that is not a badline stall; passing stalls leaves it be
+        other = self.frame_start + PAL_FRAME_CYCLES
+        if self.raster_next < other:
+            other = self.raster_next
+        if self.until < other:
+            other = self.until
+        if self.cia_running and self.cia_next < other:
+            other = self.cia_next
+        while True:
+            event = self.next_event
+            skip = (event - 1 - now) // period
+            if skip > 0:
+                now += skip * period
+                idle += skip * period
+            if steps is None or now >= event:
+                break
+            at, resume = period, pc
+            for offset, address in steps:
+                if now + offset >= event:
+                    at, resume = offset, address
+                    break
+            settled = resume == pc or at == steps[-1][0]
+            stall = self.stall_next
+            if stall != event or now + at >= other:
+                if settled:
+                    now += at
+                    idle += at
+                    self.pc = resume
+                break
+            dma = stall + BADLINE_STALL - now - at
+            if dma < 0:
+                dma = 0
+            rest = period - at
+            if not settled and now + at + dma + rest >= other:
+                break
+            idle += at
+            now += at + dma
+            self.dma += dma
+            self.frame_dma += dma
+            self.events += 1
+            self.last_stall = stall
+            self.cycles = now
+            self.stall_next = stall = self._stall_after(stall)
+            self.next_event = stall if stall < other else other
+            if rest:
+                # Finish the iteration, or stop before the branch back
+                if now + rest >= self.next_event:
+                    self.pc = resume
+                    break
+                now += rest
+                idle += rest
+        self.cycles = now
+        # Blocks do not run while profiling sections: nothing was charged there
+        self.credit_idle(pc, idle, executed=False)
+
+    def wait(self, target, pc):
+        """A short backward branch at pc was taken: skip a loop that only reads RAM
+
+        As in _poll, an iteration that comes back with the same registers
+        changed nothing; with no I/O in the loop only an interrupt can end it,
+        so it is idle until the next event.
+        """
+        key = (target, self.a, self.x, self.y, self.sp, self.c, self.v, self.nz, self.i)
+        now = self.cycles
+        if key != self.wait_key or self.events != self.wait_events:
+            self.wait_key = key
+            self.wait_time = now
+            self.wait_events = self.events
+            return
+        period = now - self.wait_time
+        safe = self.wait_safe.get(target)
+        if safe is None:
+            safe = self.wait_safe[target] = all(
+                self._is_pure_insn(q, raster=False) for q in self._walk(target, pc))
+        if safe and period > 0:
+            self.spin(target, period)
+        self.wait_time = self.cycles
+
+    def credit_idle(self, pc, cycles, executed=True):
+        # Waiting inside an interrupt handler holds the CPU all the same
+        if not self.irq_depth:
+            self.idle += cycles
+            self.frame_idle += cycles
+        if executed and self.section_of is not None:
+            # Already charged to the section by the profiling loop
+            self.section_cycles[self.section_of[pc]] -= cycles
+
+    def _is_pure_loop(self, pc):
+        """True if the loop around the raster read at pc has no side effects"""
+        mem = self.mem
+        p = pc
+        for _ in range(16):
+            entry = OPCODE_TABLE[mem[p]]
+            mnemonic, mode = entry[0], entry[1]
+            size = MODE_SIZE[mode]
+            if mnemonic in BRANCH_OPS or mnemonic == 'JMP':
+                if mnemonic == 'JMP':
+                    if mode != 'abs':
+                        return False
+                    target = mem[p + 1] | (mem[p + 2] << 8)
+                else:
+                    o = mem[p + 1]
+                    target = p + 2 + (o - 256 if o & 0x80 else o)
+                if pc - 16 <= target <= pc:
+                    return all(self._is_pure_insn(q) for q in self._walk(target, pc))
+                if mnemonic == 'JMP':
+                    return False
+            elif not self._is_pure_insn(p):
+                return False
+            p += size
+        return False
+
+    def _walk(self, start, end):
+        p = start
+        while p <= end:
+            yield p
+            p += MODE_SIZE[OPCODE_TABLE[self.mem[p]][1]]
+
+    def _is_pure_insn(self, p, raster=True):
+        mem = self.mem
+        mnemonic, mode = OPCODE_TABLE[mem[p]][:2]
+        if mnemonic in BRANCH_OPS:
+            return True
+        if mnemonic not in _PURE_OPS:
+            return False
+        if mode in ('abs', 'abx', 'aby'):
+            a = mem[p + 1] | (mem[p + 2] << 8)
+            # Only raster reads may touch I/O; other registers have side effects
+            if a >> 12 == 13 and (not raster or (0xD000 | (a & 0x3F)) not in (0xD011, 0xD012)):
+                return False
+        return mode not in ('izx', 'izy')
+
+    # --- execution ---
+
+    def _irq_line(self):
+        return (self.vic_irq & self.vic_irq_mask) or (self.cia_icr & self.cia_mask)
+
+    def _schedule(self):
+        if self.stall_stale:
+            self.stall_stale = False
+            self.stall_next = self._plan_stall()
+        nxt = self.frame_start + PAL_FRAME_CYCLES
+        if self.raster_next < nxt:
+            nxt = self.raster_next
+        if self.stall_next < nxt:
+            nxt = self.stall_next
+        if self.cia_running and self.cia_next < nxt:
+            nxt = self.cia_next
+        if self.until < nxt:
+            nxt = self.until
+        self.next_event = nxt
+
+    def _plan_raster_irq(self):
+        cmp = self.raster_cmp
+        if cmp >= PAL_LINES:
+            self.raster_next = NEVER
+            return
+        t = self.frame_start + cmp * PAL_CYCLES_PER_LINE
+        if t <= self.cycles:
+            t += PAL_FRAME_CYCLES
+        self.raster_next = t
+
+    def _plan_stall(self):
+        """Cycle at which the next badline halts the CPU"""
+        ctrl = self.mem[0xD011]
+        if not self.badlines or not ctrl & 0x10:
+            return NEVER
+        now = self.cycles
+        ys = ctrl & 7
+        first = 0x30 + ((ys - 0x30) & 7)
+        line = max(self.raster_at(now), 0x30)
+        line += (ys - line) & 7
+        frame_start = self.frame_start
+        if now >= frame_start + PAL_FRAME_CYCLES:
+            frame_start += PAL_FRAME_CYCLES
+        while line <= 0xF7:
+            t = frame_start + line * PAL_CYCLES_PER_LINE + BADLINE_STALL_AT
+            if t > self.last_stall and t + BADLINE_STALL > now:
+                return t
+            line += 8
+        return frame_start + PAL_FRAME_CYCLES + first * PAL_CYCLES_PER_LINE + BADLINE_STALL_AT
+
+    def _stall_after(self, stall):
+        """_plan_stall just after the stall at cycle stall: usually 8 lines on"""
+        t = stall + 8 * PAL_CYCLES_PER_LINE
+        if self.frame_start <= stall and t < self.frame_start + 0xF8 * PAL_CYCLES_PER_LINE:
+            return t
+        return self._plan_stall()
+
+    def _end_frame(self):
+        idle = min(self.frame_idle, PAL_FRAME_CYCLES)
+        dma = self.frame_dma
+        busy = max(PAL_FRAME_CYCLES - idle - dma, 0)
+        self.frames.append((busy, idle, dma, self.frame_late))
+        self.frame += 1
+        self.frame_start += PAL_FRAME_CYCLES
+        self.frame_idle = 0
+        self.frame_dma = 0
+        self.frame_late = 0
+        if self.section_of is not None:
+            self.section_frames.append(self.section_cycles)
+            self.section_cycles = [0] * len(self.section_cycles)
+        if self.vic_log is not None:
+            start = self.frame_start - PAL_FRAME_CYCLES
+            self.vic_last_frame = (self.vic_regs, [(t - start, a, v) for t, a, v in self.vic_log])
+            self.vic_regs = bytes(self.mem[0xD000:0xD040])
+            self.vic_log = []
+        if self.region_of is not None:
+            self.trace_frames.append((self.trace_reads, self.trace_writes))
+            self.trace_reads = [0] * len(TRACE_REGIONS)
+            self.trace_writes = [0] * len(TRACE_REGIONS)
+
+    def _events(self):
+        """Process everything due at the current cycle; runs between instructions"""
+        self.events += 1
+        if self.stall_stale:
+            self.stall_stale = False
+            self.stall_next = self._plan_stall()
+        while True:
+            now = self.cycles
+            if now >= self.frame_start + PAL_FRAME_CYCLES:
+                self._end_frame()
+                continue
+            if now >= self.raster_next:
+                if self.vic_irq & self.vic_irq_mask & 0x01:
+                    self.frame_late += 1          # the last one was never serviced
+                self.vic_irq |= 0x01
+                self.raster_raised = self.raster_next
+                self.raster_next += PAL_FRAME_CYCLES
+                continue
+            if now >= self.stall_next:
+                stall = self.stall_next + BADLINE_STALL - now
+                self.last_stall = self.stall_next
+                self.stall_next = NEVER
+                if stall > 0:
+                    self.cycles += stall
+                    self.dma += stall
+                    self.frame_dma += stall
+                self.stall_next = self._stall_after(self.last_stall)
+                continue
+            if self.cia_running and now >= self.cia_next:
+                self.cia_icr |= 0x01
+                self.cia_next += self.cia_latch + 1
+                continue
+            break
+        if not self.i and self._irq_line():
+            self._irq()
+        self._schedule()
+
+    def _irq(self):
+        if self.vic_irq & self.vic_irq_mask & 0x01 and self.raster_raised is not None:
+            if self.cycles - self.raster_raised > IRQ_LATE:
+                self.frame_late += 1
+            if not self.irq_depth:
+                self.irq_raster = self.raster_raised
+            self.raster_raised = None
+        self.irq_depth += 1
+        mem = self.mem
+        pc = self.pc
+        s = self.sp
+        mem[0x100 | s] = pc >> 8
+        mem[0x100 | ((s - 1) & 0xFF)] = pc & 0xFF
+        mem[0x100 | ((s - 2) & 0xFF)] = _get_p(self) & ~0x10
+        self.sp = (s - 3) & 0xFF
+        self.i = 1
+        self.pc = mem[0xFFFE] | (mem[0xFFFF] << 8)
+        self.cycles += 7
+        if self.section_of is not None:
+            self.section_cycles[0] += 7
+
+    def leave_irq(self):
+        """RTI out of an interrupt handler"""
+        self.irq_depth -= 1
+        if self.irq_depth or self.irq_raster is None:
+            return
+        # A raster handler that armed a line the beam passed while it ran has
+        # lost that IRQ for a whole frame
+        start, self.irq_raster = self.irq_raster, None
+        if self.vic_irq_mask & 0x01 and self.raster_cmp < PAL_LINES and not self.vic_irq & 0x01:
+            ahead = (self.raster_cmp * PAL_CYCLES_PER_LINE - (start - self.frame_start)) % PAL_FRAME_CYCLES
+            due = start + (ahead or PAL_FRAME_CYCLES)
+            if due <= self.cycles and due < self.raster_next:
+                self.frame_late += 1
+
+    def run(self, until):
+        """Execute until the cycle counter reaches until or the CPU halts"""
+        mem = self.mem
+        ops = self.handlers
+        self.until = until
+        self._schedule()
+        if self.section_of is not None:
+            self._run_sections(until)
+            return
+        if self.region_of is not None:
+            # Traced accesses are counted by the handlers
+            while not self.halted and self.cycles < until:
+                while self.cycles < self.next_event:
+                    pc = self.pc
+                    self.pc = pc + 1
+                    # Two statements: a raster poll may move self.cycles forward
+                    cyc = ops[mem[pc]](self)
+                    self.cycles += cyc
+                self._events()
+        else:
+            blocks = self.blocks
+            while not self.halted and self.cycles < until:
+                while self.cycles < self.next_event:
+                    block = blocks.get(self.pc)
+                    if block is None:
+                        block = self._compile(self.pc)
+                    block(self)
+                self._events()
+        if self.jammed is not None and self.jammed != SYS_RETURN:
+            raise RuntimeError(f'CPU jammed at ${self.jammed:04X}')
+
+    def _compile(self, pc):
+        # Code that runs only a few times (initialisation) is not worth compiling
+        visits = self.visits.get(pc, 0) + 1
+        if visits < BLOCK_HOT:
+            self.visits[pc] = visits
+            return _step
+        block = self.blocks[pc] = compile_block(self.mem, pc) or _step
+        return block
+
+    def recompile(self, pc):
+        """The code of the block at pc was rewritten: compile it again and run it"""
+        self.rewrites[pc] = self.rewrites.get(pc, 0) + 1
+        if self.rewrites[pc] > BLOCK_RECOMPILES:
+            self.blocks[pc] = _step
+        else:
+            self.blocks[pc] = compile_block(self.mem, pc) or _step
+        self.blocks[pc](self)
+
+    def _run_sections(self, until):
+        """run() with every instruction's cycles charged to its code section"""
+        mem = self.mem
+        ops = self.handlers
+        section_of = self.section_of
+        while not self.halted and self.cycles < until:
+            while self.cycles < self.next_event:
+                pc = self.pc
+                self.pc = pc + 1
+                cyc = ops[mem[pc]](self)
+                self.cycles += cyc
+                self.section_cycles[section_of[pc]] += cyc
+            self._events()
+        if self.jammed is not None and self.jammed != SYS_RETURN:
+            raise RuntimeError(f'CPU jammed at ${self.jammed:04X}')
+
+    def set_sections(self, section_map):
+        """Profile by code section; section_map is [(name, start, end), ...]"""
+        self.section_of = bytearray(0x10000)
+        for i, (name, start, end) in enumerate(section_map):
+            self.section_of[start:end] = bytes([i + 1]) * (end - start)
+        self.section_cycles = [0] * (len(section_map) + 1)
+        self.section_frames = []
+
+    def set_trace(self):
+        """Count data accesses per frame by region (TRACE_REGIONS) into trace_frames
+
+        Zero page, stack and instruction fetches are not counted, and raster
+        reads skipped by the poll loop fast-forward are not either.
+        """
+        global TRACE_HANDLERS
+        if TRACE_HANDLERS is None:
+            TRACE_HANDLERS = build_handlers(trace=True)
+        self.handlers = TRACE_HANDLERS
+        self.region_of = _TRACE_REGION_OF
+        self.trace_reads = [0] * len(TRACE_REGIONS)
+        self.trace_writes = [0] * len(TRACE_REGIONS)
+        self.trace_frames = []
+
+    def set_vic_log(self):
+        """Keep the last completed frame's VIC-II writes in vic_last_frame
+
+        vic_last_frame is (registers $D000-$D03F at the frame's start,
+        [(cycle within the frame, register, value), ...]); render_vic.py
+        turns it and memory into a picture.
+        """
+        self.vic_log = []
+        self.vic_regs = bytes(self.mem[0xD000:0xD040])
+        self.vic_last_frame = None
+
+    def set_sid_log(self):
+        """Record every SID register write as (cycle, register, value) in sid_log"""
+        self.sid_log = []
+
+    def run_frames(self, count):
+        """Run until count more frames have completed"""
+        target = self.frame + count
+        while self.frame < target and not self.halted:
+            self.run(self.frame_start + PAL_FRAME_CYCLES * (target - self.frame))
+
+
+def run_prg(data, frames, badlines=True, section_map=None, trace=False):
+    """Load a PRG, follow its SYS stub and run it for a number of frames"""
+    m = C64(badlines=badlines)
+    if section_map:
+        m.set_sections(section_map)
+    if trace:
+        m.set_trace()
+    load_addr, _ = m.load_prg(data)
+    entry = m.sys_address(load_addr) if load_addr == 0x0801 else load_addr
+    if entry is None:
+        raise ValueError('no SYS statement found in BASIC stub')
+    m.start(entry)
+    m.run_frames(frames)
+    return m
+
+
+def frame_budget(filename, frames=500, skip=1):
+    """Run a PRG headlessly and report raster time per frame against PAL budget"""
+    print(f"=== C64 Frame Budget ===")
+    print(f"File: {filename}\n")
+
+    try:
+        with open(filename, 'rb') as f:
+            data = f.read()
+    except FileNotFoundError:
+        print(f"ERROR: File not found: {filename}")
+        return False
+
+    started = time.perf_counter()
+    try:
+        m = run_prg(data, frames)
+    except (RuntimeError, ValueError) as e:
+        print(f"ERROR: {e}")
+        return False
+    elapsed = time.perf_counter() - started
+
+    stats = m.frames[skip:]
+    if not stats:
+        print("ERROR: Program stopped before completing a frame")
+        return False
+
+    busy = [s[0] for s in stats]
+    worst = max(range(len(busy)), key=busy.__getitem__)
+    dma = max(s[2] for s in stats)
+    # Over budget: no time left for the main program, or a raster IRQ
+    # handler started late (or not at all) because the previous one ran on
+    late = [skip + i for i, s in enumerate(stats) if s[3]]
+    overruns = [skip + i for i, s in enumerate(stats) if s[1] == 0 or s[3]]
+
+    print(f"Frames: {len(stats)} measured ({skip} skipped), "
+          f"{PAL_FRAME_CYCLES} cycles/frame (PAL)")
+    print(f"  Busy cycles/frame: min {min(busy)}  avg {sum(busy) // len(busy)}  "
+          f"max {busy[worst]} (frame {skip + worst})")
+    print(f"  VIC DMA cycles/frame: up to {dma}")
+    print(f"  Peak load: {100 * (busy[worst] + dma) / PAL_FRAME_CYCLES:.1f}% of frame")
+    print(f"  Late or missed raster IRQs: {sum(s[3] for s in stats)}")
+    print(f"  Emulation speed: {len(m.frames) / elapsed:.0f} frames/s")
+
+    print(f"\n=== Budget Summary ===")
+    if overruns:
+        print(f"[WARN] {len(overruns)} frame(s) over budget (first: frame {overruns[0]}): "
+              f"{len(overruns) - len(late)} never returned to the main program, "
+              f"{len(late)} with a raster IRQ late or missed")
+    else:
+        print(f"[OK] Every frame finished with raster time to spare")
+    return not overruns
+
+def print_profile(data, section_map, frames=500, skip=1):
+    """Run a PRG and print busy cycles per frame for each code section"""
+    m = run_prg(data, frames, section_map=section_map)
+    per_frame = m.section_frames[skip:]
+    if not per_frame:
+        print("ERROR: Program stopped before completing a frame")
+        return None
+
+    names = [name for name, _, _ in section_map] + ['(other/IRQ)']
+    print(f"=== Raster Time Profile ===")
+    print(f"Frames: {len(per_frame)} measured ({skip} skipped), "
+          f"{PAL_FRAME_CYCLES} cycles/frame (PAL), raster waits excluded\n")
+    print(f"  {'Section':<18} {'min':>6} {'avg':>6} {'max':>6}  {'worst':>5}  avg share")
+    rows = []
+    for i, name in enumerate(names):
+        idx = i + 1 if i < len(section_map) else 0
+        cycles = [f[idx] for f in per_frame]
+        worst = max(range(len(cycles)), key=cycles.__getitem__)
+        avg = sum(cycles) / len(cycles)
+        bar = '#' * round(40 * avg / PAL_FRAME_CYCLES)
+        print(f"  {name:<18} {min(cycles):>6} {avg:>6.0f} {cycles[worst]:>6}  "
+              f"{skip + worst:>5}  {bar}")
+        rows.append((name, min(cycles), avg, cycles[worst], skip + worst))
+
+    totals = [sum(f) for f in per_frame]
+    worst = max(range(len(totals)), key=totals.__getitem__)
+    print(f"  {'TOTAL':<18} {min(totals):>6} {sum(totals) / len(totals):>6.0f} "
+          f"{totals[worst]:>6}  {skip + worst:>5}")
+    return rows
+
+if __name__ == '__main__':
+    filename = sys.argv[1] if len(sys.argv) > 1 else 'demo.prg'
+    frames = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    sys.exit(0 if frame_budget(filename, frames) else 1)
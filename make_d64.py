@@ -1,5 +1,25 @@
 #!/usr/bin/env python3
-"""Create a D64 disk image with the demo"""
+"""Create a D64 disk image with the demo
+
+Usage: python3 make_d64.py [file.prg[:NAME] ...] [--interleave N] [-o image.d64]
+
+Without arguments, demo_packed.prg goes on demo.d64 as DEMO.  Other files are
+named after the PRG (upper case) unless a name follows a colon.
+
+Files are laid out like CBM DOS does it: starting on the track next to the
+directory and working outward, each next sector `interleave` sectors after the
+previous one, so it arrives under the head just as the drive is ready for it.
+
+As a module:
+
+    disk = D64Image('DEMO DISK', '01')
+    disk.add_file('PART1', prg1)
+    disk.add_file('PART2', prg2)
+    disk.write('demo.d64')
+"""
+
+import os
+import sys
 
 # D64 format: 35 tracks, 683 blocks (174848 bytes)
 # Track 18 is directory and BAM
@@ -14,136 +34,268 @@ TRACK_SECTORS = [
     17, 17, 17, 17, 17       # 31-35
 ]
 
+# Byte offset of the start of every track
+TRACK_OFFSETS = [0] * len(TRACK_SECTORS)
+for _t in range(2, len(TRACK_SECTORS)):
+    TRACK_OFFSETS[_t] = TRACK_OFFSETS[_t - 1] + TRACK_SECTORS[_t - 1] * 256
+
+DIR_TRACK = 18
+BAM_SECTOR = 0
+DEFAULT_INTERLEAVE = 10  # CBM DOS default for files
+DIR_INTERLEAVE = 3       # and for directory sectors
+DIR_ENTRY_SIZE = 32
+DIR_ENTRIES = (TRACK_SECTORS[DIR_TRACK] - 1) * 256 // DIR_ENTRY_SIZE  # 144
+BLOCK_DATA = 254         # 2 bytes of every sector link to the next
+PRG = 0x82               # closed PRG file
+
+# Stock 1541 timing: 300 rpm, and the drive plus the KERNAL serial transfer
+# spend about 3.4 revolutions per block between reading a sector and being
+# ready for the next one (interleave 10 puts the next sector just past that)
+REVOLUTION_SECONDS = 0.2
+BLOCK_HANDLING_SECONDS = 0.68
+TRACK_STEP_SECONDS = 0.012
+
+
 def track_offset(track):
     """Get byte offset for start of track"""
-    offset = 0
-    for t in range(1, track):
-        offset += TRACK_SECTORS[t] * 256
-    return offset
+    return TRACK_OFFSETS[track]
+
 
 def sector_offset(track, sector):
     """Get byte offset for a specific sector"""
-    return track_offset(track) + sector * 256
-
-# Create empty disk
-disk = bytearray(D64_SIZE)
-
-# Initialize BAM (Block Availability Map) at track 18, sector 0
-bam_offset = sector_offset(18, 0)
-disk[bam_offset + 0] = 18  # Directory track
-disk[bam_offset + 1] = 1   # Directory sector
-disk[bam_offset + 2] = 0x41  # DOS version (A)
-
-# BAM entries - mark all sectors free initially
-for track in range(1, 36):
-    sectors = TRACK_SECTORS[track]
-    bam_idx = bam_offset + 4 + (track - 1) * 4
-    disk[bam_idx] = sectors  # Number of free sectors
-    # Bitmap of free sectors
-    if sectors >= 8:
-        disk[bam_idx + 1] = 0xFF
-    else:
-        disk[bam_idx + 1] = (1 << sectors) - 1
-    if sectors >= 16:
-        disk[bam_idx + 2] = 0xFF
-    else:
-        disk[bam_idx + 2] = max(0, (1 << (sectors - 8)) - 1) if sectors > 8 else 0
-    if sectors >= 24:
-        disk[bam_idx + 3] = 0xFF
-    else:
-        disk[bam_idx + 3] = max(0, (1 << (sectors - 16)) - 1) if sectors > 16 else 0
-
-# Disk name at BAM + $90 (padded with $A0)
-disk_name = b"DEMO DISK"
-for i in range(16):
-    disk[bam_offset + 0x90 + i] = disk_name[i] if i < len(disk_name) else 0xA0
-
-# Disk ID at BAM + $A2
-disk[bam_offset + 0xA2] = ord('0')
-disk[bam_offset + 0xA3] = ord('1')
-disk[bam_offset + 0xA4] = 0xA0
-disk[bam_offset + 0xA5] = ord('2')
-disk[bam_offset + 0xA6] = ord('A')
-
-# Mark track 18 sector 0 and 1 as used in BAM
-bam_track18 = bam_offset + 4 + 17 * 4
-disk[bam_track18] = TRACK_SECTORS[18] - 2  # 2 sectors used
-disk[bam_track18 + 1] = 0xFF ^ 0x03  # Sectors 0,1 used
-
-# Directory at track 18, sector 1
-dir_offset = sector_offset(18, 1)
-disk[dir_offset + 0] = 0   # Next track (0 = none)
-disk[dir_offset + 1] = 0xFF  # Next sector
-
-# First directory entry
-entry = dir_offset + 2
-disk[entry + 0] = 0x82  # PRG file type
-disk[entry + 1] = 1     # File start track
-disk[entry + 2] = 0     # File start sector
-
-# Filename "DEMO" (padded with $A0)
-filename = b"DEMO"
-for i in range(16):
-    disk[entry + 3 + i] = filename[i] if i < len(filename) else 0xA0
-
-# Read our PRG file
-with open('demo.prg', 'rb') as f:
-    prg_data = f.read()
-
-# Calculate blocks needed
-prg_size = len(prg_data)
-blocks = (prg_size + 253) // 254  # 254 bytes per sector (2 for chain)
-
-disk[entry + 0x1C] = blocks & 0xFF  # File size low
-disk[entry + 0x1D] = (blocks >> 8) & 0xFF  # File size high
-
-# Write file data starting at track 1, sector 0
-current_track = 1
-current_sector = 0
-data_pos = 0
-
-for block in range(blocks):
-    offset = sector_offset(current_track, current_sector)
-
-    # Mark sector as used in BAM
-    bam_track = bam_offset + 4 + (current_track - 1) * 4
-    disk[bam_track] -= 1
-    byte_idx = current_sector // 8
-    bit_idx = current_sector % 8
-    disk[bam_track + 1 + byte_idx] &= ~(1 << bit_idx)
-
-    # Calculate next sector
-    next_sector = current_sector + 1
-    next_track = current_track
-    if next_sector >= TRACK_SECTORS[current_track]:
-        next_sector = 0
-        next_track += 1
-        if next_track == 18:  # Skip directory track
-            next_track = 19
-
-    if block < blocks - 1:
-        disk[offset + 0] = next_track
-        disk[offset + 1] = next_sector
-        chunk = prg_data[data_pos:data_pos + 254]
-        disk[offset + 2:offset + 2 + len(chunk)] = chunk
-        data_pos += 254
-    else:
-        # Last block
-        remaining = prg_size - data_pos
-        disk[offset + 0] = 0
-        disk[offset + 1] = remaining + 1  # Pointer to last byte
-        chunk = prg_data[data_pos:]
-        disk[offset + 2:offset + 2 + len(chunk)] = chunk
-
-    current_track = next_track
-    current_sector = next_sector
-
-with open('demo.d64', 'wb') as f:
-    f.write(disk)
-
-print(f"Created demo.d64 (D64 disk image)")
-print(f"Contains: DEMO ({blocks} blocks)")
-print("\nIn VirtualC64:")
-print('1. Drag demo.d64 onto window')
-print('2. Type: LOAD"*",8,1 and press Enter')
-print('3. Type: RUN and press Enter')
+    return TRACK_OFFSETS[track] + sector * 256
+
+
+def file_tracks():
+    """Tracks in allocation order: nearest to the directory first, then outward"""
+    order = []
+    for distance in range(1, 35):
+        for track in (DIR_TRACK - distance, DIR_TRACK + distance):
+            if 1 <= track <= 35:
+                order.append(track)
+    return order
+
+
+def petscii_name(name, length=16):
+    """Directory name: upper case, padded with shifted spaces ($A0)"""
+    if isinstance(name, str):
+        name = name.upper().encode('ascii')
+    if len(name) > length:
+        raise ValueError(f'name longer than {length} characters: {name!r}')
+    return bytes(name) + b'\xA0' * (length - len(name))
+
+
+def estimate_load_seconds(chain):
+    """Load time for a sector chain with the stock loader, modelling disk rotation"""
+    t = 0.0
+    track = DIR_TRACK
+    for next_track, sector in chain:
+        t += abs(next_track - track) * TRACK_STEP_SECONDS
+        track = next_track
+        # Wait for the sector to come round, read it, hand it over
+        sector_time = REVOLUTION_SECONDS / TRACK_SECTORS[track]
+        t += (sector * sector_time - t) % REVOLUTION_SECONDS
+        t += sector_time + BLOCK_HANDLING_SECONDS
+    return t
+
+
+class D64Image:
+    """A formatted 35-track disk image in memory
+
+    The image is one bytearray; sector() hands out memoryview slices of it, so
+    adding files copies every byte once.
+    """
+
+    def __init__(self, name=b"DEMO DISK", disk_id=b"01"):
+        self.data = bytearray(D64_SIZE)
+        self.buf = memoryview(self.data)
+        self.bam = self.sector(DIR_TRACK, BAM_SECTOR)
+        self.dir_sectors = []
+        self._format(name, disk_id)
+
+    def sector(self, track, sector):
+        """The 256 bytes of a sector, as a writable memoryview"""
+        if not 1 <= track <= 35 or not 0 <= sector < TRACK_SECTORS[track]:
+            raise ValueError(f'no such sector: track {track} sector {sector}')
+        offset = sector_offset(track, sector)
+        return self.buf[offset:offset + 256]
+
+    def _format(self, name, disk_id):
+        bam = self.bam
+        bam[0] = DIR_TRACK   # Directory track
+        bam[1] = 1           # Directory sector
+        bam[2] = 0x41        # DOS version (A)
+        # BAM entries - mark all sectors free initially
+        for track in range(1, 36):
+            sectors = TRACK_SECTORS[track]
+            bits = (1 << sectors) - 1
+            entry = 4 + (track - 1) * 4
+            bam[entry:entry + 4] = bytes([sectors, bits & 0xFF, bits >> 8 & 0xFF, bits >> 16])
+        # Disk name at BAM + $90, disk ID at BAM + $A2, DOS type at BAM + $A5
+        bam[0x90:0xA0] = petscii_name(name)
+        bam[0xA0:0xA2] = b'\xA0\xA0'
+        bam[0xA2:0xA4] = petscii_name(disk_id, 2)
+        bam[0xA4] = 0xA0
+        bam[0xA5:0xA7] = b'2A'
+        bam[0xA7:0xAB] = b'\xA0' * 4
+        self.mark_used(DIR_TRACK, BAM_SECTOR)
+        self._add_dir_sector(1)
+
+    # BAM
+
+    def is_free(self, track, sector):
+        return bool(self.bam[4 + (track - 1) * 4 + 1 + sector // 8] & (1 << sector % 8))
+
+    def mark_used(self, track, sector):
+        if not self.is_free(track, sector):
+            raise ValueError(f'track {track} sector {sector} is already in use')
+        entry = 4 + (track - 1) * 4
+        self.bam[entry] -= 1
+        self.bam[entry + 1 + sector // 8] &= ~(1 << sector % 8) & 0xFF
+
+    def mark_free(self, track, sector):
+        if self.is_free(track, sector):
+            raise ValueError(f'track {track} sector {sector} is already free')
+        entry = 4 + (track - 1) * 4
+        self.bam[entry] += 1
+        self.bam[entry + 1 + sector // 8] |= 1 << sector % 8
+
+    def free_blocks(self, track):
+        return self.bam[4 + (track - 1) * 4]
+
+    def blocks_free(self):
+        """Free blocks as the directory listing shows them (directory track excluded)"""
+        return sum(self.free_blocks(t) for t in range(1, 36) if t != DIR_TRACK)
+
+    def allocate(self, blocks, interleave=DEFAULT_INTERLEAVE):
+        """Mark `blocks` sectors used and return them in chain order: [(track, sector)]
+
+        The file starts on the free track nearest the directory, takes sectors
+        `interleave` apart on it and moves on outward (same side of the
+        directory track first) when it is full.
+        """
+        if not 1 <= interleave < min(TRACK_SECTORS[1:]):
+            raise ValueError(f'interleave must be 1-{min(TRACK_SECTORS[1:]) - 1}')
+        if blocks > self.blocks_free():
+            raise ValueError(f'disk full: {blocks} blocks needed, {self.blocks_free()} free')
+        track = next(t for t in file_tracks() if self.free_blocks(t))
+        sector = 0
+        chain = []
+        while len(chain) < blocks:
+            if not self.free_blocks(track):
+                # Continue outward on the same side, then the other side
+                step = -1 if track < DIR_TRACK else 1
+                side = [t for t in range(track + step, 0 if step < 0 else 36, step)
+                        if self.free_blocks(t)]
+                track = side[0] if side else next(t for t in file_tracks() if self.free_blocks(t))
+            count = TRACK_SECTORS[track]
+            sector %= count
+            while not self.is_free(track, sector):
+                sector = (sector + 1) % count
+            self.mark_used(track, sector)
+            chain.append((track, sector))
+            sector += interleave
+        return chain
+
+    # Directory
+
+    def _add_dir_sector(self, sector):
+        if self.dir_sectors:
+            last = self.sector(DIR_TRACK, self.dir_sectors[-1])
+            last[0], last[1] = DIR_TRACK, sector
+        self.mark_used(DIR_TRACK, sector)
+        block = self.sector(DIR_TRACK, sector)
+        block[0], block[1] = 0, 0xFF  # last directory sector
+        self.dir_sectors.append(sector)
+
+    def _free_dir_entry(self):
+        for sector in self.dir_sectors:
+            block = self.sector(DIR_TRACK, sector)
+            for slot in range(0, 256, DIR_ENTRY_SIZE):
+                if block[slot + 2] == 0:
+                    return block[slot + 2:slot + DIR_ENTRY_SIZE]
+        if len(self.dir_sectors) == TRACK_SECTORS[DIR_TRACK] - 1:
+            raise ValueError(f'directory full ({DIR_ENTRIES} files)')
+        # Next directory sector, DIR_INTERLEAVE on from the last one
+        count = TRACK_SECTORS[DIR_TRACK]
+        sector = (self.dir_sectors[-1] + DIR_INTERLEAVE) % count
+        while not self.is_free(DIR_TRACK, sector):
+            sector = (sector + 1) % count
+        self._add_dir_sector(sector)
+        return self.sector(DIR_TRACK, sector)[2:DIR_ENTRY_SIZE]
+
+    # Files
+
+    def add_file(self, name, data, interleave=DEFAULT_INTERLEAVE, file_type=PRG):
+        """Write a file and its directory entry; returns its sector chain
+
+        Nothing is left allocated if the name, the disk or the directory fails.
+        """
+        name = petscii_name(name)
+        data = memoryview(data)
+        blocks = max(1, (len(data) + BLOCK_DATA - 1) // BLOCK_DATA)
+        chain = self.allocate(blocks, interleave)
+        try:
+            entry = self._free_dir_entry()
+        except ValueError:
+            for track, sector in chain:
+                self.mark_free(track, sector)
+            raise
+        for block, (track, sector) in enumerate(chain):
+            out = self.sector(track, sector)
+            chunk = data[block * BLOCK_DATA:(block + 1) * BLOCK_DATA]
+            if block < blocks - 1:
+                out[0], out[1] = chain[block + 1]
+            else:
+                out[0], out[1] = 0, len(chunk) + 1  # Pointer to last byte
+            out[2:2 + len(chunk)] = chunk
+        entry[0] = file_type
+        entry[1], entry[2] = chain[0]  # File start track and sector
+        entry[3:19] = name
+        entry[28] = blocks & 0xFF       # File size low
+        entry[29] = blocks >> 8         # File size high
+        return chain
+
+    def write(self, path):
+        with open(path, 'wb') as f:
+            f.write(self.data)
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    interleave = DEFAULT_INTERLEAVE
+    output = 'demo.d64'
+    for flag in ('--interleave', '-o'):
+        if flag in args:
+            i = args.index(flag)
+            if flag == '-o':
+                output = args[i + 1]
+            else:
+                interleave = int(args[i + 1])
+            del args[i:i + 2]
+    files = args or ['demo_packed.prg:DEMO']
+
+    disk = D64Image()
+    for spec in files:
+        path, _, name = spec.partition(':')
+        name = name or os.path.splitext(os.path.basename(path))[0]
+        with open(path, 'rb') as f:
+            prg_data = f.read()
+        try:
+            chain = disk.add_file(name, prg_data, interleave)
+        except ValueError as e:
+            print(f"{path}: {e}")
+            sys.exit(1)
+        # Same file on consecutive sectors, for comparison
+        consecutive = D64Image().allocate(len(chain), 1)
+        print(f"{name.upper()}: {len(chain)} blocks from {path}, "
+              f"track {chain[0][0]} sector {chain[0][1]}, interleave {interleave}")
+        print(f"  Estimated 1541 load: {estimate_load_seconds(chain):.1f}s "
+              f"(consecutive sectors: {estimate_load_seconds(consecutive):.1f}s)")
+    disk.write(output)
+
+    print(f"Created {output} (D64 disk image, {disk.blocks_free()} blocks free)")
+    print("\nIn VirtualC64:")
+    print(f'1. Drag {output} onto window')
+    print('2. Type: LOAD"*",8,1 and press Enter')
+    print('3. Type: RUN and press Enter')
@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+"""
+Tracker-style music compiler and SID player for the demo generator
+
+A song is instruments, patterns and one order list per SID voice:
+
+    song = Song(
+        speed=4,                                    # frames per step
+        instruments={'lead': Instrument(0x40, 0x09, 0x00, 0x800)},
+        patterns={'arp': ('lead', ['C5', 'E5', 'G5', '...', 'REST'])},
+        orders=[[('arp', 0), ('arp', -3)], [...], [...]],
+    )
+
+Pattern steps are note names ('C5', 'F#3'), '...' to hold the previous step
+and 'REST' to release the gate.  Order entries are (pattern, transpose in
+semitones); each voice loops back to the start of its order list.
+
+Compiled data:
+
+    pattern   instrument index, events..., $7F
+    event     $00-$5F  note (semitone above C0) - retrigger
+              $60-$7D  hold for 1-30 steps
+              $7E      rest (gate off)
+    orders    pattern index, transpose per entry; $FF, position loops back
+
+Notes get the pattern's instrument (waveform, ADSR, pulse width), which is
+written to the SID whenever a pattern starts.  Only the span of notes the song
+actually plays is kept in the frequency table.
+
+The player is one routine called once per frame with no loops, so every call
+costs at most a fixed number of cycles; emit_player() returns that bound.
+"""
+
+from collections import namedtuple
+
+from asm6502 import imm, idx, idy, ind_y, lo, hi, ref
+
+SID = 0xD400
+PAL_CLOCK = 985248
+
+NOTE_END = 0x7F
+NOTE_REST = 0x7E
+NOTE_HOLD = 0x60
+MAX_HOLD = NOTE_REST - NOTE_HOLD
+MAX_NOTE = NOTE_HOLD - 1
+ORDER_LOOP = 0xFF
+
+# Per-voice player state, interleaved with the SID's 7-register voice stride
+# so one X index (0, 7, 14) addresses both
+ORDER, PAT_LO, PAT_HI, POS, HOLD, TRANSPOSE, WAVE = range(7)
+
+Instrument = namedtuple('Instrument', 'waveform ad sr pulse')
+Song = namedtuple('Song', 'speed instruments patterns orders')
+
+_NOTE_NAMES = {'C': 0, 'D': 2, 'E': 4, 'F': 5, 'G': 7, 'A': 9, 'B': 11}
+
+
+def note_number(name):
+    """'C0' -> 0, 'A4' -> 57, 'F#3' -> 42, 'Bb2' -> 34"""
+    n = _NOTE_NAMES[name[0]]
+    rest = name[1:]
+    if rest[:1] == '#':
+        n, rest = n + 1, rest[1:]
+    elif rest[:1] == 'b':
+        n, rest = n - 1, rest[1:]
+    return n + 12 * int(rest)
+
+
+def sid_frequency(note, clock=PAL_CLOCK):
+    """SID frequency register value for a note number, A4 = 440 Hz"""
+    hz = 440.0 * 2 ** ((note - 57) / 12)
+    return min(0xFFFF, round(hz * (1 << 24) / clock))
+
+
+def _encode_pattern(name, instrument, steps):
+    events = [instrument]
+    held = None
+    for step in steps:
+        if step == '...':
+            if held is not None and events[held] < NOTE_HOLD + MAX_HOLD - 1:
+                events[held] += 1
+            else:
+                held = len(events)
+                events.append(NOTE_HOLD)
+            continue
+        held = None
+        if step == 'REST':
+            events.append(NOTE_REST)
+        else:
+            note = note_number(step)
+            if not 0 <= note <= MAX_NOTE:
+                raise ValueError(f'pattern {name}: note out of range: {step}')
+            events.append(note)
+    if len(events) == 1:
+        raise ValueError(f'pattern {name} is empty')
+    events.append(NOTE_END)
+    if len(events) > 256:
+        raise ValueError(f'pattern {name} is longer than 256 bytes')
+    return events
+
+
+def compile_song(song):
+    """Song -> dict of byte lists: patterns, orders, order_starts and the note span"""
+    instruments = list(song.instruments)
+    names = list(song.patterns)
+    if len(song.orders) != 3:
+        raise ValueError('a song needs one order list per SID voice')
+    patterns = [_encode_pattern(name, instruments.index(song.patterns[name][0]),
+                                song.patterns[name][1]) for name in names]
+    orders, starts = [], []
+    low, high = MAX_NOTE, 0
+    for voice, order in enumerate(song.orders):
+        if not order:
+            raise ValueError(f'voice {voice + 1} has an empty order list')
+        starts.append(len(orders))
+        for pattern, transpose in order:
+            notes = [e for e in patterns[names.index(pattern)][1:] if e < NOTE_HOLD]
+            if notes:
+                low = min(low, min(notes) + transpose)
+                high = max(high, max(notes) + transpose)
+            orders += [names.index(pattern), transpose & 0xFF]
+        orders += [ORDER_LOOP, starts[-1]]
+    if low < 0 or high > 0xFF:
+        raise ValueError('transposed notes out of range')
+    if len(orders) > 256:
+        raise ValueError('order lists are longer than 256 bytes')
+    return {'patterns': patterns, 'orders': orders, 'starts': starts,
+            'instruments': [song.instruments[name] for name in instruments],
+            'low': low, 'high': high}
+
+
+def emit_player(a, song, compiled, zp, sid=SID, retrigger=None):
+    """Assemble music_play - JSR it once per frame
+
+    zp is a 3-byte zero page scratch area.  sid is where the voice registers
+    are written (the chip, or a shadow copy); with a shadow copy, pass the
+    retrigger mask table (see sid_shadow) so new notes restart the envelope.
+    Returns the worst-case cycles of one music_play call including its RTS,
+    page-crossing penalties counted.
+    """
+    start = len(a.items)
+    a.label('music_play')
+    a.dec('music_tick')
+    a.bpl('music_done')
+    a.lda(imm(song.speed - 1)); a.sta('music_tick')
+    for voice in range(2):
+        a.ldx(imm(voice * 7)); a.jsr('music_voice')
+    a.ldx(imm(14))
+    voice_start = len(a.items)
+    # Fall through into the third voice
+    a.label('music_voice')
+    a.lda(idx(ref('music_state') + HOLD))
+    a.beq('music_read')
+    a.dec(idx(ref('music_state') + HOLD))
+    a.label('music_done')
+    a.rts()
+
+    a.label('music_read')
+    a.lda(idx(ref('music_state') + PAT_LO)); a.sta(zp)
+    a.lda(idx(ref('music_state') + PAT_HI)); a.sta(zp + 1)
+    a.ldy(idx(ref('music_state') + POS))
+    a.lda(ind_y(zp))
+    a.cmp(imm(NOTE_END))
+    a.bne('music_event')
+
+    # End of pattern: next order entry (pattern, transpose)
+    a.ldy(idx(ref('music_state') + ORDER))
+    a.lda(idy('music_orders'))
+    a.cmp(imm(ORDER_LOOP))
+    a.bne('music_order')
+    a.lda(idy(ref('music_orders') + 1)); a.tay()
+    a.lda(idy('music_orders'))
+    a.label('music_order')
+    a.sta(zp + 2)
+    a.lda(idy(ref('music_orders') + 1)); a.sta(idx(ref('music_state') + TRANSPOSE))
+    a.iny(); a.iny(); a.tya(); a.sta(idx(ref('music_state') + ORDER))
+    a.ldy(zp + 2)
+    a.lda(idy('music_pattern_lo')); a.sta(idx(ref('music_state') + PAT_LO)); a.sta(zp)
+    a.lda(idy('music_pattern_hi')); a.sta(idx(ref('music_state') + PAT_HI)); a.sta(zp + 1)
+    # Pattern header: instrument
+    a.ldy(imm(0)); a.lda(ind_y(zp)); a.tay()
+    a.lda(idy('music_inst_wave')); a.sta(idx(ref('music_state') + WAVE))
+    a.lda(idy('music_inst_ad')); a.sta(idx(sid + 5))
+    a.lda(idy('music_inst_sr')); a.sta(idx(sid + 6))
+    a.lda(idy('music_inst_pw_lo')); a.sta(idx(sid + 2))
+    a.lda(idy('music_inst_pw_hi')); a.sta(idx(sid + 3))
+    a.lda(imm(1)); a.sta(idx(ref('music_state') + POS))
+    a.tay(); a.lda(ind_y(zp))
+
+    a.label('music_event')
+    a.inc(idx(ref('music_state') + POS))
+    a.cmp(imm(NOTE_HOLD))
+    a.bcc('music_note')
+    a.cmp(imm(NOTE_REST))
+    a.beq('music_rest')
+    a.and_(imm(0x1F)); a.sta(idx(ref('music_state') + HOLD))
+    a.rts()
+
+    a.label('music_rest')
+    a.lda(idx(ref('music_state') + WAVE)); a.sta(idx(sid + 4))  # gate off
+    a.rts()
+
+    a.label('music_note')
+    a.clc(); a.adc(idx(ref('music_state') + TRANSPOSE)); a.tay()
+    if retrigger is None:
+        a.lda(idx(ref('music_state') + WAVE)); a.sta(idx(sid + 4))  # gate off
+    low = compiled['low']
+    a.lda(idy(ref('music_freq_lo') - low)); a.sta(idx(sid))
+    a.lda(idy(ref('music_freq_hi') - low)); a.sta(idx(sid + 1))
+    a.lda(idx(ref('music_state') + WAVE)); a.ora(imm(1)); a.sta(idx(sid + 4))  # gate on
+    if retrigger is not None:
+        a.lda(imm(0xFE)); a.sta(idx(retrigger))  # gate off first at the next flush
+    a.rts()
+
+    # Each voice runs the routine once: at most every instruction once each
+    head = a.cost(start, voice_start, penalties=True)[1]
+    voice = a.cost(voice_start, penalties=True)[1]
+    return head + 3 * voice
+
+
+def emit_song_data(a, song, compiled):
+    """Assemble the song: state, order lists, patterns, instruments and frequencies
+
+    Returns the number of bytes emitted.
+    """
+    start = len(a.items)
+    low = compiled['low']
+    patterns = compiled['patterns']
+    instruments = compiled['instruments']
+
+    a.label('music_tick')
+    a.byte(0)
+    # Voice state, 7 bytes per voice; the first call reads the empty pattern
+    # and starts the voice's order list
+    a.label('music_state')
+    for order_start in compiled['starts']:
+        state = [0] * 7
+        state[ORDER] = order_start
+        state[PAT_LO] = lo('music_empty')
+        state[PAT_HI] = hi('music_empty')
+        a.data(state)
+    a.label('music_empty')
+    a.byte(NOTE_END)
+
+    a.label('music_orders')
+    a.data(compiled['orders'])
+    a.label('music_pattern_lo')
+    a.data(lo(f'music_pattern_{i}') for i in range(len(patterns)))
+    a.label('music_pattern_hi')
+    a.data(hi(f'music_pattern_{i}') for i in range(len(patterns)))
+    for i, events in enumerate(patterns):
+        a.label(f'music_pattern_{i}')
+        a.data(events)
+
+    a.label('music_inst_wave')
+    a.data(inst.waveform for inst in instruments)
+    a.label('music_inst_ad')
+    a.data(inst.ad for inst in instruments)
+    a.label('music_inst_sr')
+    a.data(inst.sr for inst in instruments)
+    a.label('music_inst_pw_lo')
+    a.data(inst.pulse & 0xFF for inst in instruments)
+    a.label('music_inst_pw_hi')
+    a.data(inst.pulse >> 8 for inst in instruments)
+
+    # Frequencies for the notes played; the player indexes them with the
+    # note number from `low` entries before the table
+    freqs = [sid_frequency(n) for n in range(low, compiled['high'] + 1)]
+    a.label('music_freq_lo')
+    a.data(f & 0xFF for f in freqs)
+    a.label('music_freq_hi')
+    a.data(f >> 8 for f in freqs)
+    return sum(len(item[1]) * item[2] for item in a.items[start:] if item[0] == 'data')
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Peephole optimizer for the assembler's instruction stream
+
+Runs on Assembler.items before assemble():
+
+1. Store runs - a run of "LDA #v / STA addr" pairs writing plain RAM
+   (screen, colour RAM, zero page) is regrouped by value, so every value is
+   loaded once and followed by all of its stores.  I/O registers keep their
+   order and end a run.
+2. Redundant loads - the known values of A, X and Y (and the value the N/Z
+   flags reflect) are tracked through straight-line code; an immediate load
+   that would not change the register or the flags is dropped.
+
+Knowledge is discarded at every label some operand refers to (a possible
+branch or jump target), after JSR/JMP/RTS/RTI/BRK, and at data.
+"""
+
+# Memory with side effects or ordering requirements - stores stay in place
+_IO_RANGES = [(0x0000, 0x0001), (0xD000, 0xD7FF), (0xDC00, 0xDFFF)]
+
+_REG_OF_LOAD = {'LDA': 'a', 'LDX': 'x', 'LDY': 'y'}
+_TRANSFERS = {'TAX': ('a', 'x'), 'TAY': ('a', 'y'), 'TXA': ('x', 'a'), 'TYA': ('y', 'a')}
+_STEPS = {'INX': ('x', 1), 'DEX': ('x', -1), 'INY': ('y', 1), 'DEY': ('y', -1)}
+_LOGIC = {'AND': lambda a, v: a & v, 'ORA': lambda a, v: a | v, 'EOR': lambda a, v: a ^ v}
+_FLAGS_ONLY = {'CMP', 'CPX', 'CPY', 'BIT', 'INC', 'DEC', 'ASL', 'LSR', 'ROL', 'ROR', 'PLP'}
+_NO_EFFECT = {'STA', 'STX', 'STY', 'PHA', 'PHP', 'TXS', 'NOP',
+              'CLC', 'SEC', 'CLI', 'SEI', 'CLV', 'CLD', 'SED',
+              'BPL', 'BMI', 'BVC', 'BVS', 'BCC', 'BCS', 'BNE', 'BEQ'}
+_LEAVES = {'JMP', 'JSR', 'RTS', 'RTI', 'BRK'}
+
+
+def _is_plain_ram(addr):
+    return isinstance(addr, int) and not any(lo <= addr <= hi for lo, hi in _IO_RANGES)
+
+
+def _is_store_pair(items, i):
+    if i + 1 >= len(items):
+        return False
+    load, store = items[i], items[i + 1]
+    return (load[0] == 'ins' and load[1] == 'LDA' and load[2] == 'imm' and
+            store[0] == 'ins' and store[1] == 'STA' and store[2] in ('zp', 'abs') and
+            _is_plain_ram(store[3]))
+
+
+def _value_key(v):
+    return ('int', v) if isinstance(v, int) else ('expr', id(v))
+
+
+def group_stores(items):
+    """Regroup runs of immediate stores to distinct plain-RAM addresses by value"""
+    out = []
+    i = 0
+    while i < len(items):
+        if not _is_store_pair(items, i):
+            out.append(items[i])
+            i += 1
+            continue
+        run = []
+        while _is_store_pair(items, i):
+            run.append((items[i], items[i + 1]))
+            i += 2
+        addrs = [store[3] for _, store in run]
+        if len(run) < 2 or len(set(addrs)) != len(addrs):
+            for load, store in run:
+                out.extend([load, store])
+            continue
+        groups = {}
+        for load, store in run:
+            groups.setdefault(_value_key(load[3]), []).append((load, store))
+        # The last value loaded must stay last so A (and N/Z) end up unchanged
+        last = groups.pop(_value_key(run[-1][0][3]))
+        for pairs in list(groups.values()) + [last]:
+            out.append(pairs[0][0])
+            out.extend(store for _, store in pairs)
+    return out
+
+
+def _same_flags(nz, v):
+    return nz is not None and (nz == 0) == (v == 0) and (nz & 0x80) == (v & 0x80)
+
+
+def drop_redundant_loads(items, targets):
+    """Remove immediate loads whose value is already in the register (and flags)"""
+    out = []
+    regs = {'a': None, 'x': None, 'y': None}
+    nz = None
+
+    def forget():
+        nonlocal nz
+        regs['a'] = regs['x'] = regs['y'] = None
+        nz = None
+
+    for item in items:
+        kind = item[0]
+        if kind == 'label':
+            if item[1] in targets:
+                forget()
+            out.append(item)
+            continue
+        if kind != 'ins':
+            forget()
+            out.append(item)
+            continue
+        mnemonic, mode, operand = item[1], item[2], item[3]
+        if mnemonic in _REG_OF_LOAD:
+            reg = _REG_OF_LOAD[mnemonic]
+            if mode == 'imm' and isinstance(operand, int):
+                if regs[reg] == operand and _same_flags(nz, operand):
+                    continue
+                regs[reg] = nz = operand
+            else:
+                regs[reg] = nz = None
+        elif mnemonic in _TRANSFERS:
+            src, dst = _TRANSFERS[mnemonic]
+            regs[dst] = nz = regs[src]
+        elif mnemonic in _STEPS:
+            reg, step = _STEPS[mnemonic]
+            if regs[reg] is not None:
+                regs[reg] = (regs[reg] + step) & 0xFF
+            nz = regs[reg]
+        elif mnemonic in _LOGIC:
+            if mode == 'imm' and isinstance(operand, int) and regs['a'] is not None:
+                regs['a'] = _LOGIC[mnemonic](regs['a'], operand)
+            else:
+                regs['a'] = None
+            nz = regs['a']
+        elif mnemonic in _FLAGS_ONLY:
+            if mode == 'acc':
+                regs['a'] = None
+            nz = None
+        elif mnemonic in _NO_EFFECT:
+            pass
+        elif mnemonic in _LEAVES:
+            out.append(item)
+            forget()
+            continue
+        else:
+            # ADC, SBC, PLA, TSX, undocumented opcodes...
+            forget()
+        out.append(item)
+    return out
+
+
+def optimize(asm):
+    """Optimize an Assembler's items in place; returns (instructions, bytes, cycles) saved.
+
+    Cycles are counted statically: each removed instruction once.
+    """
+    targets = asm.referenced_labels()
+    before = asm.cost()
+    count = sum(1 for item in asm.items if item[0] == 'ins')
+    items = group_stores(asm.items)
+    items = drop_redundant_loads(items, targets)
+    asm.items = items
+    after = asm.cost()
+    removed = count - sum(1 for item in items if item[0] == 'ins')
+    return removed, before[0] - after[0], before[1] - after[1]
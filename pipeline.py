@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Incremental build pipeline: sprite -> build -> validate / frame budget / d64
+
+Usage: python3 pipeline.py [--sprite IMAGE] [--force] [--jobs N]
+
+Each stage is a command with input and output files.  A stage's key is the
+hash of its command and the contents of its inputs; when the key matches the
+last successful run and the outputs still have the contents that run
+produced, the stage is skipped.  Stages whose inputs are other stages'
+outputs run after them, independent stages run concurrently.  State is kept
+in .pipeline_state.json.
+
+    sprite    png2sprite.py --sheet IMAGE build/sprite.spr   (only with --sprite)
+    build     build_demo.py                -> demo.prg, demo_packed.prg
+    validate  validate_prg.py demo.prg
+    budget    emu6502.py demo.prg
+    d64       make_d64.py                  -> demo.d64
+
+Exits non-zero when a stage fails.
+"""
+
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+STATE_FILE = '.pipeline_state.json'
+SPRITE_OUT = os.path.join('build', 'sprite.spr')
+
+# Everything build_demo.py imports to generate the program
+GENERATOR_SOURCES = ['build_demo.py', 'asm6502.py', 'peephole.py', 'raster_irq.py',
+                     'starfield.py', 'music.py', 'sid_shadow.py', 'sprites.py',
+                     'crunch.py', 'make_d64.py', 'emu6502.py']
+
+# validate_prg.py and what it imports (read_d64.py for disk images)
+VALIDATOR_SOURCES = ['validate_prg.py', 'emu6502.py', 'asm6502.py', 'read_d64.py', 'make_d64.py']
+
+Stage = namedtuple('Stage', 'name command inputs outputs')
+
+
+def stages(sprite=None):
+    """The pipeline's stages in dependency order"""
+    python = sys.executable
+    build = [python, 'build_demo.py']
+    inputs = list(GENERATOR_SOURCES)
+    result = []
+    if sprite:
+        result.append(Stage('sprite', [python, 'png2sprite.py', '--sheet', sprite, SPRITE_OUT],
+                            ['png2sprite.py', sprite], [SPRITE_OUT]))
+        build += ['--sprite', SPRITE_OUT]
+        inputs += ['png2sprite.py', SPRITE_OUT]
+    result += [
+        Stage('build', build, inputs, ['demo.prg', 'demo_packed.prg']),
+        Stage('validate', [python, 'validate_prg.py', 'demo.prg'],
+              VALIDATOR_SOURCES + ['demo.prg'], []),
+        Stage('budget', [python, 'emu6502.py', 'demo.prg'], ['emu6502.py', 'demo.prg'], []),
+        Stage('d64', [python, 'make_d64.py'], ['make_d64.py', 'demo_packed.prg'], ['demo.d64']),
+    ]
+    return result
+
+
+def file_hash(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def stage_key(stage):
+    h = hashlib.sha1(json.dumps(stage.command).encode())
+    for path in stage.inputs:
+        h.update(path.encode() + b'\0' + file_hash(path).encode())
+    return h.hexdigest()
+
+
+def up_to_date(stage, key, state):
+    record = state.get(stage.name)
+    if not record or record['key'] != key:
+        return False
+    return all(os.path.exists(path) and file_hash(path) == record['outputs'].get(path)
+               for path in stage.outputs)
+
+
+def _run(stage):
+    start = time.perf_counter()
+    proc = subprocess.run(stage.command, capture_output=True, text=True)
+    return proc, time.perf_counter() - start
+
+
+def run(pipeline, force=False, jobs=None):
+    """Run the out-of-date stages; returns True if every stage succeeded"""
+    try:
+        with open(STATE_FILE) as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        state = {}
+    producer = {path: s.name for s in pipeline for path in s.outputs}
+    deps = {s.name: {producer[p] for p in s.inputs if p in producer} for s in pipeline}
+    pending = {s.name: s for s in pipeline}
+    done, failed = set(), set()
+    ok = True
+
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        running = {}
+        while pending or running:
+            for name, stage in list(pending.items()):
+                if deps[name] & failed:
+                    print(f"[SKIP] {name}: an input stage failed")
+                    failed.add(name)
+                    del pending[name]
+                elif deps[name] <= done:
+                    del pending[name]
+                    try:
+                        key = stage_key(stage)
+                    except OSError as e:
+                        print(f"[FAIL] {name}: {e}")
+                        failed.add(name)
+                        ok = False
+                        continue
+                    if not force and up_to_date(stage, key, state):
+                        print(f"[OK]   {name}: up to date")
+                        done.add(name)
+                    else:
+                        running[pool.submit(_run, stage)] = (stage, key)
+            if not running:
+                continue
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                stage, key = running.pop(future)
+                proc, seconds = future.result()
+                output = (proc.stdout + proc.stderr).rstrip()
+                if proc.returncode == 0:
+                    print(f"[RUN]  {stage.name}: {seconds:.2f}s")
+                    state[stage.name] = {'key': key, 'outputs': {
+                        path: file_hash(path) for path in stage.outputs}}
+                    done.add(stage.name)
+                else:
+                    print(f"[FAIL] {stage.name}: exit code {proc.returncode}")
+                    state.pop(stage.name, None)
+                    failed.add(stage.name)
+                    ok = False
+                if output:
+                    print('\n'.join('       ' + line for line in output.splitlines()))
+
+    with open(STATE_FILE, 'w') as f:
+        json.dump(state, f, indent=1)
+    return ok
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    sprite = jobs = None
+    if '--sprite' in args:
+        sprite = args[args.index('--sprite') + 1]
+    if '--jobs' in args:
+        jobs = int(args[args.index('--jobs') + 1])
+    if sprite:
+        os.makedirs(os.path.dirname(SPRITE_OUT), exist_ok=True)
+    start = time.perf_counter()
+    ok = run(stages(sprite), force='--force' in args, jobs=jobs)
+    print(f"Pipeline {'finished' if ok else 'FAILED'} in {time.perf_counter() - start:.3f}s")
+    sys.exit(0 if ok else 1)
@@ -1,72 +1,216 @@
 #!/usr/bin/env python3
-"""Convert PNG to C64 sprite data (24x21 pixels, 63 bytes)"""
+"""Convert PNG to C64 sprite data (24x21 pixels, 63 bytes)
 
+Usage:
+    python3 png2sprite.py [image.png]                  print SPRITE_DATA source + preview
+    python3 png2sprite.py --batch SRC_DIR OUT_DIR      every image -> OUT_DIR/<name>.spr
+    python3 png2sprite.py --sheet IMAGE OUT.spr [W H]  animation frames -> one .spr
+
+The image is cropped to its non-white content, scaled to fit 24x21 keeping the
+aspect ratio and centred; every non-white pixel becomes a sprite pixel.
+
+.spr files are 64-byte blobs, the 63 sprite bytes and one padding byte, so
+they can be laid end to end on 64-byte blocks; an animation is several blobs
+in one file (build_demo.py --sprite FILE takes either, or an image).  Sheets
+are cut into W x H cells (default 24x21); GIFs give one frame per GIF frame.
+All frames of an animation share one crop box and scale.
+
+Batch results are cached under .sprite_cache/, keyed on the image's hash and
+the conversion parameters, so only new or changed images are converted again.
+"""
+
+import hashlib
+import os
+import sys
+
+import numpy as np
 from PIL import Image
 
-# Load image
-img = Image.open('avatar-on-white.png')
-
-# Convert to RGBA to properly detect non-white pixels
-img = img.convert('RGBA')
-
-# Get the bounding box of non-white content
-# Find actual logo bounds (non-white pixels)
-pixels = img.load()
-min_x, min_y, max_x, max_y = img.width, img.height, 0, 0
-for y in range(img.height):
-    for x in range(img.width):
-        r, g, b, a = pixels[x, y]
-        # Check if pixel is NOT white/near-white
-        if r < 250 or g < 250 or b < 250:
-            min_x = min(min_x, x)
-            min_y = min(min_y, y)
-            max_x = max(max_x, x)
-            max_y = max(max_y, y)
-
-# Crop to content
-if max_x > min_x and max_y > min_y:
-    img = img.crop((min_x, min_y, max_x + 1, max_y + 1))
-
-# Resize to fit in 24x21 while maintaining aspect ratio
-img.thumbnail((24, 21), Image.Resampling.LANCZOS)
-
-# Create a 24x21 canvas (white background)
-canvas = Image.new('RGBA', (24, 21), (255, 255, 255, 255))
-x_offset = (24 - img.width) // 2
-y_offset = (21 - img.height) // 2
-canvas.paste(img, (x_offset, y_offset), img if img.mode == 'RGBA' else None)
-
-# Convert: any non-white pixel becomes a sprite pixel
-pixels = canvas.load()
-sprite_data = []
-
-print("# C64 Sprite data - Pulumi logo (24x21 pixels)")
-print("SPRITE_DATA = [")
-
-for y in range(21):
-    row_bytes = []
-    for byte_idx in range(3):  # 3 bytes per row
-        byte_val = 0
-        for bit in range(8):
-            x = byte_idx * 8 + bit
-            if x < 24:
-                r, g, b, a = pixels[x, y]
-                # Non-white pixel = sprite pixel (threshold for anti-aliasing)
-                if r < 245 or g < 245 or b < 245:
-                    byte_val |= (1 << (7 - bit))
-        row_bytes.append(byte_val)
-
-    # Print as binary for visual clarity
-    print(f"    0b{row_bytes[0]:08b}, 0b{row_bytes[1]:08b}, 0b{row_bytes[2]:08b},  # Row {y+1}")
-    sprite_data.extend(row_bytes)
-
-print("]")
-
-# Also show ASCII art preview
-print("\n# ASCII preview:")
-for y in range(21):
-    line = ""
-    for x in range(24):
-        r, g, b, a = pixels[x, y]
-        line += "█" if (r < 245 or g < 245 or b < 245) else "."
-    print(f"# {line}")
+SPRITE_W, SPRITE_H = 24, 21
+SPRITE_BYTES = 63
+BLOB_BYTES = 64
+BOUNDS_THRESHOLD = 250   # darker than this in any channel: part of the content
+PIXEL_THRESHOLD = 245    # darker than this after scaling: a sprite pixel (anti-aliasing)
+IMAGE_EXTENSIONS = ('.png', '.gif', '.bmp')
+CACHE_DIR = '.sprite_cache'
+# Part of every cache key - change when the conversion changes
+CONVERSION = f'v1 {SPRITE_W}x{SPRITE_H} {BOUNDS_THRESHOLD} {PIXEL_THRESHOLD} lanczos'
+
+
+def _non_white(rgba, threshold):
+    return (rgba[..., :3] < threshold).any(axis=-1)
+
+
+def _content_box(mask):
+    """(left, top, right, bottom) around the True pixels, or None if there is no content"""
+    rows = np.flatnonzero(mask.any(axis=1))
+    cols = np.flatnonzero(mask.any(axis=0))
+    if len(rows) and rows[-1] > rows[0] and cols[-1] > cols[0]:
+        return cols[0], rows[0], cols[-1] + 1, rows[-1] + 1
+    return None
+
+
+def _place(img, box):
+    """Crop img (RGBA) to box, scale it to fit 24x21 keeping the aspect ratio, centre it on white"""
+    if box is not None:
+        img = img.crop(box)
+    img.thumbnail((SPRITE_W, SPRITE_H), Image.Resampling.LANCZOS)
+    canvas = Image.new('RGBA', (SPRITE_W, SPRITE_H), (255, 255, 255, 255))
+    canvas.paste(img, ((SPRITE_W - img.width) // 2, (SPRITE_H - img.height) // 2), img)
+    return canvas
+
+
+def fit_image(img):
+    """Crop img to its non-white content and centre it on a white 24x21 canvas (RGBA)"""
+    img = img.convert('RGBA')
+    return _place(img, _content_box(_non_white(np.asarray(img), BOUNDS_THRESHOLD)))
+
+
+def sprite_mask(img):
+    """24x21 boolean array of sprite pixels for an image"""
+    return _non_white(np.asarray(fit_image(img)), PIXEL_THRESHOLD)
+
+
+def pack_sprite(mask):
+    """Boolean 21x24 mask -> 63 sprite bytes (3 per row, leftmost pixel in bit 7)"""
+    return np.packbits(mask, axis=1).tobytes()
+
+
+def convert(path):
+    """The 63 sprite bytes for an image file"""
+    with Image.open(path) as img:
+        return pack_sprite(sprite_mask(img))
+
+
+def sheet_frames(img, frame_w=SPRITE_W, frame_h=SPRITE_H):
+    """Frames of an animation on white (RGBA)
+
+    Every frame of a multi-frame image (GIF, APNG), otherwise the frame_w x
+    frame_h cells of a sprite sheet, left to right and top to bottom.
+    """
+    if getattr(img, 'n_frames', 1) > 1:
+        frames = []
+        for i in range(img.n_frames):
+            img.seek(i)
+            frames.append(img.convert('RGBA'))
+    else:
+        sheet = img.convert('RGBA')
+        frames = [sheet.crop((x, y, x + frame_w, y + frame_h))
+                  for y in range(0, sheet.height - frame_h + 1, frame_h)
+                  for x in range(0, sheet.width - frame_w + 1, frame_w)]
+    if not frames:
+        raise ValueError(f'sheet is smaller than one {frame_w}x{frame_h} frame')
+    white = Image.new('RGBA', frames[0].size, (255, 255, 255, 255))
+    return [Image.alpha_composite(white, frame) for frame in frames]
+
+
+def animation_masks(frames):
+    """24x21 sprite masks for animation frames
+
+    All frames are cropped to the box around the content of any frame and
+    scaled alike, so they stay registered with each other.
+    """
+    arrays = [np.asarray(frame) for frame in frames]
+    if len({array.shape for array in arrays}) != 1:
+        raise ValueError('animation frames differ in size')
+    content = np.logical_or.reduce([_non_white(array, BOUNDS_THRESHOLD) for array in arrays])
+    box = _content_box(content)
+    return [_non_white(np.asarray(_place(frame, box)), PIXEL_THRESHOLD) for frame in frames]
+
+
+def convert_sheet(path, frame_w=SPRITE_W, frame_h=SPRITE_H):
+    """63 sprite bytes for every frame of an animated image or sprite sheet"""
+    with Image.open(path) as img:
+        return [pack_sprite(mask) for mask in animation_masks(sheet_frames(img, frame_w, frame_h))]
+
+
+def convert_cached(path, cache_dir=CACHE_DIR):
+    """convert() through the cache; returns (63 bytes, True if it came from the cache)"""
+    with open(path, 'rb') as f:
+        key = hashlib.sha1(f.read() + CONVERSION.encode()).hexdigest()
+    cached = os.path.join(cache_dir, key + '.spr')
+    if os.path.exists(cached):
+        return read_blob(cached), True
+    data = convert(path)
+    os.makedirs(cache_dir, exist_ok=True)
+    write_blob(cached, data)
+    return data, False
+
+
+def write_blob(path, data):
+    with open(path, 'wb') as f:
+        f.write(bytes(data) + bytes(BLOB_BYTES - len(data)))
+
+
+def read_blob(path):
+    """63 sprite bytes from a .spr file (63 or 64 bytes)"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    if len(data) not in (SPRITE_BYTES, BLOB_BYTES):
+        raise ValueError(f'{path}: {len(data)} bytes, not a sprite')
+    return data[:SPRITE_BYTES]
+
+
+def read_frames(path):
+    """Sprite frames (63 bytes each) from a .spr file of one or more 64-byte blobs"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    if len(data) == SPRITE_BYTES:
+        return [data]
+    if not data or len(data) % BLOB_BYTES:
+        raise ValueError(f'{path}: {len(data)} bytes, not a sprite')
+    return [data[i:i + SPRITE_BYTES] for i in range(0, len(data), BLOB_BYTES)]
+
+
+def convert_dir(src_dir, out_dir, cache_dir=CACHE_DIR):
+    """Convert every image in src_dir to out_dir/<name>.spr; returns (converted, cached) counts"""
+    os.makedirs(out_dir, exist_ok=True)
+    converted = cached = 0
+    for name in sorted(os.listdir(src_dir)):
+        stem, ext = os.path.splitext(name)
+        if ext.lower() not in IMAGE_EXTENSIONS:
+            continue
+        data, hit = convert_cached(os.path.join(src_dir, name), cache_dir)
+        write_blob(os.path.join(out_dir, stem + '.spr'), data)
+        cached += hit
+        converted += not hit
+    return converted, cached
+
+
+def print_source(data, name):
+    """SPRITE_DATA source lines and an ASCII preview"""
+    print(f"# C64 Sprite data - {name} (24x21 pixels)")
+    print("SPRITE_DATA = [")
+    for y in range(SPRITE_H):
+        row = data[y * 3:y * 3 + 3]
+        # Print as binary for visual clarity
+        print(f"    0b{row[0]:08b}, 0b{row[1]:08b}, 0b{row[2]:08b},  # Row {y+1}")
+    print("]")
+
+    print("\n# ASCII preview:")
+    bits = np.unpackbits(np.frombuffer(data, np.uint8).reshape(SPRITE_H, 3), axis=1)
+    for row in bits:
+        print("# " + "".join("█" if b else "." for b in row))
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    if args[:1] == ['--batch']:
+        if len(args) != 3:
+            print(__doc__.strip().splitlines()[4].strip())
+            sys.exit(1)
+        converted, cached = convert_dir(args[1], args[2])
+        print(f"{converted + cached} sprites in {args[2]} ({converted} converted, {cached} cached)")
+    elif args[:1] == ['--sheet']:
+        if len(args) not in (3, 5):
+            print(__doc__.strip().splitlines()[5].strip())
+            sys.exit(1)
+        size = [int(n) for n in args[3:5]] or [SPRITE_W, SPRITE_H]
+        frames = convert_sheet(args[1], *size)
+        with open(args[2], 'wb') as f:
+            for frame in frames:
+                f.write(frame + bytes(BLOB_BYTES - len(frame)))
+        print(f"{len(frames)} frames in {args[2]}")
+    else:
+        path = args[0] if args else 'avatar-on-white.png'
+        print_source(convert(path), os.path.basename(path))
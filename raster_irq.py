@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Raster interrupt chain for the demo generator
+
+Effects register at a raster line; each gets its own IRQ handler.  A handler
+acknowledges the VIC-II interrupt, runs its effect, points the raster compare
+and the IRQ vector at the next entry and leaves through the KERNAL's register
+restore, so the main program is free for work that need not be timed:
+
+    chain = RasterChain(a)
+    chain.add(49, 'bars')
+    chain.add(250, 'frame')
+    ...
+    chain.install()                       # inside SEI ... CLI
+    ...
+    chain.enter('bars')                   # label + acknowledge
+    ...effect code...
+    chain.leave('bars')                   # arm the next entry, return
+
+Handlers are entered through the KERNAL IRQ entry ($FF48 -> ($0314)), which
+has already saved A, X and Y, so effect code may use every register.
+"""
+
+from asm6502 import AsmError, imm, lo, hi, ref
+
+IRQ_VECTOR = 0x0314         # KERNAL-dispatched IRQ vector (lo, hi)
+KERNAL_IRQ_EXIT = 0xEA81    # PLA/TAY/PLA/TAX/PLA/RTI
+VIC_CTRL1 = 0xD011          # bit 7 = raster compare bit 8
+VIC_RASTER = 0xD012
+VIC_IRQ_FLAG = 0xD019
+VIC_IRQ_MASK = 0xD01A
+CIA1_ICR = 0xDC0D
+CIA2_ICR = 0xDD0D
+PAL_LINES = 312
+
+
+class RasterChain:
+    """Raster IRQ handlers, one per registered line, chained in line order"""
+
+    def __init__(self, asm):
+        self.asm = asm
+        self.entries = []   # (line, label), sorted by line
+
+    def add(self, line, label):
+        if not 0 <= line < PAL_LINES:
+            raise AsmError(f'raster line out of range: {line}')
+        if any(line == other for other, _ in self.entries):
+            raise AsmError(f'two raster IRQs on line {line}')
+        self.entries.append((line, label))
+        self.entries.sort()
+
+    def _index(self, label):
+        for i, (_, name) in enumerate(self.entries):
+            if name == label:
+                return i
+        raise AsmError(f'no raster IRQ named {label}')
+
+    def _set_line(self, line, previous=None):
+        a = self.asm
+        a.lda(imm(line & 0xFF)); a.sta(VIC_RASTER)
+        if previous is None or (previous >> 8) != (line >> 8):
+            a.lda(VIC_CTRL1)
+            if line >> 8:
+                a.ora(imm(0x80))
+            else:
+                a.and_(imm(0x7F))
+            a.sta(VIC_CTRL1)
+
+    def _set_vector(self, label):
+        a = self.asm
+        a.lda(imm(lo(ref(label)))); a.sta(IRQ_VECTOR)
+        a.lda(imm(hi(ref(label)))); a.sta(IRQ_VECTOR + 1)
+
+    def install(self):
+        """Switch from the CIA timer IRQ to the first raster IRQ (run with interrupts off)"""
+        if not self.entries:
+            raise AsmError('raster chain is empty')
+        a = self.asm
+        a.lda(imm(0x7F)); a.sta(CIA1_ICR); a.sta(CIA2_ICR)   # CIA interrupts off
+        a.lda(CIA1_ICR); a.lda(CIA2_ICR)                     # drop pending ones
+        line, label = self.entries[0]
+        self._set_line(line)
+        self._set_vector(label)
+        a.lda(imm(0x01)); a.sta(VIC_IRQ_FLAG); a.sta(VIC_IRQ_MASK)
+
+    def enter(self, label, place=None):
+        """Start the handler for an entry; place(label) puts down its entry label"""
+        self._index(label)
+        (place or self.asm.label)(label)
+        self.asm.asl(VIC_IRQ_FLAG)      # acknowledge the raster interrupt
+
+    def leave(self, label):
+        """End the handler for an entry: arm the next one and return from the IRQ"""
+        i = self._index(label)
+        if len(self.entries) > 1:
+            line = self.entries[i][0]
+            next_line, next_label = self.entries[(i + 1) % len(self.entries)]
+            self._set_line(next_line, line)
+            self._set_vector(next_label)
+        self.asm.jmp(KERNAL_IRQ_EXIT)
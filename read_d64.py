@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+D64 disk image reader, extractor and BAM checker
+
+Usage: python3 read_d64.py image.d64 ... [--extract DIR] [--validate]
+
+Lists the directory of every image and checks it: sector chains that loop or
+leave the disk, sectors used by two files (cross-linked), sectors the BAM
+marks free although a file uses them, sectors marked used that nothing
+references (leaked), free counts that disagree with the bitmaps, and
+directory block counts that disagree with the chains.  --extract writes the
+files out as NAME.prg, --validate runs validate_prg on every PRG straight from
+the image.  Exits non-zero if any image has problems.
+
+The image is memory-mapped; sectors and file blocks are memoryview slices of
+the mapping, so only read_file() copies data.  Closing the reader while such
+views are still referenced leaves the mapping to be unmapped when the last of
+them is garbage collected.
+"""
+
+import mmap
+import os
+import sys
+from collections import namedtuple
+
+from make_d64 import (TRACK_SECTORS, DIR_TRACK, BAM_SECTOR, D64_SIZE,
+                      sector_offset)
+
+FILE_TYPES = ['DEL', 'SEQ', 'PRG', 'USR', 'REL']
+
+# name is the raw directory name without the $A0 padding
+DirEntry = namedtuple('DirEntry', 'name file_type track sector blocks')
+
+
+def _valid_sector(track, sector):
+    return 1 <= track <= 35 and 0 <= sector < TRACK_SECTORS[track]
+
+
+class D64Reader:
+    """Read-only view of a 35-track D64 image (a path, or bytes already in memory)"""
+
+    def __init__(self, source):
+        self._file = self._map = None
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            data = source
+            self.name = '<memory>'
+        else:
+            self.name = source
+            self._file = open(source, 'rb')
+            self._map = data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.buf = memoryview(data)
+        # Images with the 683-byte error info appended are fine; shorter ones are not
+        if len(self.buf) < D64_SIZE:
+            self.close()
+            raise ValueError(f'{self.name}: {len(data)} bytes, not a 35-track D64 image')
+
+    def close(self):
+        if self._map is not None:
+            self.buf.release()
+            try:
+                self._map.close()
+            except BufferError:
+                pass    # sector views still exported; unmapped when they are freed
+            self._file.close()
+            self._map = self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def sector(self, track, sector):
+        """The 256 bytes of a sector, as a memoryview"""
+        if not _valid_sector(track, sector):
+            raise ValueError(f'no such sector: track {track} sector {sector}')
+        offset = sector_offset(track, sector)
+        return self.buf[offset:offset + 256]
+
+    def chain(self, track, sector):
+        """Sectors of a chain starting at (track, sector); ValueError if it is broken"""
+        chain = []
+        seen = set()
+        while True:
+            if not _valid_sector(track, sector):
+                raise ValueError(f'chain leaves the disk at track {track} sector {sector}')
+            if (track, sector) in seen:
+                raise ValueError(f'chain loops back to track {track} sector {sector}')
+            seen.add((track, sector))
+            chain.append((track, sector))
+            block = self.sector(track, sector)
+            if block[0] == 0:
+                return chain
+            track, sector = block[0], block[1]
+
+    # Directory
+
+    def dir_chain(self):
+        """Sectors of the directory"""
+        bam = self.sector(DIR_TRACK, BAM_SECTOR)
+        return self.chain(bam[0], bam[1])
+
+    def disk_name(self):
+        return bytes(self.sector(DIR_TRACK, BAM_SECTOR)[0x90:0xA0]).rstrip(b'\xA0')
+
+    def directory(self):
+        """Directory entries in order, deleted (scratched) entries skipped"""
+        entries = []
+        for track, sector in self.dir_chain():
+            block = self.sector(track, sector)
+            for slot in range(0, 256, 32):
+                entry = block[slot + 2:slot + 32]
+                if entry[0] & 0x07 == 0 and not entry[0] & 0x80:
+                    continue
+                entries.append(DirEntry(bytes(entry[3:19]).rstrip(b'\xA0'), entry[0],
+                                        entry[1], entry[2], entry[28] | entry[29] << 8))
+        return entries
+
+    # Files
+
+    def blocks(self, entry):
+        """The file's data, one memoryview per sector"""
+        chain = self.chain(entry.track, entry.sector)
+        for n, (track, sector) in enumerate(chain):
+            block = self.sector(track, sector)
+            if n < len(chain) - 1:
+                yield block[2:]
+            else:
+                if block[1] < 1:
+                    raise ValueError(f'bad last-byte pointer {block[1]} '
+                                     f'at track {track} sector {sector}')
+                yield block[2:block[1] + 1]
+
+    def read_file(self, entry):
+        """The file's contents as bytes"""
+        return b''.join(self.blocks(entry))
+
+    def find(self, name):
+        """Directory entry by name (str or bytes)"""
+        if isinstance(name, str):
+            name = name.upper().encode('ascii')
+        for entry in self.directory():
+            if entry.name == name:
+                return entry
+        raise KeyError(name)
+
+    # BAM
+
+    def bam_free(self):
+        """{track: (free count, set of free sectors)} as the BAM records them"""
+        bam = self.sector(DIR_TRACK, BAM_SECTOR)
+        free = {}
+        for track in range(1, 36):
+            entry = 4 + (track - 1) * 4
+            bits = bam[entry + 1] | bam[entry + 2] << 8 | bam[entry + 3] << 16
+            free[track] = (bam[entry], {s for s in range(TRACK_SECTORS[track]) if bits >> s & 1})
+        return free
+
+    def check(self):
+        """Consistency problems found, as a list of messages (empty if the image is fine)"""
+        problems = []
+        owner = {(DIR_TRACK, BAM_SECTOR): 'BAM'}
+
+        def claim(chain, what):
+            for ts in chain:
+                if ts in owner:
+                    problems.append(f'track {ts[0]} sector {ts[1]}: cross-linked '
+                                    f'({owner[ts]} and {what})')
+                else:
+                    owner[ts] = what
+
+        try:
+            claim(self.dir_chain(), 'directory')
+            entries = self.directory()
+        except ValueError as e:
+            return problems + [f'directory: {e}']
+        for entry in entries:
+            what = entry.name.decode('latin-1')
+            try:
+                chain = self.chain(entry.track, entry.sector)
+            except ValueError as e:
+                problems.append(f'{what}: {e}')
+                continue
+            claim(chain, what)
+            if len(chain) != entry.blocks:
+                problems.append(f'{what}: directory says {entry.blocks} blocks, '
+                                f'chain has {len(chain)}')
+
+        for track, (count, free) in self.bam_free().items():
+            if count != len(free):
+                problems.append(f'track {track}: BAM free count {count}, '
+                                f'bitmap has {len(free)} free sectors')
+            for sector in range(TRACK_SECTORS[track]):
+                used_by = owner.get((track, sector))
+                if used_by and sector in free:
+                    problems.append(f'track {track} sector {sector}: used by {used_by} '
+                                    f'but free in the BAM')
+                elif not used_by and sector not in free:
+                    problems.append(f'track {track} sector {sector}: allocated in the BAM '
+                                    f'but not used (leaked)')
+        return problems
+
+
+def file_type_name(file_type):
+    name = FILE_TYPES[file_type & 0x07] if file_type & 0x07 < len(FILE_TYPES) else '???'
+    return name + ('<' if file_type & 0x40 else '') + ('' if file_type & 0x80 else '*')
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    extract_dir = None
+    validate = '--validate' in args
+    if validate:
+        args.remove('--validate')
+    if '--extract' in args:
+        i = args.index('--extract')
+        extract_dir = args[i + 1]
+        del args[i:i + 2]
+        os.makedirs(extract_dir, exist_ok=True)
+    if not args:
+        print(__doc__.strip().splitlines()[2])
+        sys.exit(1)
+
+    if validate:
+        import validate_prg
+
+    failed = 0
+    for path in args:
+        try:
+            disk = D64Reader(path)
+        except (OSError, ValueError) as e:
+            print(f"{path}: {e}")
+            failed += 1
+            continue
+        with disk:
+            print(f'{path}: "{disk.disk_name().decode("latin-1")}"')
+            problems = disk.check()
+            try:
+                entries = disk.directory()
+            except ValueError:
+                entries = []
+            for entry in entries:
+                name = entry.name.decode('latin-1')
+                print(f'  {entry.blocks:<4} "{name}" {file_type_name(entry.file_type)}')
+                if entry.file_type & 0x07 != 2 or not (extract_dir or validate):
+                    continue
+                try:
+                    data = disk.read_file(entry)
+                except ValueError:
+                    continue  # already reported by check()
+                if extract_dir:
+                    with open(os.path.join(extract_dir, f'{name}.prg'), 'wb') as f:
+                        f.write(data)
+                if validate and not validate_prg.validate_prg(f'{path}:{name}', data):
+                    problems.append(f'{name}: validate_prg found issues')
+            for problem in problems:
+                print(f"  [ERROR] {problem}")
+            if problems:
+                failed += 1
+            else:
+                print("  [OK] BAM and sector chains consistent")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""
+Headless VIC-II renderer - screenshots of a PRG without VICE
+
+Usage: python3 render_vic.py [file.prg] [-o screenshot.png] [--frames N]
+                             [--chargen FILE] [--normal] [--bench]
+
+Runs the PRG on emu6502 for N frames (default 250, about 5 seconds) and
+draws the last one as a 403x284 PAL frame (VICE's full borders; --normal
+crops to VICE's default 384x272).  The picture is composed from memory at the
+end of the frame - screen and colour RAM, character set, sprite pointers and
+data - and the VIC-II registers, with border/background colour, scroll and
+mode registers taken per raster line from the writes the program made during
+the frame.  A write takes effect on the line it happens in if it comes before
+the display window starts, otherwise from the next line.
+
+Covers standard and multicolour text mode, 38 columns / 24 rows, the X/Y
+scroll registers and all eight sprites (multicolour, X/Y expanded, behind or
+in front of the text).  Bitmap and extended colour modes are not drawn.
+
+The character ROM is not part of this repository: pass --chargen or set
+C64_CHARGEN to a 4096-byte image (VICE ships one as C64/chargen).  Without
+one, every character other than a space is drawn as a solid block, which
+keeps layout regressions visible.
+"""
+
+import os
+import sys
+import time
+
+import numpy as np
+
+import emu6502
+
+WIDTH, HEIGHT = 403, 284
+FIRST_LINE = 16              # first raster line in the picture
+LEFT = 46                    # border pixels left of the 320-pixel window
+NORMAL = (slice(0, 272), slice(14, 398))     # VICE's default 384x272 view
+DISPLAY_CYCLE = 16           # raster writes before this cycle hit the same line
+
+# Pepto's PAL palette
+PALETTE = np.array([
+    0x000000, 0xFFFFFF, 0x68372B, 0x70A4B2, 0x6F3D86, 0x588D43, 0x352879, 0xB8C76F,
+    0x6F4F25, 0x433900, 0x9A6759, 0x444444, 0x6C6C6C, 0x9AD284, 0x6C5EB5, 0x959595,
+], dtype=np.uint32)
+RGB = np.stack([(PALETTE >> 16) & 0xFF, (PALETTE >> 8) & 0xFF, PALETTE & 0xFF],
+               axis=1).astype(np.uint8)
+
+CHARGEN_PATHS = ['chargen', 'chargen.bin', '/usr/share/vice/C64/chargen',
+                 '/usr/lib/vice/C64/chargen', '/usr/local/share/vice/C64/chargen']
+
+_BITS = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).astype(bool)
+
+
+def load_chargen(path=None):
+    """The 4096-byte character ROM as a uint8 array, or None if there is none"""
+    candidates = [path] if path else [os.environ.get('C64_CHARGEN')] + CHARGEN_PATHS
+    for candidate in candidates:
+        if candidate and os.path.exists(candidate):
+            with open(candidate, 'rb') as f:
+                data = f.read()
+            if len(data) != 4096:
+                raise ValueError(f'{candidate}: character ROM must be 4096 bytes, not {len(data)}')
+            return np.frombuffer(data, dtype=np.uint8)
+    if path:
+        raise FileNotFoundError(path)
+    return None
+
+
+def _placeholder_chargen():
+    rom = np.full((512, 8), 0xFF, dtype=np.uint8)
+    for space in (0x20, 0x60, 0x120, 0x160):
+        rom[space] = 0
+    return rom.ravel()
+
+
+def vic_memory(mem, chargen, bank):
+    """The 16K the VIC-II sees in bank (with the character ROM at $1000 in banks 0/2)"""
+    view = np.frombuffer(bytes(mem[bank:bank + 0x4000]), dtype=np.uint8).copy()
+    if bank in (0x0000, 0x8000):
+        view[0x1000:0x2000] = chargen
+    return view
+
+
+def line_registers(regs, writes):
+    """(312, 64) array of VIC-II registers in effect on each raster line"""
+    table = np.empty((emu6502.PAL_LINES, 0x40), dtype=np.uint8)
+    table[:] = np.frombuffer(regs, dtype=np.uint8)
+    for t, a, v in writes:
+        line, cycle = divmod(t, emu6502.PAL_CYCLES_PER_LINE)
+        line += cycle >= DISPLAY_CYCLE
+        if line < emu6502.PAL_LINES:
+            table[line:, a & 0x3F] = v
+    return table
+
+
+def _text(vic, d018, rows, colors):
+    """Pixel colours (or -1 for background) of the text screen, as (200, 320)
+
+    rows are the registers on each of the 200 lines (for multicolour mode).
+    """
+    screen = vic[(d018 >> 4) * 0x400:][:1000].reshape(25, 40)
+    charset = vic[((d018 >> 1) & 7) * 0x800:][:0x800]
+    r = np.arange(200)
+    glyph_rows = charset[screen[r // 8].astype(np.intp) * 8 + (r % 8)[:, None]]    # (200, 40)
+    color = np.repeat(colors.reshape(25, 40)[r // 8], 8, axis=1)                 # (200, 320)
+    bits = _BITS[glyph_rows].reshape(200, 320)
+    pixels = np.where(bits, color, -1).astype(np.int16)
+
+    multi = rows[:, 0x16] & 0x10
+    if multi.any():
+        # Multicolour characters: colour RAM bit 3, pixel pairs
+        pairs = ((glyph_rows[..., None] >> np.array([6, 4, 2, 0])) & 3)               # (200, 40, 4)
+        pairs = np.repeat(pairs.reshape(200, 160), 2, axis=1)
+        lookup = np.stack([np.full(200, -1), rows[:, 0x22] & 15, rows[:, 0x23] & 15,
+                           np.full(200, -1)], axis=1)
+        mc = lookup[r[:, None], pairs]
+        mc = np.where(pairs == 3, color & 7, mc)
+        use = (multi[:, None] != 0) & (color & 8 != 0)
+        pixels = np.where(use, mc, pixels)
+    return pixels
+
+
+def _sprites(vic, regs, screen_base):
+    """[(number, x, y, pixels (-1 = transparent), behind text)] for enabled sprites"""
+    sprites = []
+    enable = regs[0x15]
+    for n in range(7, -1, -1):
+        bit = 1 << n
+        if not enable & bit:
+            continue
+        data = vic[int(vic[screen_base + 0x3F8 + n]) * 64:][:63].reshape(21, 3)
+        color = regs[0x27 + n] & 15
+        if regs[0x1C] & bit:
+            pairs = np.repeat(((data[..., None] >> np.array([6, 4, 2, 0])) & 3).reshape(21, 12), 2, axis=1)
+            pixels = np.array([-1, regs[0x25] & 15, color, regs[0x26] & 15], dtype=np.int16)[pairs]
+        else:
+            pixels = np.where(_BITS[data].reshape(21, 24), color, -1).astype(np.int16)
+        if regs[0x1D] & bit:
+            pixels = np.repeat(pixels, 2, axis=1)
+        if regs[0x17] & bit:
+            pixels = np.repeat(pixels, 2, axis=0)
+        x = regs[2 * n] | (0x100 if regs[0x10] & bit else 0)
+        sprites.append((n, x, regs[2 * n + 1], pixels, bool(regs[0x1B] & bit)))
+    return sprites
+
+
+def _blit(frame, pixels, top, left):
+    h, w = pixels.shape
+    y0, x0 = max(top, 0), max(left, 0)
+    y1, x1 = min(top + h, HEIGHT), min(left + w, WIDTH)
+    if y0 >= y1 or x0 >= x1:
+        return
+    src = pixels[y0 - top:y1 - top, x0 - left:x1 - left]
+    dst = frame[y0:y1, x0:x1]
+    np.copyto(dst, src, where=src >= 0)
+
+
+def render(mem, regs, writes, chargen=None):
+    """One frame as a (284, 403) array of colour numbers
+
+    mem is the 64K memory, regs the VIC-II registers at the start of the frame
+    and writes its (cycle, register, value) writes (emu6502 set_vic_log()).
+    """
+    if chargen is None:
+        chargen = _placeholder_chargen()
+    table = line_registers(regs, writes)
+    rows = table[FIRST_LINE:FIRST_LINE + HEIGHT].astype(np.int16)
+    final = [int(v) for v in table[-1]]
+    bank = (3 - (mem[0xDD00] & 3)) * 0x4000
+    vic = vic_memory(mem, chargen, bank)
+    colors = (np.frombuffer(bytes(mem[0xD800:0xD800 + 1000]), dtype=np.uint8) & 15).astype(np.int16)
+
+    frame = np.repeat((rows[:, 0x21] & 15)[:, None], WIDTH, axis=1)
+
+    # The text window: character row r is on raster line 48 + YSCROLL + r
+    yscroll = int(table[51, 0x11] & 7)
+    text_rows = table[48 + yscroll:248 + yscroll].astype(np.int16)
+    text = _text(vic, int(final[0x18]), text_rows, colors)
+    top = 48 + yscroll - FIRST_LINE
+    xscroll = text_rows[:, 0x16] & 7
+    cols = np.arange(320)[None, :] - xscroll[:, None]
+    text = np.where(cols >= 0, np.take_along_axis(text, np.maximum(cols, 0), axis=1), -1)
+
+    sprites = _sprites(vic, final, (int(final[0x18]) >> 4) * 0x400)
+    # Sprites behind the text first, then the text, then sprites in front;
+    # lower numbered sprites are drawn last so they end up on top
+    for _, x, y, pixels, behind in sprites:
+        if behind:
+            _blit(frame, pixels, y - FIRST_LINE, x - 24 + LEFT)
+    _blit(frame, text, top, LEFT)
+    for _, x, y, pixels, behind in sprites:
+        if not behind:
+            _blit(frame, pixels, y - FIRST_LINE, x - 24 + LEFT)
+
+    # Border: outside the 320x200 window (304x192 with CSEL/RSEL clear),
+    # or everywhere while the display is off
+    border = (rows[:, 0x20] & 15)[:, None]
+    line = np.arange(FIRST_LINE, FIRST_LINE + HEIGHT)[:, None]
+    rsel = (rows[:, 0x11:0x12] & 8) != 0
+    csel = (rows[:, 0x16:0x17] & 8) != 0
+    den = (table[0x30, 0x11] & 0x10) != 0
+    inside_y = np.where(rsel, (line >= 51) & (line < 251), (line >= 55) & (line < 247))
+    x = np.arange(WIDTH)[None, :]
+    inside_x = np.where(csel, (x >= LEFT) & (x < LEFT + 320), (x >= LEFT + 7) & (x < LEFT + 311))
+    inside = inside_y & inside_x & den
+    return np.where(inside, frame, border).astype(np.uint8)
+
+
+def to_rgb(frame, normal=False):
+    """Colour numbers to an RGB image array; normal crops to 384x272"""
+    if normal:
+        frame = frame[NORMAL]
+    return RGB[frame]
+
+
+def save_png(frame, path, normal=False):
+    from PIL import Image
+    Image.fromarray(to_rgb(frame, normal)).save(path)
+
+
+def render_prg(data, frames, chargen=None, every=1):
+    """Run a PRG and yield (frame number, picture) for every every-th frame"""
+    m = emu6502.C64()
+    load_addr, _ = m.load_prg(data)
+    entry = m.sys_address(load_addr) if load_addr == 0x0801 else load_addr
+    if entry is None:
+        raise ValueError('no SYS statement found in BASIC stub')
+    m.set_vic_log()
+    m.start(entry)
+    for _ in range(frames // every):
+        m.run_frames(every)
+        if m.halted:
+            break
+        regs, writes = m.vic_last_frame
+        yield m.frame, render(m.mem, regs, writes, chargen)
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    options = {'-o': 'screenshot.png', '--frames': '250', '--chargen': None}
+    for flag in list(options):
+        if flag in args:
+            i = args.index(flag)
+            options[flag] = args[i + 1]
+            del args[i:i + 2]
+    normal = '--normal' in args
+    bench = '--bench' in args
+    args = [arg for arg in args if arg not in ('--normal', '--bench')]
+    filename = args[0] if args else 'demo.prg'
+    frames = int(options['--frames'])
+    try:
+        with open(filename, 'rb') as f:
+            data = f.read()
+        chargen = load_chargen(options['--chargen'])
+        if chargen is None:
+            print("No character ROM found (--chargen / C64_CHARGEN): drawing characters as blocks")
+        last = None
+        for last in render_prg(data, frames, chargen, every=frames):
+            pass
+    except (OSError, ValueError, RuntimeError) as e:
+        print(f"ERROR: {e}")
+        sys.exit(1)
+    if last is None:
+        print("ERROR: Program stopped before completing a frame")
+        sys.exit(1)
+    number, frame = last
+    save_png(frame, options['-o'], normal)
+    print(f"Rendered frame {number} of {filename} to {options['-o']}")
+    if bench:
+        m = emu6502.run_prg(data, 2)
+        m.set_vic_log()
+        m.run_frames(1)
+        regs, writes = m.vic_last_frame
+        count = 200
+        start = time.perf_counter()
+        for _ in range(count):
+            render(m.mem, regs, writes, chargen)
+        print(f"Renderer: {count / (time.perf_counter() - start):.0f} frames/s")
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+SID shadow registers, flushed to the chip once per frame
+
+The player and effects write sid_shadow (25 bytes, same layout as $D400-$D418)
+instead of the SID.  emit_flush() assembles one unrolled routine that copies
+all 25 registers in a fixed order and a fixed number of cycles, so all sound
+changes of a frame reach the chip together at a known raster line.
+
+Several writes to a shadow control register in one frame collapse into the
+last one, so a note restart is requested separately: storing $FE in
+sid_retrigger+X (X = 0, 7, 14 like the voice registers) makes the next flush
+write the control register once with the gate cleared before writing it for
+real.  The flush sets the masks back to $FF.
+"""
+
+from asm6502 import imm, ref
+
+SID = 0xD400
+SID_REGISTERS = 25
+VOICE_CTRL = (4, 11, 18)
+FILTER_REGISTERS = range(21, 25)
+
+
+def emit_flush(a):
+    """Assemble the flush (no label, no RTS); returns its cycle count"""
+    start = len(a.items)
+    shadow = ref('sid_shadow')
+    for voice, ctrl in enumerate(VOICE_CTRL):
+        base = voice * 7
+        # Gate off first when a retrigger is pending (mask $FE), else a no-op rewrite
+        a.lda(shadow + ctrl); a.and_(ref('sid_retrigger') + base); a.sta(SID + ctrl)
+        for reg in range(base, base + 7):
+            if reg != ctrl:
+                a.lda(shadow + reg); a.sta(SID + reg)
+        a.lda(shadow + ctrl); a.sta(SID + ctrl)
+    for reg in FILTER_REGISTERS:
+        a.lda(shadow + reg); a.sta(SID + reg)
+    a.lda(imm(0xFF))
+    for voice in range(len(VOICE_CTRL)):
+        a.sta(ref('sid_retrigger') + voice * 7)
+    return a.cost(start)[1]
+
+
+def emit_shadow(a, registers=None):
+    """Assemble sid_shadow with initial register values ({register: value}) and sid_retrigger"""
+    values = [0] * SID_REGISTERS
+    for reg, v in (registers or {}).items():
+        values[reg] = v
+    a.label('sid_shadow')
+    a.data(values)
+    a.label('sid_retrigger')
+    a.data([0xFF] * 15)
@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+"""
+Offline SID renderer - a PRG's music as a WAV file, without real-time playback
+
+Usage: python3 sid_wav.py [file.prg] [-o music.wav] [--seconds S]
+                          [--log FILE] [--from-log FILE] [--compare OTHER]
+
+Runs the PRG on emu6502 for S seconds (default 30) recording every write to
+$D400-$D418 with its cycle, then renders the register log with a vectorized
+SID model: 24-bit phase accumulators with triangle (ring modulation),
+sawtooth, pulse and noise waveforms (combined waveforms ANDed), piecewise
+ADSR envelopes started and released by the gate bit, the 2-pole filter
+(low/band/high pass, cutoff, resonance, routing) applied per 20 ms block in
+the frequency domain, voice 3 off and the master volume.  Hard sync and the
+analogue quirks of a real chip are not modelled.
+
+--log writes the register log as text ("cycle register value" per line), which
+diffs well between builds; --from-log renders a saved log without running the
+emulator.  --compare renders OTHER (a PRG or a log) too and reports how far
+the two differ.
+
+Prints the level of every voice and the clicks found - a waveform switched
+off or the test bit set while a voice is sounding, and master volume jumps -
+and exits non-zero if there are clicks or a silent voice.
+"""
+
+import hashlib
+import sys
+import wave
+
+import numpy as np
+
+import emu6502
+
+CLOCK = 985248               # PAL phi2
+RATE = 44100
+BLOCK = 882                  # filter parameters are sampled every 20 ms
+FFT_SIZE = 2048
+
+VOICE_BASE = (0, 7, 14)
+GATE, SYNC, RING, TEST = 0x01, 0x02, 0x04, 0x08
+TRIANGLE, SAWTOOTH, PULSE, NOISE = 0x10, 0x20, 0x40, 0x80
+
+# Envelope rates: milliseconds for a full attack, decay or release
+ATTACK_MS = [2, 8, 16, 24, 38, 56, 68, 80, 100, 250, 500, 800, 1000, 3000, 5000, 8000]
+DECAY_MS = [3 * ms for ms in ATTACK_MS]
+# Decay and release are exponential; this many time constants take 255 to 1
+DECAY_STEPS = np.log(255)
+
+CLICK_LEVEL = 32             # envelope level above which a hard cut is audible
+SILENT_RMS = 1e-3            # relative to full scale
+
+_noise = None
+
+
+def capture(data, seconds):
+    """Run a PRG; returns its SID writes as [(cycle, register, value), ...]"""
+    m = emu6502.C64()
+    load_addr, _ = m.load_prg(data)
+    entry = m.sys_address(load_addr) if load_addr == 0x0801 else load_addr
+    if entry is None:
+        raise ValueError('no SYS statement found in BASIC stub')
+    m.set_sid_log()
+    m.start(entry)
+    m.run_frames(round(seconds * CLOCK / emu6502.PAL_FRAME_CYCLES))
+    return m.sid_log
+
+
+def write_log(log, path):
+    with open(path, 'w') as f:
+        f.writelines(f'{t} {reg:02X} {v:02X}\n' for t, reg, v in log)
+
+
+def read_log(path):
+    with open(path) as f:
+        return [(int(t), int(reg, 16), int(v, 16)) for t, reg, v in (line.split() for line in f)]
+
+
+def registers(log, samples):
+    """(25, samples) array: every SID register's value at each output sample"""
+    t = np.array([w[0] for w in log], dtype=np.int64)
+    reg = np.array([w[1] for w in log], dtype=np.int64)
+    val = np.array([w[2] for w in log], dtype=np.uint8)
+    sample_cycles = (np.arange(samples, dtype=np.int64) * CLOCK) // RATE
+    # The first sample each write is heard at; the log is in cycle order
+    first = np.searchsorted(sample_cycles, t, side='left')
+    out = np.zeros((25, samples), dtype=np.uint8)
+    for r in range(25):
+        mask = (reg == r) & (first < samples)
+        if mask.any():
+            # Index of the register's latest write at every sample (-1: none yet)
+            latest = np.full(samples, -1, dtype=np.int64)
+            np.maximum.at(latest, first[mask], np.arange(mask.sum()))
+            latest = np.maximum.accumulate(latest)
+            out[r] = np.where(latest >= 0, val[mask][np.maximum(latest, 0)], 0)
+    return out
+
+
+def _noise_table(count=1 << 16):
+    """Output of the noise LFSR for count clocks"""
+    global _noise
+    if _noise is None:
+        lfsr = 0x7FFFF8
+        out = np.empty(count, dtype=np.int64)
+        for i in range(count):
+            lfsr = ((lfsr << 1) | (((lfsr >> 22) ^ (lfsr >> 17)) & 1)) & 0x7FFFFF
+            out[i] = (((lfsr >> 22) & 1) << 11 | ((lfsr >> 20) & 1) << 10 |
+                      ((lfsr >> 16) & 1) << 9 | ((lfsr >> 13) & 1) << 8 |
+                      ((lfsr >> 11) & 1) << 7 | ((lfsr >> 7) & 1) << 6 |
+                      ((lfsr >> 4) & 1) << 5 | ((lfsr >> 2) & 1) << 4)
+        _noise = out
+    return _noise
+
+
+def _phases(regs):
+    """Accumulated oscillator phase (not wrapped) per voice, as float64 (3, samples)"""
+    phases = []
+    for base in VOICE_BASE:
+        freq = regs[base].astype(np.float64) + regs[base + 1].astype(np.float64) * 256
+        phases.append(np.cumsum(freq * (CLOCK / RATE)))
+    return phases
+
+
+def _waveform(regs, phases, voice):
+    """12-bit waveform output of a voice, centred on zero"""
+    base = VOICE_BASE[voice]
+    ctrl = regs[base + 4]
+    total = phases[voice]
+    phase = total.astype(np.int64) & 0xFFFFFF
+    msb = phase >> 23
+    ring_source = phases[(voice + 2) % 3].astype(np.int64) >> 23 & 1
+    msb = np.where(ctrl & RING, msb ^ ring_source, msb)
+    tri = np.where(msb, ~(phase >> 11) & 0xFFF, (phase >> 11) & 0xFFF)
+    saw = phase >> 12
+    pw = (regs[base + 2].astype(np.int64) | (regs[base + 3].astype(np.int64) & 0x0F) << 8)
+    pulse = np.where(saw >= pw, 0xFFF, 0)
+    noise_table = _noise_table()
+    noise = noise_table[(total.astype(np.int64) >> 20) % len(noise_table)]
+
+    wave = np.full(len(ctrl), 0xFFF, dtype=np.int64)
+    for bit, form in ((TRIANGLE, tri), (SAWTOOTH, saw), (PULSE, pulse), (NOISE, noise)):
+        wave = np.where(ctrl & bit, wave & form, wave)
+    sounding = ((ctrl & 0xF0) != 0) & ((ctrl & TEST) == 0)
+    return np.where(sounding, wave - 2048, 0), sounding
+
+
+def _envelope_segment(on, level, ad, sr, seconds):
+    """Envelope values at seconds after a gate change that left it at level"""
+    if not on:
+        release = DECAY_MS[sr & 15] / 1000
+        return level * np.exp(-seconds * DECAY_STEPS / release)
+    attack = ATTACK_MS[ad >> 4] / 1000
+    decay = DECAY_MS[ad & 15] / 1000
+    sustain = (sr >> 4) * 17
+    peak_at = (255 - level) * attack / 255
+    rise = level + seconds * 255 / attack
+    fall = sustain + (255 - sustain) * np.exp(-(seconds - peak_at) * DECAY_STEPS / decay)
+    return np.where(seconds < peak_at, rise, fall)
+
+
+def envelope(log, regs, voice, samples):
+    """ADSR envelope (0-255) of a voice at every sample"""
+    ctrl_reg = VOICE_BASE[voice] + 4
+    changes = []
+    gate = 0
+    for t, reg, v in log:
+        if reg == ctrl_reg and (v & GATE) != gate:
+            gate = v & GATE
+            changes.append((t * RATE // CLOCK, gate))
+    env = np.zeros(samples)
+    level = 0.0
+    ends = [start for start, _ in changes[1:]] + [samples]
+    for (start, on), end in zip(changes, ends):
+        start, end = min(start, samples), min(end, samples)
+        if start >= samples:
+            break
+        ad = int(regs[VOICE_BASE[voice] + 5][start])
+        sr = int(regs[VOICE_BASE[voice] + 6][start])
+        seconds = np.arange(end - start + 1) / RATE
+        values = _envelope_segment(on, level, ad, sr, seconds)
+        env[start:end] = values[:-1]
+        level = float(values[-1])
+    return env
+
+
+def _filter(signal, regs):
+    """The SID filter over signal, with its parameters taken per BLOCK samples"""
+    samples = len(signal)
+    blocks = -(-samples // BLOCK)
+    starts = np.arange(blocks) * BLOCK
+    cutoff = (regs[22][starts].astype(np.float64) * 8 + (regs[21][starts] & 7))
+    fc = np.minimum(30 + cutoff * 5.8, RATE * 0.45)
+    q = 0.707 * 2 ** ((regs[23][starts] >> 4) / 8)
+    mode = regs[24][starts]
+    freq = np.fft.rfftfreq(FFT_SIZE, 1 / RATE)
+    s = 1j * freq[None, :] / fc[:, None]
+    denom = s * s + s / q[:, None] + 1
+    response = (np.where((mode & 0x10)[:, None] != 0, 1, 0) +
+                np.where((mode & 0x20)[:, None] != 0, s, 0) +
+                np.where((mode & 0x40)[:, None] != 0, s * s, 0)) / denom
+
+    x = np.zeros(blocks * BLOCK)
+    x[:samples] = signal
+    y = np.fft.irfft(np.fft.rfft(x.reshape(blocks, BLOCK), FFT_SIZE, axis=1) * response,
+                     FFT_SIZE, axis=1)
+    # Overlap-add the blocks' filtered output and ringing tails
+    span = -(-FFT_SIZE // BLOCK)
+    y = np.pad(y, ((0, 0), (0, span * BLOCK - FFT_SIZE))).reshape(blocks, span, BLOCK)
+    out = np.zeros((blocks + span, BLOCK))
+    for k in range(span):
+        out[k:k + blocks] += y[:, k]
+    return out.ravel()[:samples]
+
+
+def render(log, seconds):
+    """(mix in -1..1, per-voice outputs, clicks) for a register log
+
+    clicks are (seconds, description) pairs.
+    """
+    samples = int(seconds * RATE)
+    regs = registers(log, samples)
+    phases = _phases(regs)
+    routing = regs[23]
+    mode = regs[24]
+    volume = (mode & 15) / 15
+    filtered = np.zeros(samples)
+    direct = np.zeros(samples)
+    voices = []
+    clicks = []
+    loudest = np.zeros(samples)
+    for voice in range(3):
+        wave, sounding = _waveform(regs, phases, voice)
+        env = envelope(log, regs, voice, samples)
+        loudest = np.maximum(loudest, np.where(sounding, env, 0))
+        out = wave * env / 255
+        voices.append(out / 2048)
+        routed = (routing >> voice) & 1 != 0
+        filtered += np.where(routed, out, 0)
+        muted = voice == 2 and (mode & 0x80 != 0)
+        direct += np.where(routed | muted, 0, out)
+        cut = np.flatnonzero(sounding[:-1] & ~sounding[1:] & (env[1:] > CLICK_LEVEL)) + 1
+        clicks += [(i / RATE, f'voice {voice + 1} cut off at envelope level {env[i]:.0f}')
+                   for i in cut]
+    jumps = np.flatnonzero((np.abs(np.diff((mode & 15).astype(np.int16))) >= 4) &
+                           (loudest[1:] > CLICK_LEVEL)) + 1
+    clicks += [(i / RATE, f'volume {mode[i - 1] & 15} -> {mode[i] & 15}') for i in jumps]
+    mix = (_filter(filtered, regs) + direct) * volume / (3 * 2048)
+    return mix, voices, sorted(clicks)
+
+
+def write_wav(mix, path):
+    pcm = (np.clip(mix, -1, 1) * 32767).astype('<i2')
+    with wave.open(path, 'wb') as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(RATE)
+        f.writeframes(pcm.tobytes())
+    return hashlib.sha1(pcm.tobytes()).hexdigest()
+
+
+def _rms(x):
+    return float(np.sqrt(np.mean(x * x))) if len(x) else 0.0
+
+
+def _load_log(path, seconds):
+    if path.lower().endswith('.prg'):
+        with open(path, 'rb') as f:
+            return capture(f.read(), seconds)
+    return read_log(path)
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    options = {'-o': 'music.wav', '--seconds': '30', '--log': None,
+               '--from-log': None, '--compare': None}
+    for flag in list(options):
+        if flag in args:
+            i = args.index(flag)
+            options[flag] = args[i + 1]
+            del args[i:i + 2]
+    seconds = float(options['--seconds'])
+    source = options['--from-log'] or (args[0] if args else 'demo.prg')
+    try:
+        log = read_log(source) if options['--from-log'] else _load_log(source, seconds)
+    except (OSError, ValueError, RuntimeError) as e:
+        print(f"ERROR: {e}")
+        sys.exit(1)
+    if options['--log']:
+        write_log(log, options['--log'])
+
+    mix, voices, clicks = render(log, seconds)
+    digest = write_wav(mix, options['-o'])
+    print(f"=== SID Render ===")
+    print(f"Source: {source}, {len(log)} register writes")
+    print(f"Wrote {options['-o']}: {seconds:g}s at {RATE} Hz, sha1 {digest}")
+    silent = []
+    for voice, out in enumerate(voices):
+        level = _rms(out)
+        print(f"  Voice {voice + 1}: RMS {level:.3f}  peak {np.abs(out).max():.3f}")
+        if level < SILENT_RMS:
+            silent.append(voice + 1)
+    print(f"  Mix: RMS {_rms(mix):.3f}  peak {np.abs(mix).max():.3f}")
+
+    if options['--compare']:
+        try:
+            other = _load_log(options['--compare'], seconds)
+        except (OSError, ValueError, RuntimeError) as e:
+            print(f"ERROR: {e}")
+            sys.exit(1)
+        other_mix, _, _ = render(other, seconds)
+        diff = mix - other_mix
+        print(f"\nCompared with {options['--compare']}: RMS difference {_rms(diff):.4f}")
+        differ = np.flatnonzero(np.abs(diff) > 1e-3)
+        if len(differ):
+            print(f"  First difference at {differ[0] / RATE:.3f}s")
+        else:
+            print(f"  Identical")
+
+    print(f"\n=== Audio Summary ===")
+    for voice in silent:
+        print(f"[WARN] Voice {voice} is silent")
+    for when, what in clicks[:10]:
+        print(f"[WARN] Click at {when:.3f}s: {what}")
+    if len(clicks) > 10:
+        print(f"[WARN] ... {len(clicks) - 10} more clicks")
+    if not silent and not clicks:
+        print(f"[OK] All voices sound, no clicks found")
+    sys.exit(1 if silent or clicks else 0)
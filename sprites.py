@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Sprite frames in VIC-II blocks, animated through the sprite pointer
+
+The VIC-II fetches sprite n from block ($07F8+n) * 64 of its 16K bank, and in
+banks 0 and 2 it sees the character ROM at $1000-$1FFF instead of RAM, so
+sprite data must sit outside that window.  The program keeps the frames
+packed in the PRG and copies them to SPRITE_BASE at init, so the program must
+end below it (check_program_end):
+
+    sprite_frames     unique frames, 64 bytes each (63 + 1 padding)
+    sprite_pointers   block number for every step of the animation
+
+Identical frames share one block.  Mirrored pairs are found and reported, but
+keep both blocks: the VIC-II cannot flip a sprite, so each facing needs its
+own data.  An animation step is then one pointer write at $07F8.
+"""
+
+from asm6502 import AsmError, imm, idx, ref
+
+SPRITE_BASE = 0x2000        # VIC bank 0, above the character ROM image
+SPRITE_POINTER = 0x07F8     # sprite 0 pointer, screen at $0400
+BLOCK = 64
+VIC_BANK = 0x4000
+CHAR_ROM_IMAGE = (0x1000, 0x2000)   # as seen by the VIC-II in banks 0 and 2
+
+
+def mirror(frame):
+    """The frame flipped left to right"""
+    rows = [int.from_bytes(frame[i:i + 3], 'big') for i in range(0, 63, 3)]
+    flipped = [int(f'{row:024b}'[::-1], 2) for row in rows]
+    return b''.join(row.to_bytes(3, 'big') for row in flipped)
+
+
+def dedup_frames(frames):
+    """(unique frames, unique index of every frame, mirrored pairs of unique indices)"""
+    unique, sequence = [], []
+    for frame in frames:
+        frame = bytes(frame)
+        if frame not in unique:
+            unique.append(frame)
+        sequence.append(unique.index(frame))
+    mirrored = [(i, unique.index(mirror(f))) for i, f in enumerate(unique)
+                if mirror(f) != f and mirror(f) in unique[:i]]
+    return unique, sequence, mirrored
+
+
+def check_blocks(base, count):
+    """Raise AsmError unless count blocks at base are sprite data the VIC-II can see"""
+    end = base + count * BLOCK
+    if base % BLOCK:
+        raise AsmError(f'sprite base ${base:04X} is not on a 64-byte block')
+    if base // VIC_BANK != (end - 1) // VIC_BANK:
+        raise AsmError(f'{count} sprite blocks at ${base:04X} run past the VIC bank')
+    offset = base % VIC_BANK
+    rom_lo, rom_hi = CHAR_ROM_IMAGE
+    if base // VIC_BANK in (0, 2) and offset < rom_hi and offset + count * BLOCK > rom_lo:
+        raise AsmError(f'sprite blocks at ${base:04X} overlap the character ROM image')
+
+
+def check_program_end(end, base=SPRITE_BASE):
+    """Raise AsmError if a program ending at end would be overwritten by the sprite copy"""
+    if end > base:
+        raise AsmError(f'program ends at ${end:04X}, past the sprite blocks at ${base:04X}')
+
+
+def emit_sprite_frames(a, frames, base=SPRITE_BASE):
+    """Assemble sprite_frames and sprite_pointers for an animation
+
+    Returns (unique frame count, mirrored pairs).
+    """
+    unique, sequence, mirrored = dedup_frames(frames)
+    check_blocks(base, len(unique))
+    if len(sequence) > 255:
+        raise AsmError(f'{len(sequence)} animation frames, at most 255')
+    a.label('sprite_frames')
+    for frame in unique:
+        a.data(list(frame) + [0] * (BLOCK - len(frame)))
+    a.label('sprite_pointers')
+    a.data(base // BLOCK % (VIC_BANK // BLOCK) + i for i in sequence)
+    return len(unique), mirrored
+
+
+def emit_sprite_copy(a, count, base=SPRITE_BASE):
+    """Assemble the init-time copy of count frames from sprite_frames to base"""
+    size = count * BLOCK
+    for page in range(0, size, 256):
+        chunk = min(256, size - page)
+        a.ldx(imm(0))
+        a.label(f'sprite_copy_{page >> 8}')
+        a.lda(idx(ref('sprite_frames') + page))
+        a.sta(idx(base + page))
+        a.inx()
+        if chunk < 256:
+            a.cpx(imm(chunk))
+        a.bne(f'sprite_copy_{page >> 8}')
+
+
+def emit_animation(a, steps, every, frame_counter, pointer=SPRITE_POINTER):
+    """Assemble one animation step every `every` frames (a power of two)
+
+    steps is the length of sprite_pointers; sprite_anim_step (a byte emitted
+    by emit_animation_state) holds the current step.  Nothing is emitted for
+    a single frame - the pointer set at init stays.
+    """
+    if steps < 2:
+        return
+    if every & (every - 1):
+        raise AsmError(f'animation: every must be a power of two, not {every}')
+    if every > 1:
+        a.lda(frame_counter)
+        a.and_(imm(every - 1))
+        a.bne('sprite_anim_done')
+    a.ldx('sprite_anim_step')
+    a.inx()
+    a.cpx(imm(steps))
+    a.bcc('sprite_anim_next')
+    a.ldx(imm(0))
+    a.label('sprite_anim_next')
+    a.stx('sprite_anim_step')
+    a.lda(idx('sprite_pointers'))
+    a.sta(pointer)
+    a.label('sprite_anim_done')
+
+
+def emit_animation_state(a):
+    a.label('sprite_anim_step')
+    a.byte(0)
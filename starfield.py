@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Parallax starfield speedcode generator
+
+Each layer is a number of stars sharing a speed, character and colour.  Every
+star stays on one screen row, so the generator emits one unrolled block per
+star with the row's screen and colour RAM addresses as absolute operands:
+
+    LDY star_x+i        erase the old star
+    LDA #' '
+    STA row,Y
+    TYA                 move left by speed, wrap to column 39
+    SEC
+    SBC #speed
+    BPL +
+    LDA #39
++   STA star_x+i
+    TAY                 draw the new one
+    LDA #char
+    STA row,Y
+    LDA #colour
+    STA colour_row,Y
+
+Layers that move every 2nd/4th/... frame are skipped on the other frames by
+testing a frame counter.  The worst-case cost (every layer moving, every star
+wrapping) is checked against a cycle budget at build time.
+"""
+
+import random
+from collections import namedtuple
+
+from asm6502 import AsmError, imm, idy, ref
+
+SCREEN = 0x0400
+COLORRAM = 0xD800
+SPACE = 32
+
+# count stars moving `speed` columns every `every` frames (a power of two)
+StarLayer = namedtuple('StarLayer', 'name count speed every char color')
+
+
+def place_stars(layers, rows, seed=1):
+    """Initial (row, column) of every star, per layer - rows are shared out evenly"""
+    rng = random.Random(seed)
+    placed = {}
+    for n, layer in enumerate(layers):
+        stars = []
+        for i in range(layer.count):
+            row = rows[(i * 5 + n * 3) % len(rows)]
+            stars.append((row, rng.randrange(40)))
+        placed[layer.name] = stars
+    return placed
+
+
+def emit_starfield(a, layers, placed, frame_counter, budget=None):
+    """Assemble the starfield update; returns [(layer name, stars, worst-case cycles)]
+
+    frame_counter is a zero page address that changes once per frame.
+    Raises AsmError if the total worst-case cost exceeds budget.
+    """
+    report = []
+    for layer in layers:
+        if layer.every & (layer.every - 1):
+            raise AsmError(f'{layer.name}: every must be a power of two, not {layer.every}')
+        if not 0 < layer.speed < 40:
+            raise AsmError(f'{layer.name}: speed out of range: {layer.speed}')
+        start = len(a.items)
+        if layer.every > 1:
+            a.lda(frame_counter)
+            a.and_(imm(layer.every - 1))
+            a.bne(f'stars_{layer.name}_done')
+        for i, (row, _) in enumerate(placed[layer.name]):
+            star_x = ref(f'star_x_{layer.name}') + i
+            screen = SCREEN + row * 40
+            # Erase old star
+            a.ldy(star_x)
+            a.lda(imm(SPACE))
+            a.sta(idy(screen))
+            # Move left
+            a.tya()
+            a.sec()
+            a.sbc(imm(layer.speed))
+            a.bpl(f'star_{layer.name}_{i}_moved')
+            a.lda(imm(39))  # wrap to the right edge
+            a.label(f'star_{layer.name}_{i}_moved')
+            a.sta(star_x)
+            # Draw new star
+            a.tay()
+            a.lda(imm(layer.char))
+            a.sta(idy(screen))
+            a.lda(imm(layer.color))
+            a.sta(idy(COLORRAM + row * 40))
+        a.label(f'stars_{layer.name}_done')
+        report.append((layer.name, layer.count, a.cost(start)[1]))
+    total = sum(cycles for _, _, cycles in report)
+    if budget is not None and total > budget:
+        raise AsmError(f'starfield needs {total} cycles, budget is {budget}')
+    return report
+
+
+def emit_star_tables(a, layers, placed):
+    """Assemble the star X position tables (star_x_<layer>)"""
+    for layer in layers:
+        a.label(f'star_x_{layer.name}')
+        a.data([col for _, col in placed[layer.name]])
@@ -20,25 +20,36 @@ if [ ! -f "$DEMO" ]; then
     exit 1
 fi
 
-# Build if needed
-if [ "$DEMO" = "demo.prg" ] && [ -f "build_demo.py" ]; then
-    echo "Building demo..."
-    python3 build_demo.py
+if [ "$DEMO" = "demo.prg" ] && [ -f "pipeline.py" ]; then
+    # Build, validate, check the frame budget and master the D64 -
+    # stages whose inputs have not changed are skipped
+    echo "Running build pipeline..."
+    python3 pipeline.py
     echo ""
-fi
+else
+    # Validate PRG structure
+    if [ -f "validate_prg.py" ]; then
+        echo "Validating PRG..."
+        python3 validate_prg.py "$DEMO"
+        echo ""
+    fi
 
-# Validate PRG structure
-if [ -f "validate_prg.py" ]; then
-    echo "Validating PRG..."
-    python3 validate_prg.py "$DEMO"
-    echo ""
+    # Check raster time per frame headlessly
+    if [ -f "emu6502.py" ]; then
+        echo "Checking frame budget..."
+        python3 emu6502.py "$DEMO"
+        echo ""
+    fi
 fi
 
-# Check for VICE
+# Without VICE, render the screenshot headlessly (VICE's 384x272 view)
 if ! command -v x64sc &> /dev/null; then
-    echo "ERROR: VICE emulator (x64sc) not found"
-    echo "Install with: brew install vice"
-    exit 1
+    echo "VICE emulator (x64sc) not found - rendering with render_vic.py"
+    echo "(Install VICE with: brew install vice)"
+    python3 render_vic.py "$DEMO" -o "$SCREENSHOT" --frames $((CYCLES / 19656)) --normal
+    echo ""
+    echo "Test complete!"
+    exit 0
 fi
 
 echo "Running VICE emulator..."
@@ -1,219 +1,627 @@
 #!/usr/bin/env python3
 """
 C64 PRG Validator - Validates PRG file structure without running an emulator
+
+Usage: python3 validate_prg.py [file.prg] [--listing] [--trace [FRAMES]]
+       python3 validate_prg.py --json|--ndjson [--jobs N] [--trace [FRAMES]] PATH ...
+
+The machine code is disassembled by recursive descent from the SYS target:
+branches, JSR/JMP targets and interrupt vectors installed with immediate
+stores (LDA #<irq / STA $0314 ...) are followed to find every reachable
+instruction, which splits the file into code and data and the code into
+basic blocks.  --listing prints the whole file that way.
+
+--trace runs the program on the headless emulator (emu6502.py) for FRAMES
+frames (default 250) and reports its reads and writes per frame by I/O
+register and memory region - screen, colour RAM, sprite pointers, each
+VIC-II, SID and CIA register - including indirect accesses such as
+STA ($F0),Y.
+
+--json / --ndjson validate many files at once - PRGs, D64 images (every PRG
+on them), glob patterns and directories - on a process pool, and print one
+machine-readable report per file plus a summary (one JSON document, or one
+JSON object per line with the summary last).
+
+Exits non-zero if the file (or any of the files) is invalid.
 """
 
+import glob
+import json
+import os
 import sys
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from emu6502 import OPCODE_TABLE, MODE_SIZE
+from asm6502 import OPCODES
+
+# Decode tables indexed by opcode, covering all 256 opcodes
+MNEMONIC = [entry[0] for entry in OPCODE_TABLE]
+MODE = [entry[1] for entry in OPCODE_TABLE]
+SIZE = [MODE_SIZE[mode] for mode in MODE]
+DOCUMENTED = [False] * 256
+for _op in OPCODES.values():
+    DOCUMENTED[_op] = True
 
-# 6502 Opcodes for basic disassembly
-OPCODES = {
-    0x00: ('BRK', 1), 0x01: ('ORA (zp,X)', 2), 0x05: ('ORA zp', 2), 0x06: ('ASL zp', 2),
-    0x08: ('PHP', 1), 0x09: ('ORA #', 2), 0x0A: ('ASL A', 1), 0x0D: ('ORA abs', 3),
-    0x0E: ('ASL abs', 3), 0x10: ('BPL rel', 2), 0x18: ('CLC', 1), 0x19: ('ORA abs,Y', 3),
-    0x1D: ('ORA abs,X', 3), 0x20: ('JSR abs', 3), 0x21: ('AND (zp,X)', 2),
-    0x24: ('BIT zp', 2), 0x25: ('AND zp', 2), 0x26: ('ROL zp', 2), 0x28: ('PLP', 1),
-    0x29: ('AND #', 2), 0x2A: ('ROL A', 1), 0x2C: ('BIT abs', 3), 0x2D: ('AND abs', 3),
-    0x30: ('BMI rel', 2), 0x38: ('SEC', 1), 0x39: ('AND abs,Y', 3), 0x3D: ('AND abs,X', 3),
-    0x40: ('RTI', 1), 0x41: ('EOR (zp,X)', 2), 0x45: ('EOR zp', 2), 0x46: ('LSR zp', 2),
-    0x48: ('PHA', 1), 0x49: ('EOR #', 2), 0x4A: ('LSR A', 1), 0x4C: ('JMP abs', 3),
-    0x4D: ('EOR abs', 3), 0x50: ('BVC rel', 2), 0x58: ('CLI', 1), 0x59: ('EOR abs,Y', 3),
-    0x5D: ('EOR abs,X', 3), 0x60: ('RTS', 1), 0x61: ('ADC (zp,X)', 2), 0x65: ('ADC zp', 2),
-    0x66: ('ROR zp', 2), 0x68: ('PLA', 1), 0x69: ('ADC #', 2), 0x6A: ('ROR A', 1),
-    0x6C: ('JMP (abs)', 3), 0x6D: ('ADC abs', 3), 0x70: ('BVS rel', 2), 0x78: ('SEI', 1),
-    0x79: ('ADC abs,Y', 3), 0x7D: ('ADC abs,X', 3), 0x81: ('STA (zp,X)', 2),
-    0x84: ('STY zp', 2), 0x85: ('STA zp', 2), 0x86: ('STX zp', 2), 0x88: ('DEY', 1),
-    0x8A: ('TXA', 1), 0x8C: ('STY abs', 3), 0x8D: ('STA abs', 3), 0x8E: ('STX abs', 3),
-    0x90: ('BCC rel', 2), 0x91: ('STA (zp),Y', 2), 0x94: ('STY zp,X', 2),
-    0x95: ('STA zp,X', 2), 0x96: ('STX zp,Y', 2), 0x98: ('TYA', 1), 0x99: ('STA abs,Y', 3),
-    0x9A: ('TXS', 1), 0x9D: ('STA abs,X', 3), 0xA0: ('LDY #', 2), 0xA1: ('LDA (zp,X)', 2),
-    0xA2: ('LDX #', 2), 0xA4: ('LDY zp', 2), 0xA5: ('LDA zp', 2), 0xA6: ('LDX zp', 2),
-    0xA8: ('TAY', 1), 0xA9: ('LDA #', 2), 0xAA: ('TAX', 1), 0xAC: ('LDY abs', 3),
-    0xAD: ('LDA abs', 3), 0xAE: ('LDX abs', 3), 0xB0: ('BCS rel', 2), 0xB1: ('LDA (zp),Y', 2),
-    0xB4: ('LDY zp,X', 2), 0xB5: ('LDA zp,X', 2), 0xB6: ('LDX zp,Y', 2), 0xB8: ('CLV', 1),
-    0xB9: ('LDA abs,Y', 3), 0xBA: ('TSX', 1), 0xBC: ('LDY abs,X', 3), 0xBD: ('LDA abs,X', 3),
-    0xBE: ('LDX abs,Y', 3), 0xC0: ('CPY #', 2), 0xC1: ('CMP (zp,X)', 2), 0xC4: ('CPY zp', 2),
-    0xC5: ('CMP zp', 2), 0xC6: ('DEC zp', 2), 0xC8: ('INY', 1), 0xC9: ('CMP #', 2),
-    0xCA: ('DEX', 1), 0xCC: ('CPY abs', 3), 0xCD: ('CMP abs', 3), 0xCE: ('DEC abs', 3),
-    0xD0: ('BNE rel', 2), 0xD1: ('CMP (zp),Y', 2), 0xD5: ('CMP zp,X', 2),
-    0xD6: ('DEC zp,X', 2), 0xD8: ('CLD', 1), 0xD9: ('CMP abs,Y', 3), 0xDD: ('CMP abs,X', 3),
-    0xDE: ('DEC abs,X', 3), 0xE0: ('CPX #', 2), 0xE1: ('SBC (zp,X)', 2), 0xE4: ('CPX zp', 2),
-    0xE5: ('SBC zp', 2), 0xE6: ('INC zp', 2), 0xE8: ('INX', 1), 0xE9: ('SBC #', 2),
-    0xEA: ('NOP', 1), 0xEC: ('CPX abs', 3), 0xED: ('SBC abs', 3), 0xEE: ('INC abs', 3),
-    0xF0: ('BEQ rel', 2), 0xF1: ('SBC (zp),Y', 2), 0xF5: ('SBC zp,X', 2),
-    0xF6: ('INC zp,X', 2), 0xF8: ('SED', 1), 0xF9: ('SBC abs,Y', 3), 0xFD: ('SBC abs,X', 3),
-    0xFE: ('INC abs,X', 3),
+_OPERAND_FORMAT = {
+    'imp': '', 'acc': ' A', 'imm': ' #${:02X}', 'zp': ' ${:02X}', 'zpx': ' ${:02X},X',
+    'zpy': ' ${:02X},Y', 'izx': ' (${:02X},X)', 'izy': ' (${:02X}),Y', 'rel': ' ${:04X}',
+    'abs': ' ${:04X}', 'abx': ' ${:04X},X', 'aby': ' ${:04X},Y', 'ind': ' (${:04X})',
 }
+FORMAT = [MNEMONIC[op] + _OPERAND_FORMAT[MODE[op]] for op in range(256)]
 
-def validate_prg(filename):
-    """Validate a C64 PRG file structure"""
-    print(f"=== C64 PRG Validator ===")
-    print(f"File: {filename}\n")
+# How each opcode passes control on
+NEXT, BRANCH, JUMP, JUMP_IND, CALL, STOP = range(6)
 
-    try:
-        with open(filename, 'rb') as f:
-            data = f.read()
-    except FileNotFoundError:
-        print(f"ERROR: File not found: {filename}")
-        return False
 
+def _flow(mnemonic, mode):
+    if mode == 'rel':
+        return BRANCH
+    if mnemonic == 'JMP':
+        return JUMP_IND if mode == 'ind' else JUMP
+    if mnemonic == 'JSR':
+        return CALL
+    if mnemonic in ('RTS', 'RTI', 'BRK', 'JAM'):
+        return STOP
+    return NEXT
+
+
+FLOW = [_flow(MNEMONIC[op], MODE[op]) for op in range(256)]
+
+# Register tracking for vector set-up: A, X, Y
+_REGS = {'A': 0, 'X': 1, 'Y': 2}
+_WRITES = {
+    'A': {'LDA', 'TXA', 'TYA', 'PLA', 'ADC', 'SBC', 'AND', 'ORA', 'EOR', 'ASL', 'LSR', 'ROL',
+          'ROR', 'LAX', 'ANC', 'ALR', 'ARR', 'ANE', 'LXA', 'LAS', 'SLO', 'RLA', 'SRE', 'RRA',
+          'ISC'},
+    'X': {'LDX', 'TAX', 'TSX', 'INX', 'DEX', 'LAX', 'LXA', 'SBX', 'LAS'},
+    'Y': {'LDY', 'TAY', 'INY', 'DEY'},
+}
+LOAD_IMM = [_REGS[MNEMONIC[op][2]] if MODE[op] == 'imm' and MNEMONIC[op] in ('LDA', 'LDX', 'LDY')
+            else -1 for op in range(256)]
+STORE = [_REGS[MNEMONIC[op][2]] if MODE[op] in ('abs', 'zp') and MNEMONIC[op] in ('STA', 'STX', 'STY')
+         else -1 for op in range(256)]
+
+
+def _clobbers(op):
+    mnemonic = MNEMONIC[op]
+    if mnemonic in ('ASL', 'LSR', 'ROL', 'ROR') and MODE[op] != 'acc':
+        return ()
+    return tuple(_REGS[reg] for reg, ops in _WRITES.items() if mnemonic in ops)
+
+
+CLOBBERS = [_clobbers(op) for op in range(256)]
+
+# Interrupt vectors (address of the low byte) a program may point at its own code
+VECTORS = {0x0314: 'IRQ', 0x0316: 'BRK', 0x0318: 'NMI',
+           0xFFFA: 'NMI', 0xFFFC: 'RESET', 0xFFFE: 'IRQ'}
+_VECTOR_BYTES = set(VECTORS) | {v + 1 for v in VECTORS}
+
+Block = namedtuple('Block', 'start end successors')     # end is exclusive
+Disassembly = namedtuple('Disassembly', 'base image code blocks data vectors indirect external problems')
+
+
+def disassemble(image, base, entries):
+    """Recursive-descent disassembly of image (loaded at base) from entries
+
+    Returns a Disassembly: code maps each reachable instruction's address to
+    its opcode, blocks are the basic blocks in address order, data the
+    (start, end) ranges no code reaches, vectors the (vector, target) pairs
+    found, indirect the addresses of JMP (ind) instructions, external the
+    control-flow targets outside the image and problems a list of strings.
+    """
+    image = bytes(image)
+    end = base + len(image)
+    covered = bytearray(len(image))     # 1 = first byte of an instruction, 2 = operand
+    code = {}
+    leaders = set()
+    external = set()
+    indirect = []
+    vectors = []
+    problems = []
+    work = []
+
+    def target(addr):
+        if base <= addr < end:
+            if addr not in leaders:
+                leaders.add(addr)
+                work.append(addr)
+        else:
+            external.add(addr)
+
+    for addr in entries:
+        target(addr)
+    while work:
+        pc = work.pop()
+        regs = [None, None, None]
+        stored = {}
+        while True:
+            if not base <= pc < end:
+                external.add(pc)
+                break
+            off = pc - base
+            if covered[off]:
+                if covered[off] == 2:
+                    problems.append(f'${pc:04X}: jump into the middle of an instruction')
+                break
+            op = image[off]
+            size = SIZE[op]
+            if off + size > len(image):
+                problems.append(f'${pc:04X}: {MNEMONIC[op]} runs past the end of the file')
+                break
+            if any(covered[off + 1:off + size]):
+                problems.append(f'${pc:04X}: {MNEMONIC[op]} overlaps other code')
+                break
+            covered[off] = 1
+            covered[off + 1:off + size] = b'\2' * (size - 1)
+            code[pc] = op
+            operand = (image[off + 1] if size == 2 else
+                       image[off + 1] | (image[off + 2] << 8) if size == 3 else 0)
+            nxt = pc + size
+            flow = FLOW[op]
+            if flow == NEXT:
+                reg = LOAD_IMM[op]
+                if reg >= 0:
+                    regs[reg] = operand
+                elif STORE[op] >= 0:
+                    if operand in _VECTOR_BYTES:
+                        stored[operand] = regs[STORE[op]]
+                        vector = operand & ~1
+                        lo, hi = stored.get(vector), stored.get(vector + 1)
+                        if lo is not None and hi is not None and (vector, lo | (hi << 8)) not in vectors:
+                            vectors.append((vector, lo | (hi << 8)))
+                            target(lo | (hi << 8))
+                            del stored[vector], stored[vector + 1]
+                else:
+                    for reg in CLOBBERS[op]:
+                        regs[reg] = None
+            elif flow == BRANCH:
+                target((nxt + (operand - 256 if operand & 0x80 else operand)) & 0xFFFF)
+                leaders.add(nxt)
+            elif flow == CALL:
+                target(operand)
+                leaders.add(nxt)
+                regs = [None, None, None]
+            elif flow == JUMP:
+                target(operand)
+                break
+            else:
+                if flow == JUMP_IND:
+                    indirect.append(pc)
+                elif MNEMONIC[op] == 'JAM':
+                    problems.append(f'${pc:04X}: JAM opcode ${op:02X} reached')
+                break
+            pc = nxt
+
+    blocks = []
+    addrs = sorted(code)
+    i = 0
+    while i < len(addrs):
+        start = pc = addrs[i]
+        while True:
+            op = code[pc]
+            nxt = pc + SIZE[op]
+            i += 1
+            if FLOW[op] != NEXT or nxt in leaders or nxt not in code:
+                break
+            pc = nxt
+        flow = FLOW[op]
+        operand = image[pc - base + 1:nxt - base]
+        if flow == BRANCH:
+            o = operand[0]
+            successors = [(nxt + (o - 256 if o & 0x80 else o)) & 0xFFFF, nxt]
+        elif flow in (JUMP, CALL):
+            successors = [operand[0] | (operand[1] << 8)] + ([nxt] if flow == CALL else [])
+        elif flow == NEXT and nxt in code:
+            successors = [nxt]
+        else:
+            successors = []
+        blocks.append(Block(start, nxt, successors))
+
+    data = []
+    off = 0
+    while off < len(image):
+        if covered[off]:
+            off += 1
+            continue
+        start = off
+        while off < len(image) and not covered[off]:
+            off += 1
+        data.append((base + start, base + off))
+    return Disassembly(base, image, code, blocks, data, vectors, indirect, sorted(external), problems)
+
+
+def format_instruction(op, pc, operand):
+    """Assembler text for op at pc with operand bytes"""
+    mode = MODE[op]
+    if mode == 'rel':
+        o = operand[0]
+        return FORMAT[op].format((pc + 2 + (o - 256 if o & 0x80 else o)) & 0xFFFF)
+    if len(operand) == 2:
+        return FORMAT[op].format(operand[0] | (operand[1] << 8))
+    if operand:
+        return FORMAT[op].format(operand[0])
+    return FORMAT[op]
+
+
+def listing(dis):
+    """The whole image as lines: code by basic block, everything else as .byte"""
+    lines = []
+    image, base = dis.image, dis.base
+    names = {target: name for vector, target in dis.vectors for name in [VECTORS[vector]]}
+    blocks = {block.start: block for block in dis.blocks}
+    data = {start: stop for start, stop in dis.data}
+    pc = base
+    end = base + len(image)
+    while pc < end:
+        if pc in data:
+            stop = data[pc]
+            lines.append(f'; data ${pc:04X}-${stop - 1:04X} ({stop - pc} bytes)')
+            for row in range(pc, stop, 16):
+                chunk = image[row - base:min(row + 16, stop) - base]
+                lines.append(f'${row:04X}: .byte ' + ','.join(f'${b:02X}' for b in chunk))
+            pc = stop
+            continue
+        block = blocks[pc]
+        to = ', '.join(f'${s:04X}' for s in block.successors) or 'none'
+        lines.append(f'; block ${pc:04X}' + (f' ({names[pc]} handler)' if pc in names else '')
+                     + f' -> {to}')
+        while pc < block.end:
+            op = dis.code[pc]
+            operand = image[pc - base + 1:pc - base + SIZE[op]]
+            raw = ' '.join(f'{b:02X}' for b in image[pc - base:pc - base + SIZE[op]])
+            note = '' if DOCUMENTED[op] else '    ; undocumented'
+            lines.append(f'${pc:04X}: {raw:<9} {format_instruction(op, pc, operand)}{note}')
+            pc += SIZE[op]
+    return lines
+
+def _load_status(load_addr):
+    if load_addr == 0x0801:
+        return 'OK', 'Standard BASIC start address'
+    if load_addr == 0x0800:
+        return 'OK', 'Alternate BASIC address'
+    if load_addr >= 0xC000:
+        return 'WARN', 'High memory address (cartridge/kernel area)'
+    return 'INFO', 'Non-standard load address'
+
+
+def _range_status(end_addr):
+    if end_addr > 0x9FFF:
+        return 'WARN', 'Extends beyond BASIC RAM'
+    if end_addr > 0x0800 + 38911:
+        return 'WARN', 'Larger than typical BASIC program area'
+    return 'OK', 'Fits in BASIC RAM area'
+
+
+def _stats(values):
+    return {'min': min(values), 'avg': round(sum(values) / len(values), 1), 'max': max(values)}
+
+
+def trace_access(data, frames=250, skip=1):
+    """Run the PRG headlessly and summarise its data accesses per frame
+
+    Returns {'frames', 'regions', 'io_writes', 'vic', 'sid', 'cia'}: regions
+    maps every region that was touched (emu6502.TRACE_REGIONS - screen,
+    colour RAM, sprite pointers, each VIC/SID/CIA register) to min/avg/max
+    reads and writes per frame; io_writes is the same for all chip register
+    writes together.  The first skip frames (set-up) are left out.
+    """
+    import emu6502
+    m = emu6502.run_prg(data, frames, trace=True)
+    per_frame = m.trace_frames[skip:]
+    if not per_frame:
+        raise RuntimeError('program stopped before completing a frame')
+    names = emu6502.TRACE_REGIONS
+    regions = {}
+    for i, name in enumerate(names):
+        reads = [r[i] for r, _ in per_frame]
+        writes = [w[i] for _, w in per_frame]
+        if any(reads) or any(writes):
+            regions[name] = {'reads': _stats(reads), 'writes': _stats(writes)}
+    chips = [i for i, name in enumerate(names) if name.startswith(('VIC', 'SID', 'CIA'))]
+    result = {'frames': len(per_frame), 'regions': regions,
+              'io_writes': _stats([sum(w[i] for i in chips) for _, w in per_frame])}
+    for chip in ('VIC', 'SID', 'CIA'):
+        result[chip.lower()] = any(name.startswith(chip) for name in regions)
+    return result
+
+
+def _analyze(data, trace_frames=0):
+    """(report dict, Disassembly or None) for a PRG's contents"""
+    data = bytes(data)
+    report = {'size': len(data), 'valid': False, 'warnings': []}
+    warnings = report['warnings']
     if len(data) < 10:
-        print("ERROR: File too small to be a valid PRG")
-        return False
+        report['error'] = 'File too small to be a valid PRG'
+        return report, None
 
-    # Check load address
     load_addr = data[0] | (data[1] << 8)
-    print(f"Load address: ${load_addr:04X}")
+    end_addr = load_addr + len(data) - 2
+    report['load_address'] = load_addr
+    report['end_address'] = end_addr
+    level, text = _load_status(load_addr)
+    if level == 'WARN':
+        warnings.append(text)
 
+    # BASIC stub: 10 SYS nnnn
+    sys_str = ""
+    i = 7
+    while i < len(data) and data[i] != 0:
+        sys_str += chr(data[i])
+        i += 1
+    try:
+        sys_addr = int(sys_str)
+    except ValueError:
+        sys_addr = None
+    report['basic'] = None
     if load_addr == 0x0801:
-        print("  [OK] Standard BASIC start address")
-    elif load_addr == 0x0800:
-        print("  [OK] Alternate BASIC address")
-    elif load_addr >= 0xC000:
-        print("  [WARN] High memory address (cartridge/kernel area)")
-    else:
-        print(f"  [INFO] Non-standard load address")
+        report['basic'] = {'next_line': data[2] | (data[3] << 8), 'line': data[4] | (data[5] << 8),
+                           'sys_token': data[6] == 0x9E, 'sys_text': sys_str}
+        if data[6] != 0x9E:
+            warnings.append(f'Expected SYS token (0x9E), got 0x{data[6]:02X}')
+        elif sys_addr is None:
+            warnings.append(f'Could not parse SYS address: {sys_str}')
+    report['sys_address'] = sys_addr
+    entry = load_addr + 13 if sys_addr is None else sys_addr  # default: after the BASIC stub
+    report['entry'] = entry
+
+    level, text = _range_status(end_addr)
+    if level == 'WARN':
+        warnings.append(text)
+
+    dis = disassemble(data[2:], load_addr, [entry])
+    code_bytes = sum(block.end - block.start for block in dis.blocks)
+    vic = sid = cia = False
+    for pc, op in dis.code.items():
+        if SIZE[op] == 3 and FLOW[op] == NEXT:
+            addr = data[pc - load_addr + 3] | (data[pc - load_addr + 4] << 8)
+            vic |= 0xD000 <= addr < 0xD030
+            sid |= 0xD400 <= addr < 0xD419
+            cia |= 0xDC00 <= addr < 0xDE00
+    ops = set(dis.code.values())
+    report.update({
+        'instructions': len(dis.code),
+        'blocks': len(dis.blocks),
+        'code_bytes': code_bytes,
+        'data_bytes': len(data) - 2 - code_bytes,
+        'undocumented': sum(1 for op in dis.code.values() if not DOCUMENTED[op]),
+        'vectors': [{'vector': vector, 'name': VECTORS[vector], 'target': target}
+                    for vector, target in dis.vectors],
+        'indirect_jumps': dis.indirect,
+        'external': dis.external,
+        'io': {'vic': vic, 'sid': sid, 'cia': cia},
+        'sei': 0x78 in ops,
+        'jmp': 0x4C in ops,
+        'problems': dis.problems,
+    })
+    if trace_frames:
+        try:
+            access = trace_access(data, trace_frames)
+            report['access'] = access
+            report['io'] = {chip: access[chip] for chip in ('vic', 'sid', 'cia')}
+        except (RuntimeError, ValueError) as e:
+            report['access'] = {'error': str(e)}
+            warnings.append(f'Trace stopped: {e}')
+    if not dis.code:
+        warnings.append(f'Entry point ${entry:04X} is outside the file')
+    warnings.extend(dis.problems)
+    report['valid'] = bool(dis.code) and not dis.problems
+    return report, dis
+
+
+def analyze_prg(data, trace_frames=0):
+    """Everything validate_prg checks, as a JSON-ready dict
+
+    Addresses are plain integers; 'valid' is False and 'error' set when the
+    data is not a PRG at all, 'warnings' lists the [WARN] lines.  With
+    trace_frames the program is also run (see trace_access) and 'io' comes
+    from the accesses it made instead of the decoded operands.
+    """
+    return _analyze(data, trace_frames)[0]
+
+
+def validate_prg(filename, data=None, listing_lines=False, trace_frames=0):
+    """Validate a C64 PRG file structure
+
+    data, if given, is the PRG's contents (bytes, memoryview...) and filename
+    only names it in the report.  listing_lines prints the full disassembly,
+    trace_frames > 0 runs the program and prints its I/O accesses per frame.
+    """
+    print(f"=== C64 PRG Validator ===")
+    print(f"File: {filename}\n")
+
+    if data is None:
+        try:
+            with open(filename, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            print(f"ERROR: File not found: {filename}")
+            return False
+    report, dis = _analyze(data, trace_frames)
+    if 'error' in report:
+        print(f"ERROR: {report['error']}")
+        return False
+
+    # Check load address
+    load_addr = report['load_address']
+    print(f"Load address: ${load_addr:04X}")
+    level, text = _load_status(load_addr)
+    print(f"  [{level}] {text}")
 
     # Check for BASIC stub
     print(f"\nBASIC Stub Analysis:")
-    if load_addr == 0x0801:
-        # Check BASIC line structure
-        next_line = data[2] | (data[3] << 8)
-        line_num = data[4] | (data[5] << 8)
-        print(f"  Next line ptr: ${next_line:04X}")
-        print(f"  Line number: {line_num}")
-
-        # Check for SYS token (0x9E)
-        if data[6] == 0x9E:
+    basic = report['basic']
+    if basic:
+        print(f"  Next line ptr: ${basic['next_line']:04X}")
+        print(f"  Line number: {basic['line']}")
+        if basic['sys_token']:
             print("  [OK] SYS token found")
-            # Extract SYS address from ASCII digits
-            sys_str = ""
-            i = 7
-            while i < len(data) and data[i] != 0:
-                sys_str += chr(data[i])
-                i += 1
-            try:
-                sys_addr = int(sys_str)
+            sys_addr = report['sys_address']
+            if sys_addr is not None:
                 print(f"  SYS address: {sys_addr} (${sys_addr:04X})")
-
-                # Calculate offset to machine code
-                code_offset = sys_addr - load_addr + 2  # +2 for load address bytes
-                print(f"  Code starts at file offset: {code_offset}")
-            except:
-                print(f"  [WARN] Could not parse SYS address: {sys_str}")
+                print(f"  Code starts at file offset: {sys_addr - load_addr + 2}")
+            else:
+                print(f"  [WARN] Could not parse SYS address: {basic['sys_text']}")
         else:
-            print(f"  [WARN] Expected SYS token (0x9E), got 0x{data[6]:02X}")
+            print(f"  [WARN] Expected SYS token (0x9E), got 0x{bytes(data)[6]:02X}")
 
     # File size analysis
     print(f"\nFile Size:")
-    print(f"  Total: {len(data)} bytes")
-    print(f"  Code/data: {len(data) - 2} bytes (excluding load address)")
+    print(f"  Total: {report['size']} bytes")
+    print(f"  Code/data: {report['size'] - 2} bytes (excluding load address)")
 
     # Memory usage
-    end_addr = load_addr + len(data) - 2
+    end_addr = report['end_address']
     print(f"  Memory range: ${load_addr:04X} - ${end_addr:04X}")
+    level, text = _range_status(end_addr)
+    print(f"  [{level}] {text}")
 
-    if end_addr > 0x9FFF:
-        print("  [WARN] Extends beyond BASIC RAM")
-    elif end_addr > 0x0800 + 38911:
-        print("  [WARN] Larger than typical BASIC program area")
-    else:
-        print("  [OK] Fits in BASIC RAM area")
-
-    # Disassemble first few instructions
-    print(f"\nFirst 20 instructions (from entry point):")
-    print("-" * 50)
+    # Disassembly of everything reachable from the SYS target
+    print(f"\nControl flow (from entry point ${report['entry']:04X}):")
+    print(f"  {report['instructions']} instructions in {report['blocks']} basic blocks, "
+          f"{report['code_bytes']} bytes of code, {report['data_bytes']} bytes of data")
+    for vector in report['vectors']:
+        print(f"  {vector['name']} vector ${vector['vector']:04X} -> ${vector['target']:04X}")
+    if dis.indirect:
+        print("  Indirect jumps at " + ', '.join(f'${pc:04X}' for pc in dis.indirect))
+    if dis.external:
+        print("  Calls/jumps outside the file: " + ', '.join(f'${a:04X}' for a in dis.external))
+    if listing_lines:
+        print()
+        for line in listing(dis):
+            print('  ' + line)
 
-    # Start disassembly from SYS target
-    try:
-        sys_str = ""
-        i = 7
-        while i < len(data) and data[i] != 0:
-            sys_str += chr(data[i])
-            i += 1
-        sys_addr = int(sys_str)
-        code_offset = sys_addr - load_addr + 2
-    except:
-        code_offset = 15  # Default to after BASIC stub
-        sys_addr = load_addr + code_offset - 2
-
-    pc = sys_addr
-    file_pos = code_offset
-    instr_count = 0
-    valid_instructions = 0
-
-    while instr_count < 20 and file_pos < len(data):
-        opcode = data[file_pos]
-
-        if opcode in OPCODES:
-            mnemonic, size = OPCODES[opcode]
-            valid_instructions += 1
-
-            if size == 1:
-                print(f"  ${pc:04X}: {opcode:02X}       {mnemonic}")
-            elif size == 2:
-                if file_pos + 1 < len(data):
-                    operand = data[file_pos + 1]
-                    print(f"  ${pc:04X}: {opcode:02X} {operand:02X}    {mnemonic} ${operand:02X}")
-                else:
-                    print(f"  ${pc:04X}: {opcode:02X}       {mnemonic} ???")
-            elif size == 3:
-                if file_pos + 2 < len(data):
-                    lo = data[file_pos + 1]
-                    hi = data[file_pos + 2]
-                    addr = lo | (hi << 8)
-                    print(f"  ${pc:04X}: {opcode:02X} {lo:02X} {hi:02X} {mnemonic} ${addr:04X}")
-                else:
-                    print(f"  ${pc:04X}: {opcode:02X}       {mnemonic} ???")
-
-            file_pos += size
-            pc += size
-        else:
-            print(f"  ${pc:04X}: {opcode:02X}       ??? (unknown opcode)")
-            file_pos += 1
-            pc += 1
-
-        instr_count += 1
+    access = report.get('access')
+    if access and 'error' not in access:
+        print(f"\nExecution trace ({access['frames']} frames, first frame skipped):")
+        print(f"  {'Region':<28} {'reads/frame':>17}   {'writes/frame':>17}")
+        print(f"  {'':<28} {'min':>5} {'avg':>5} {'max':>5}   {'min':>5} {'avg':>5} {'max':>5}")
+        for name, counts in access['regions'].items():
+            r, w = counts['reads'], counts['writes']
+            print(f"  {name:<28} {r['min']:>5} {r['avg']:>5.0f} {r['max']:>5}"
+                  f"   {w['min']:>5} {w['avg']:>5.0f} {w['max']:>5}")
+        io = access['io_writes']
+        print(f"  I/O register writes/frame: min {io['min']}  avg {io['avg']:.0f}  max {io['max']}")
 
     # Validation summary
     print(f"\n=== Validation Summary ===")
-    valid = True
 
     if load_addr != 0x0801:
         print("[WARN] Non-standard load address")
 
-    if valid_instructions < 15:
-        print(f"[WARN] Only {valid_instructions}/20 valid opcodes in entry code")
-        valid = False
+    if not dis.code:
+        print(f"[WARN] Entry point ${report['entry']:04X} is outside the file")
+    elif dis.problems:
+        for problem in dis.problems:
+            print(f"[WARN] {problem}")
     else:
-        print(f"[OK] {valid_instructions}/20 valid opcodes found")
+        print(f"[OK] {len(dis.code)} reachable instructions decode cleanly")
+    if report['undocumented']:
+        print(f"[INFO] {report['undocumented']} undocumented opcodes in the code")
 
-    # Check for common patterns
-    has_sei = 0x78 in data[code_offset:code_offset+50]
-    has_cli = 0x58 in data[code_offset:code_offset+100]
-    has_jmp = 0x4C in data[code_offset:code_offset+500]
-
-    if has_sei:
+    if report['sei']:
         print("[OK] SEI (disable interrupts) found - typical for demos")
-    if has_jmp:
+    if report['jmp']:
         print("[OK] JMP instruction found - has main loop")
-
-    # Check for VIC-II and SID access
-    vic_access = False
-    sid_access = False
-    for i in range(2, len(data) - 2):
-        if data[i] == 0xD0 and data[i-1] in range(0x00, 0x30):
-            vic_access = True
-        if data[i] == 0xD4 and data[i-1] in range(0x00, 0x19):
-            sid_access = True
-
-    if vic_access:
+    if report['io']['vic']:
         print("[OK] VIC-II ($D0xx) access detected - graphics code present")
-    if sid_access:
+    if report['io']['sid']:
         print("[OK] SID ($D4xx) access detected - sound code present")
+    if access and 'error' in access:
+        print(f"[WARN] Trace stopped: {access['error']}")
 
+    valid = report['valid']
     print(f"\nResult: {'VALID PRG' if valid else 'POSSIBLE ISSUES'}")
     return valid
 
+
+def expand_paths(patterns):
+    """PRG/D64 paths from file names, glob patterns and directories (searched recursively)"""
+    paths = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            for root, dirs, files in os.walk(pattern):
+                dirs.sort()
+                paths += [os.path.join(root, name) for name in sorted(files)
+                          if name.lower().endswith(('.prg', '.d64'))]
+        elif glob.has_magic(pattern):
+            paths += sorted(glob.glob(pattern, recursive=True))
+        else:
+            paths.append(pattern)
+    return paths
+
+
+def check_file(path, trace_frames=0):
+    """Reports for a PRG file, or for every PRG on a D64 image (file is 'image.d64:NAME')"""
+    try:
+        if path.lower().endswith('.d64'):
+            from read_d64 import D64Reader
+            reports = []
+            with D64Reader(path) as disk:
+                for entry in disk.directory():
+                    if entry.file_type & 0x07 == 2:
+                        name = f"{path}:{entry.name.decode('latin-1')}"
+                        try:
+                            reports.append({'file': name, **analyze_prg(disk.read_file(entry), trace_frames)})
+                        except ValueError as e:
+                            reports.append({'file': name, 'valid': False, 'error': str(e),
+                                            'warnings': []})
+            return reports
+        with open(path, 'rb') as f:
+            data = f.read()
+    except (OSError, ValueError) as e:
+        return [{'file': path, 'valid': False, 'error': str(e), 'warnings': []}]
+    return [{'file': path, **analyze_prg(data, trace_frames)}]
+
+
+def validate_batch(paths, jobs=None, trace_frames=0):
+    """check_file() over paths on a process pool; returns (reports, summary)"""
+    check = partial(check_file, trace_frames=trace_frames)
+    if jobs == 1 or len(paths) < 2:
+        results = list(map(check, paths))
+    else:
+        workers = jobs or os.cpu_count() or 1
+        chunk = max(1, len(paths) // (workers * 4))
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(check, paths, chunksize=chunk))
+    reports = [report for result in results for report in result]
+    summary = {
+        'files': len(reports),
+        'valid': sum(1 for r in reports if r['valid']),
+        'invalid': sum(1 for r in reports if not r['valid']),
+        'errors': sum(1 for r in reports if 'error' in r),
+        'warnings': sum(len(r['warnings']) for r in reports),
+        'bytes': sum(r.get('size', 0) for r in reports),
+        'io': {dev: sum(1 for r in reports if r.get('io', {}).get(dev)) for dev in ('vic', 'sid', 'cia')},
+    }
+    return reports, summary
+
+
 if __name__ == '__main__':
-    filename = sys.argv[1] if len(sys.argv) > 1 else 'demo.prg'
-    validate_prg(filename)
+    args = sys.argv[1:]
+    jobs = None
+    if '--jobs' in args:
+        i = args.index('--jobs')
+        jobs = int(args[i + 1])
+        del args[i:i + 2]
+    trace_frames = 0
+    if '--trace' in args:
+        i = args.index('--trace')
+        del args[i]
+        trace_frames = int(args.pop(i)) if i < len(args) and args[i].isdigit() else 250
+    fmt = 'json' if '--json' in args else 'ndjson' if '--ndjson' in args else None
+    args = [arg for arg in args if arg not in ('--listing', '--json', '--ndjson')]
+    if fmt:
+        reports, summary = validate_batch(expand_paths(args or ['demo.prg']), jobs, trace_frames)
+        if fmt == 'json':
+            json.dump({'files': reports, 'summary': summary}, sys.stdout, indent=1)
+            print()
+        else:
+            for report in reports:
+                print(json.dumps(report))
+            print(json.dumps({'summary': summary}))
+        sys.exit(0 if summary['invalid'] == 0 else 1)
+    filename = args[0] if args else 'demo.prg'
+    valid = validate_prg(filename, listing_lines='--listing' in sys.argv, trace_frames=trace_frames)
+    sys.exit(0 if valid else 1)
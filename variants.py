@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Batch builds of personalised demo variants
+
+Usage: python3 variants.py variants.json OUT_DIR [--pack] [--d64] [--jobs N]
+
+variants.json is a list of objects, each with a "name" (letters, digits, - and
+_) and any of:
+
+    scroll_text     the scroller's text
+    crew            first line of the static text, shown as *** CREW ***
+    title           third line (the title below PRESENTS)
+    raster_colors   16 colour numbers for the raster bars
+    sprite          a .spr file or an image / sheet / GIF (see png2sprite.py)
+
+All variant-specific data sits at the end of the program (variant_data in
+build_demo.py).  Each worker process assembles the shared code once; a
+variant then only assembles its data segment and patches the few operands
+that point into it (Assembler.relocate).  A variant that would change the
+code itself - a different number or order of sprite frames, or text on other
+rows (the starfield avoids text rows) - is built in full instead.
+
+Writes OUT_DIR/<name>.prg, with --pack the crunched OUT_DIR/<name>_packed.prg
+and with --d64 OUT_DIR/<name>.d64 (holding the packed PRG if there is one),
+plus OUT_DIR/manifest.json with the sizes and SHA-1 hashes of every file.
+"""
+
+import hashlib
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import build_demo
+from asm6502 import Assembler
+from sprites import check_program_end, dedup_frames
+
+# Which TEXT_LAYOUT records "crew" and "title" replace
+CREW_LINE, TITLE_LINE = 0, 2
+# Config fields that only affect the variant data segment
+VARIANT_FIELDS = ('scroll_text', 'text_layout', 'raster_colors', 'sprite_frames')
+NAME = re.compile(r'^[A-Za-z0-9_-]{1,16}$')
+
+
+def variant_config(spec, base=build_demo.Config(), load_sprite=None):
+    """Config for one variants.json entry"""
+    changes = {}
+    if 'scroll_text' in spec:
+        changes['scroll_text'] = spec['scroll_text']
+    if 'raster_colors' in spec:
+        changes['raster_colors'] = list(spec['raster_colors'])
+    layout = list(base.text_layout)
+    for key, line, fmt in (('crew', CREW_LINE, '*** {} ***'), ('title', TITLE_LINE, '{}')):
+        if key in spec:
+            row, col, color, _ = layout[line]
+            layout[line] = (row, col, color, fmt.format(spec[key]))
+    changes['text_layout'] = layout
+    if 'sprite' in spec:
+        changes['sprite_frames'] = (load_sprite or _load_sprite)(spec['sprite'])
+    return base._replace(**changes)
+
+
+def _load_sprite(path):
+    import png2sprite
+    if path.lower().endswith('.spr'):
+        return png2sprite.read_frames(path)
+    return png2sprite.convert_sheet(path)
+
+
+class Template:
+    """The demo assembled once, ready to take other variant data"""
+
+    def __init__(self, config=build_demo.Config()):
+        self.config = config
+        self.asm, self.code, _ = build_demo.assemble_demo(config)
+        self.split = self.asm.items.index(['label', 'variant_data'])
+        self.start = self.asm.addr('variant_data')
+        self.labels = [item[1] for item in self.asm.items[self.split + 1:] if item[0] == 'label']
+        self.shared = self._shared_fields(config)
+
+    @staticmethod
+    def _shared_fields(config):
+        # Everything the code depends on
+        return (config._replace(**{field: None for field in VARIANT_FIELDS}),
+                dedup_frames(config.sprite_frames)[1],
+                build_demo.star_rows(config.text_layout))
+
+    def compatible(self, config):
+        """True if config only changes data in the variant segment"""
+        return self._shared_fields(config) == self.shared
+
+    def build(self, config):
+        """(PRG bytes, True if patched from the template / False if built in full)"""
+        if not self.compatible(config):
+            return build_demo.build(config), False
+        segment = Assembler(self.start)
+        build_demo.emit_variant_data(segment, config)
+        data = segment.assemble()
+        check_program_end(self.start + len(data))
+        moved = {name: segment.addr(name) for name in self.labels}
+        code = self.asm.relocate(self.code, moved, self.split)
+        return build_demo.PRG_HEADER + bytes(code) + bytes(data), True
+
+
+def _sha1(data):
+    return hashlib.sha1(data).hexdigest()
+
+
+_template = None
+_sprites = {}
+
+
+def _init_worker():
+    global _template
+    _template = Template()
+
+
+def _sprite_frames(path):
+    if path not in _sprites:
+        _sprites[path] = _load_sprite(path)
+    return _sprites[path]
+
+
+def build_variant(spec, out_dir, pack=False, d64=False):
+    """Build one variant into out_dir; returns its manifest entry"""
+    if _template is None:
+        _init_worker()
+    name = spec['name']
+    prg, patched = _template.build(variant_config(spec, load_sprite=_sprite_frames))
+    entry = {'name': name, 'patched': patched, 'files': {}}
+
+    def write(filename, data):
+        with open(os.path.join(out_dir, filename), 'wb') as f:
+            f.write(data)
+        entry['files'][filename] = {'bytes': len(data), 'sha1': _sha1(data)}
+
+    write(f'{name}.prg', prg)
+    disk_prg = prg
+    if pack:
+        import crunch
+        disk_prg = crunch.crunch_prg(prg, build_demo.BASE)
+        write(f'{name}_packed.prg', disk_prg)
+    if d64:
+        from make_d64 import D64Image
+        disk = D64Image(name.upper(), '01')
+        disk.add_file('DEMO', disk_prg)
+        write(f'{name}.d64', bytes(disk.data))
+    return entry
+
+
+def build_variants(specs, out_dir, pack=False, d64=False, jobs=None):
+    """Build every spec on a process pool; returns the manifest entries in order"""
+    names = [spec.get('name', '') for spec in specs]
+    for name in names:
+        if not NAME.match(name):
+            raise ValueError(f'bad variant name: {name!r}')
+    if len(set(names)) != len(names):
+        raise ValueError('variant names must be unique')
+    os.makedirs(out_dir, exist_ok=True)
+    workers = jobs or os.cpu_count() or 1
+    chunk = max(1, len(specs) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        args = [(spec, out_dir, pack, d64) for spec in specs]
+        return list(pool.map(_build_args, args, chunksize=chunk))
+
+
+def _build_args(args):
+    return build_variant(*args)
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    jobs = None
+    if '--jobs' in args:
+        i = args.index('--jobs')
+        jobs = int(args[i + 1])
+        del args[i:i + 2]
+    pack = '--pack' in args
+    d64 = '--d64' in args
+    args = [arg for arg in args if arg not in ('--pack', '--d64')]
+    if len(args) != 2:
+        print(__doc__.strip().splitlines()[2])
+        sys.exit(1)
+    with open(args[0]) as f:
+        specs = json.load(f)
+
+    start = time.perf_counter()
+    try:
+        manifest = build_variants(specs, args[1], pack, d64, jobs)
+    except ValueError as e:
+        print(f"{args[0]}: {e}")
+        sys.exit(1)
+    seconds = time.perf_counter() - start
+    with open(os.path.join(args[1], 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=1)
+    full = sum(1 for entry in manifest if not entry['patched'])
+    print(f"{len(manifest)} variants in {args[1]} ({full} built in full) in {seconds:.1f}s, "
+          f"{len(manifest) / seconds * 60:.0f} per minute")